@@ -0,0 +1,218 @@
+"""
+Offline batch jobs
+
+Usage:
+    python -m app.batch pregenerate [--course ID ...] [--catalog FILE] [--concurrency N] [--force]
+
+`pregenerate` fills the exercise bank with exercises for every lesson of the
+stored courses (or only the given ones) and of an optional catalog file.
+
+A catalog is a JSON object with the `levels` and `topics` to cover, e.g.
+`{"levels": ["A1", "A2"], "topics": ["Im Restaurant", "Reisen"], "dailyStudyHours": 1}`:
+every level/topic pair gets a course, stored like one created by a user (its
+outline is generated once and reused by later runs), and all its lessons are
+pregenerated. A catalog may instead be a JSON list of objects with the
+`/generate-exercises` request fields, for lessons that belong to no course.
+
+Lessons and exercises are generated by one pool of `--concurrency` workers.
+Each result is committed as soon as it is generated and lessons already in
+the bank are skipped, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+import time
+from typing import List, Set, Tuple
+from app.config import settings
+from app.course_generation import generate_outline, lesson_generator
+from app.course_store import course_store
+from app.exercise_bank import exercise_bank, exercise_key
+from app.exercise_generation import generate_exercises
+from app.logging_config import configure_logging
+from app.models import CourseRequest, ExerciseRequest
+from app.scheduler import Priority
+
+
+logger = logging.getLogger(__name__)
+
+# Owner of the courses created for catalog entries
+CATALOG_USER_ID = "catalog"
+
+
+def max_concurrency() -> int:
+    """Generations the CLI can have outstanding before its course queue rejects them with 429"""
+    return settings.max_in_flight + settings.scheduler_course_queue_limit
+
+
+def catalog_course_id(level: str, topic: str) -> str:
+    """Stable course ID of a catalog entry, so later runs reuse its outline"""
+    return "catalog-" + hashlib.sha256(f"{level.upper()}\n{topic}".encode("utf-8")).hexdigest()[:24]
+
+
+def load_catalog(path: str) -> Tuple[List[Tuple[str, str]], List[ExerciseRequest], float]:
+    """
+    Read a catalog file
+    
+    Returns:
+        `(entries, requests, daily_study_hours)`: the level/topic pairs to
+        create courses for and the single lessons of a list catalog
+    """
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    if isinstance(catalog, list):
+        return [], [ExerciseRequest(**entry) for entry in catalog], 1.0
+    if not isinstance(catalog, dict) or not catalog.get("levels") or not catalog.get("topics"):
+        raise ValueError("A catalog needs non-empty `levels` and `topics` lists")
+    entries = [(level, topic) for level in catalog["levels"] for topic in catalog["topics"]]
+    return entries, [], float(catalog.get("dailyStudyHours", 1.0))
+
+
+async def catalog_course(level: str, topic: str, daily_study_hours: float) -> str:
+    """Return the stored course of a catalog entry, generating its outline the first time"""
+    course_id = catalog_course_id(level, topic)
+    if await course_store.get_outline(course_id) is None:
+        outline = await generate_outline(CourseRequest(level=level, dailyStudyHours=daily_study_hours, goals=topic))
+        await course_store.save_course(course_id, CATALOG_USER_ID, outline)
+        logger.info("Created catalog course %s: %s \"%s\"", course_id, level, topic)
+    return course_id
+
+
+def lesson_exercise_request(outline: dict, lesson_index: int, lesson: dict) -> ExerciseRequest:
+    return ExerciseRequest(
+        lessonIndex=lesson_index,
+        lessonTitle=lesson["title"],
+        lessonContent=lesson["content"],
+        vocabulary=lesson["vocabulary"],
+        grammar=lesson["grammar"],
+        level=outline["level"]
+    )
+
+
+class Pregenerator:
+    """Generate missing lessons and their exercises with at most `concurrency` generations at once"""
+    
+    def __init__(self, concurrency: int, force: bool):
+        self.force = force
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._seen: Set[str] = set()
+    
+    async def _exercises(self, request: ExerciseRequest) -> None:
+        lesson_key = exercise_key(request)
+        if lesson_key in self._seen:
+            return
+        self._seen.add(lesson_key)
+        if not self.force and await exercise_bank.existing([lesson_key]):
+            self.skipped += 1
+            return
+        try:
+            async with self._semaphore:
+                exercises = await generate_exercises(request, priority=Priority.COURSE)
+            await exercise_bank.put(request, exercises)
+            self.done += 1
+            logger.info("[%s] %s \"%s\"", self.done + self.failed, request.level, request.lessonTitle)
+        except Exception as e:
+            self.failed += 1
+            logger.error("[%s] Failed %s \"%s\": %s", self.done + self.failed,
+                         request.level, request.lessonTitle, e)
+    
+    async def _lesson(self, course_id: str, outline: dict, lesson_index: int) -> None:
+        try:
+            async with self._semaphore:
+                lesson = await lesson_generator.get_lesson(course_id, lesson_index, priority=Priority.COURSE)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Error generating lesson %s of course %s, skipping: %s", lesson_index, course_id, e)
+            return
+        await self._exercises(lesson_exercise_request(outline, lesson_index, lesson))
+    
+    async def course(self, course_id: str) -> None:
+        """Pregenerate every lesson of a stored course"""
+        outline = await course_store.get_outline(course_id)
+        if outline is None:
+            logger.warning("Course %s not found, skipping", course_id)
+            return
+        await asyncio.gather(*(
+            self._lesson(course_id, outline, lesson_index) for lesson_index in range(len(outline["lessons"]))
+        ))
+    
+    async def catalog_entry(self, level: str, topic: str, daily_study_hours: float) -> None:
+        try:
+            async with self._semaphore:
+                course_id = await catalog_course(level, topic, daily_study_hours)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Error creating the catalog course %s \"%s\", skipping: %s", level, topic, e)
+            return
+        await self.course(course_id)
+    
+    async def lesson(self, request: ExerciseRequest) -> None:
+        await self._exercises(request)
+
+
+async def pregenerate(args: argparse.Namespace) -> int:
+    await course_store.open()
+    await exercise_bank.open()
+    try:
+        entries: List[Tuple[str, str]] = []
+        requests: List[ExerciseRequest] = []
+        daily_study_hours = 1.0
+        if args.catalog:
+            entries, requests, daily_study_hours = load_catalog(args.catalog)
+        course_ids: List[str] = []
+        if args.course or not args.catalog:
+            course_ids = args.course or await course_store.list_course_ids()
+        logger.info("%s courses, %s catalog courses and %s single lessons to pregenerate",
+                    len(course_ids), len(entries), len(requests))
+        
+        pregenerator = Pregenerator(args.concurrency, args.force)
+        started = time.monotonic()
+        await asyncio.gather(
+            *(pregenerator.course(course_id) for course_id in course_ids),
+            *(pregenerator.catalog_entry(level, topic, daily_study_hours) for level, topic in entries),
+            *(pregenerator.lesson(request) for request in requests),
+        )
+        logger.info("Generated %s lessons in %.1fs, %s failed, %s already banked, %s lessons in the bank",
+                    pregenerator.done, time.monotonic() - started, pregenerator.failed, pregenerator.skipped,
+                    await exercise_bank.count())
+        return 1 if pregenerator.failed else 0
+    finally:
+        await exercise_bank.close()
+        await course_store.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.batch", description="Offline batch jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    pregenerate_parser = commands.add_parser("pregenerate", help="Fill the exercise bank")
+    pregenerate_parser.add_argument("--course", action="append", default=[],
+                                    help="Course ID to pregenerate (repeatable, default: all stored courses)")
+    pregenerate_parser.add_argument("--catalog",
+                                    help="JSON file with the levels and topics to cover, or a list of exercise requests")
+    pregenerate_parser.add_argument("--concurrency", type=int, default=settings.max_in_flight,
+                                    help=f"Generations at once (at most {max_concurrency()})")
+    pregenerate_parser.add_argument("--force", action="store_true",
+                                    help="Regenerate lessons that are already in the bank")
+    
+    args = parser.parse_args(argv)
+    if args.command == "pregenerate" and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    configure_logging()
+    if args.command == "pregenerate":
+        if args.concurrency > max_concurrency():
+            # More would be rejected by the scheduler's course queue instead of waiting
+            logger.warning("Limiting --concurrency to %s (SCHEDULER_MAX_IN_FLIGHT + SCHEDULER_COURSE_QUEUE_LIMIT)",
+                           max_concurrency())
+            args.concurrency = max_concurrency()
+        return asyncio.run(pregenerate(args))
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
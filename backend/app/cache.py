@@ -0,0 +1,198 @@
+"""Content-addressed response cache for LLM generations"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.config import settings
+from app.metrics import CACHE_LOOKUPS
+
+
+def make_cache_key(model: str, system_prompt: Optional[str], prompt: str, temperature: float) -> str:
+    """
+    Build a normalized content hash for a generation request
+    
+    Whitespace at line ends and around the prompts is ignored so that
+    cosmetic differences in prompt templates still hit the same entry.
+    """
+    def normalize(text: Optional[str]) -> str:
+        if not text:
+            return ""
+        return "\n".join(line.rstrip() for line in text.strip().splitlines())
+    
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": normalize(system_prompt),
+            "prompt": normalize(prompt),
+            "temperature": round(float(temperature), 3),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU cache with TTL and entry/byte size limits"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._entries[key] = (value, expires_at)
+        self._bytes += size
+        # Evict least recently used entries until we are within limits
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+    
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache tier backed by SQLite, shared across restarts"""
+    
+    def __init__(self, path: str, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+    
+    def set(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-process LRU in front of an optional SQLite store
+    
+    Disk hits are promoted into the memory tier. Disk access runs in a worker
+    thread so lookups never block the event loop.
+    """
+    
+    def __init__(self, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+            CACHE_LOOKUPS.labels("response", "miss").inc()
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.labels("response", "hit").inc()
+        return value
+    
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+    
+    async def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.clear)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.memory),
+        }
+
+
+def bypass_cache(cache_control: Optional[str]) -> bool:
+    """Return True if the client asked to skip the cache via Cache-Control"""
+    if not cache_control:
+        return False
+    directives = {part.strip().lower() for part in cache_control.split(",")}
+    return "no-cache" in directives or "no-store" in directives
+
+
+def cache_enabled_for(endpoint: str) -> bool:
+    """Check whether an endpoint is configured to use the response cache"""
+    return settings.cache_enabled and endpoint in settings.cache_endpoints
+
+
+# Global instance
+response_cache = ResponseCache(
+    memory=MemoryCache(
+        max_entries=settings.cache_max_entries,
+        max_bytes=settings.cache_max_bytes,
+        ttl_seconds=settings.cache_ttl_seconds,
+    ),
+    disk=SQLiteCache(settings.cache_sqlite_path, settings.cache_ttl_seconds)
+    if settings.cache_sqlite_path else None,
+)
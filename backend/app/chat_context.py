@@ -0,0 +1,198 @@
+"""Token-budgeted conversation windows with rolling summaries of older turns"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from typing import Dict, List, Optional, Set, Tuple
+from app.cache import MemoryCache
+from app.config import settings
+from app.langchain_service import langchain_service
+from app.model_routing import Task, model_router
+from app.prompts import estimate_tokens
+from app.scheduler import Priority
+from app.session_store import SessionStore, session_store
+
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_SYSTEM_PROMPT = """You summarize German tutoring conversations. Write a short summary of the conversation so far that lets the tutor continue seamlessly.
+
+Include:
+- Topics, vocabulary and grammar that were practiced
+- Mistakes the student made repeatedly
+- Any preferences or goals the student mentioned
+
+Respond with the summary only, in English, in at most a few sentences."""
+
+
+def _prefix_keys(history: List[Dict[str, str]]) -> List[str]:
+    """Hash every prefix of the history in one pass; keys[i] covers history[:i]"""
+    digest = hashlib.sha256()
+    keys = [digest.hexdigest()]
+    for msg in history:
+        digest.update(json.dumps([msg["role"], msg["content"]], ensure_ascii=False).encode("utf-8"))
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+class ChatContextManager:
+    """
+    Keep per-turn chat prompts at a flat size regardless of session length
+    
+    The most recent messages that fit in `chat_history_token_budget` are sent
+    verbatim. Older messages are replaced by a rolling summary, which is
+    computed in the background after each response and cached by a hash of
+    the messages it covers, so a turn never waits for summarization.
+    
+    Summaries are kept in memory and in the session database, which every
+    worker process reads. Deduplication of summaries being computed is
+    per worker: two workers may occasionally summarize the same prefix.
+    """
+    
+    def __init__(self, token_budget: int, store: Optional[SessionStore] = None):
+        self.token_budget = token_budget
+        self.store = store
+        self._summaries = MemoryCache(max_entries=10_000, max_bytes=32 * 1024 * 1024,
+                                      ttl_seconds=24 * 3600)
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def split(self, history: List[Dict[str, str]]) -> int:
+        """Return the index where the verbatim window starts"""
+        used = 0
+        start = len(history)
+        while start > 0:
+            cost = estimate_tokens(history[start - 1]["content"])
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            start -= 1
+        # Start the window on a user turn so the model sees whole exchanges
+        while start < len(history) and history[start]["role"] != "user":
+            start += 1
+        return start
+    
+    async def _best_summary(self, keys: List[str], end: int) -> Tuple[Optional[str], int]:
+        """Longest cached summary covering history[:n] for some n <= end"""
+        best: Tuple[Optional[str], int] = (None, 0)
+        for n in range(end, 0, -1):
+            summary = self._summaries.get(keys[n])
+            if summary is not None:
+                best = (summary, n)
+                break
+        if self.store is None or best[1] == end:
+            return best
+        # Another worker may have summarized a longer prefix
+        stored = await self.store.get_summaries(keys[best[1] + 1:end + 1])
+        for n in range(end, best[1], -1):
+            if keys[n] in stored:
+                self._summaries.set(keys[n], stored[keys[n]])
+                return stored[keys[n]], n
+        return best
+    
+    async def prepare(self, history: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Split a conversation into a summary of older turns and a recent window
+        
+        Returns:
+            `(summary, window)` where summary is None if nothing was folded
+            or no summary is ready yet
+        """
+        start = self.split(history)
+        if start == 0:
+            return None, history
+        summary, _ = await self._best_summary(_prefix_keys(history), start)
+        return summary, history[start:]
+    
+    def stable_start(self, history: List[Dict[str, str]], current_start: int) -> int:
+        """
+        Window start for sessions that want a byte-stable prompt prefix
+        
+        The window keeps its start until it grows past twice the token budget,
+        then jumps forward to fit the budget again, so the prefix only changes
+        on these occasional compactions instead of every turn.
+        """
+        current_start = min(current_start, len(history))
+        window_tokens = sum(estimate_tokens(msg["content"]) for msg in history[current_start:])
+        if window_tokens <= 2 * self.token_budget:
+            return current_start
+        return max(current_start, self.split(history))
+    
+    async def summary_for(self, history: List[Dict[str, str]], start: int) -> Optional[str]:
+        """Best available summary of the messages before `start`"""
+        if start == 0:
+            return None
+        summary, _ = await self._best_summary(_prefix_keys(history), start)
+        return summary
+    
+    def system_prompt(self, base_prompt: str, summary: Optional[str]) -> str:
+        if not summary:
+            return base_prompt
+        return f"{base_prompt}\nSummary of the earlier conversation:\n{summary}\n"
+    
+    def schedule_summary(self, history: List[Dict[str, str]], window_start: Optional[int] = None) -> None:
+        """
+        Precompute the summary the next turn of this conversation will need
+        
+        Args:
+            history: The conversation including the turn just completed
+            window_start: Current window start of a session using `stable_start`;
+                the summary is then only computed once the window is past
+                1.5 times the budget, i.e. when a compaction is coming up
+        """
+        if window_start is not None:
+            window_tokens = sum(estimate_tokens(msg["content"]) for msg in history[window_start:])
+            if window_tokens <= 1.5 * self.token_budget:
+                return
+        start = self.split(history)
+        if start == 0:
+            return
+        keys = _prefix_keys(history)
+        if self._summaries.get(keys[start]) is not None or keys[start] in self._in_flight:
+            return
+        self._in_flight.add(keys[start])
+        task = asyncio.create_task(self._summarize(history, keys, start))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _summarize(self, history: List[Dict[str, str]], keys: List[str], end: int) -> None:
+        try:
+            # Fold only the messages not covered by an existing summary into it
+            previous, covered = await self._best_summary(keys, end)
+            if covered == end:
+                return  # computed by another worker in the meantime
+            transcript = "\n".join(
+                f"{'Student' if msg['role'] == 'user' else 'Tutor'}: {msg['content']}"
+                for msg in history[covered:end]
+            )
+            prompt = (
+                f"Summary so far:\n{previous}\n\nNew messages:\n{transcript}"
+                if previous else f"Conversation:\n{transcript}"
+            )
+            summary = await langchain_service.agenerate(
+                prompt=prompt,
+                system_prompt=SUMMARY_SYSTEM_PROMPT,
+                priority=Priority.COURSE,
+                route=model_router.route(Task.SUMMARY, message=transcript, history=end)
+            )
+            summary = re.sub(r"<think>.*?</think>", "", summary, flags=re.DOTALL).strip()
+            self._summaries.set(keys[end], summary)
+            if self.store is not None:
+                await self.store.set_summary(keys[end], summary)
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e)
+        finally:
+            self._in_flight.discard(keys[end])
+    
+    async def shutdown(self) -> None:
+        """Cancel pending background summaries"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global instance
+chat_context = ChatContextManager(settings.chat_history_token_budget, session_store)
@@ -0,0 +1,268 @@
+"""Compressed request and response bodies, JSON responses and conditional requests"""
+import asyncio
+import gzip
+import hashlib
+import zlib
+from typing import Any, List, Optional, Tuple
+import orjson
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from app.config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are gzip-compressed only
+    brotli = None
+
+
+# Bodies above this size are (de)compressed in a thread so other requests keep being served
+THREAD_THRESHOLD = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "application/problem+json")
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick `br` or `gzip` from an Accept-Encoding header, None for identity"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    
+    def allowed(encoding: str) -> bool:
+        return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+    
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.compression_brotli_quality)
+    return gzip.compress(body, compresslevel=settings.compression_gzip_level)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class UnsupportedEncoding(Exception):
+    pass
+
+
+def _brotli_decompress(body: bytes, limit: int) -> bytes:
+    """Inflate a brotli body in bounded steps so a decompression bomb stops at `limit`"""
+    decompressor = brotli.Decompressor()
+    if not hasattr(decompressor, "can_accept_more_data"):
+        # brotli < 1.2 cannot bound the output of a single call
+        raise UnsupportedEncoding("br")
+    output = bytearray()
+    data = body
+    while not decompressor.is_finished():
+        if not data and decompressor.can_accept_more_data():
+            raise brotli.error("truncated body")
+        output += decompressor.process(data, output_buffer_limit=limit + 1 - len(output))
+        data = b""
+        if len(output) > limit:
+            raise RequestTooLarge()
+    return bytes(output)
+
+
+def decompress(body: bytes, encoding: str, limit: int) -> bytes:
+    """Decompress a request body, refusing to inflate past `limit` bytes"""
+    if encoding == "br":
+        if brotli is None:
+            raise UnsupportedEncoding(encoding)
+        output = _brotli_decompress(body, limit)
+    elif encoding in ("gzip", "x-gzip", "deflate"):
+        # 32 + MAX_WBITS accepts both gzip and zlib (HTTP deflate) headers
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        output = decompressor.decompress(body, limit + 1)
+        if len(output) <= limit and not decompressor.eof:
+            raise zlib.error("truncated body")
+    else:
+        raise UnsupportedEncoding(encoding)
+    if len(output) > limit:
+        raise RequestTooLarge()
+    return output
+
+
+async def run_sized(function, body: bytes, *args):
+    """Run a (de)compression inline, or in a thread for large bodies"""
+    if len(body) > THREAD_THRESHOLD:
+        return await asyncio.to_thread(function, body, *args)
+    return function(body, *args)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+async def _send_error(send, status: int, detail: str) -> None:
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """
+    Decompress request bodies and compress responses
+    
+    Requests with `Content-Encoding: gzip`, `deflate` or `br` are inflated
+    before they reach the endpoints (up to `max_request_body_bytes`).
+    Complete responses of at least `compression_minimum_size` bytes are
+    compressed with brotli or gzip, whichever the client prefers; streamed
+    responses such as Server-Sent Events pass through unchanged so every event
+    is delivered as soon as it is produced. A strong ETag of a compressed
+    response is turned into a weak one, since the bytes on the wire differ.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+        
+        request_encoding = _header(scope["headers"], b"content-encoding")
+        if request_encoding and request_encoding.strip().lower() != b"identity":
+            scope, receive = await self._decompressed_request(scope, receive, send, request_encoding)
+            if scope is None:
+                return
+        
+        encoding = accepted_encoding((_header(scope["headers"], b"accept-encoding") or b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+                if content_type.startswith(COMPRESSIBLE_TYPES) and _header(headers, b"content-encoding") is None:
+                    start_message = message  # held back until the first body chunk shows whether it is streamed
+                    return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            
+            start, start_message = start_message, None
+            headers = list(start.get("headers", []))
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < settings.compression_minimum_size:
+                await send(start)
+                await send(message)
+                return
+            
+            compressed = await run_sized(compress, body, encoding)
+            vary = _header(headers, b"vary")
+            headers = [
+                (key, value) for key, value in headers
+                if key.lower() not in (b"content-length", b"vary", b"etag")
+            ]
+            etag = _header(start.get("headers", []), b"etag")
+            if etag is not None:
+                headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": headers})
+            await send({**message, "body": compressed})
+        
+        await self.app(scope, receive, send_wrapper)
+    
+    async def _decompressed_request(self, scope, receive, send, encoding: bytes):
+        """Read and inflate the request body; returns `(None, None)` after sending an error response"""
+        limit = settings.max_request_body_bytes
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None, None
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > limit:
+                await _send_error(send, 413, "Request body too large")
+                return None, None
+            if not message.get("more_body", False):
+                break
+        
+        try:
+            body = await run_sized(decompress, b"".join(chunks), encoding.strip().lower().decode("latin-1"), limit)
+        except RequestTooLarge:
+            await _send_error(send, 413, "Request body too large")
+            return None, None
+        except UnsupportedEncoding:
+            await _send_error(send, 415, f"Unsupported Content-Encoding: {encoding.decode('latin-1')}")
+            return None, None
+        except Exception as e:
+            await _send_error(send, 400, f"Invalid compressed request body: {e}")
+            return None, None
+        
+        headers = [
+            (key, value) for key, value in scope["headers"]
+            if key.lower() not in (b"content-encoding", b"content-length")
+        ]
+        headers.append((b"content-length", str(len(body)).encode()))
+        delivered = False
+        
+        async def receive_decompressed():
+            nonlocal delivered
+            if delivered:
+                return await receive()
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        
+        # Updated in place: the router stores the matched route in this scope for the metrics middleware
+        scope["headers"] = headers
+        return scope, receive_decompressed
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def conditional_response(request: Request, content: Any) -> Response:
+    """
+    JSON response with an ETag, or `304 Not Modified` if the client has it already
+    
+    Clients store the response with its ETag and send it back in
+    `If-None-Match`; an unchanged snapshot then costs no body at all.
+    """
+    response = ORJSONResponse(content, headers={"Cache-Control": "no-cache"})
+    etag = make_etag(response.body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    return response
@@ -1,4 +1,5 @@
 """Configuration settings for the backend"""
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -7,11 +8,110 @@ class Settings(BaseSettings):
     
     # Ollama configuration
     ollama_base_url: str = "http://localhost:11434"
+    ollama_base_urls: list[str] = []  # several Ollama nodes; overrides ollama_base_url when set
+    ollama_health_check_interval: float = 15.0  # seconds between backend probes, 0 disables
+    ollama_health_check_timeout: float = 5.0
     ollama_model: str = "qwen3:8b"
+    ollama_temperature: float = 0.7
+    ollama_timeout: float = 600.0  # seconds; long course generations can take minutes
+    ollama_max_connections: int = 100  # size of the shared HTTP connection pool
+    ollama_structured_output: bool = True  # constrain JSON output to the response schemas (Ollama >= 0.5)
+    ollama_keep_alive: str = "30m"  # how long Ollama keeps the model loaded after a request ("-1m" = forever)
+    ollama_embedding_model: str = "nomic-embed-text"  # used by the semantic chat cache
+    ollama_warmup: bool = True  # load the model on every backend at startup before reporting ready
+    
+    # Model routing configuration: named routes and rules choosing one per generation
+    model_routes: dict[str, dict] = {}  # e.g. {"small": {"model": "qwen3:1.7b", "num_predict": 512}}
+    model_routing_rules: list[dict] = [
+        # First matching rule wins; rules naming a route that is not configured are ignored
+        {"task": "chat", "max_message_chars": 300, "max_history": 6, "route": "small"},
+        {"task": "summary", "route": "small"},
+    ]
+    model_routing_allow_override: bool = True  # honour the X-Model-Route request header
+    
+    # Generation scheduler configuration
+    scheduler_max_in_flight: Optional[int] = None  # concurrent generations sent to Ollama; default: per node × nodes
+    scheduler_in_flight_per_node: int = 2  # concurrent generations each Ollama node handles well
+    scheduler_chat_queue_limit: int = 50
+    scheduler_exercise_queue_limit: int = 20
+    scheduler_course_queue_limit: int = 10
+    scheduler_max_wait_seconds: float = 120.0
+    scheduler_slots_path: Optional[str] = None  # SQLite file sharing the in-flight limit between worker processes
+    
+    # Chat context configuration
+    chat_history_token_budget: int = 1500  # recent history sent verbatim; older turns are summarized
+    
+    # Response cache configuration
+    cache_enabled: bool = True
+    cache_endpoints: list[str] = ["create-course", "generate-exercises"]
+    cache_max_entries: int = 1024
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_ttl_seconds: float = 7 * 24 * 3600
+    cache_sqlite_path: Optional[str] = None  # e.g. "cache.db" to persist across restarts
+    
+    # Progress storage configuration
+    progress_db_path: str = "progress.db"
+    progress_batch_size: int = 100  # max updates committed in one transaction
+    progress_flush_interval: float = 0.02  # seconds to wait for more updates before committing
+    
+    # Course storage configuration
+    course_db_path: str = "courses.db"
+    course_prefetch_lessons: bool = True  # generate outline-only course lessons in the background
+    course_generation_mode: str = "fanout"  # "fanout": outline + parallel lessons, "single": one completion
+    course_generation_concurrency: int = 4  # lessons generated at once in fanout mode
+    course_lesson_retries: int = 1  # retries for a single failed lesson
+    course_lesson_busy_max_wait_seconds: float = 300.0  # total wait of a lesson for a busy scheduler before the course fails
+    
+    # Exercise bank configuration (filled by `python -m app.batch pregenerate`)
+    exercise_bank_path: str = "exercises.db"
+    exercise_bank_enabled: bool = True
+    
+    # Batched exercise generation (`/generate-exercises/batch`)
+    exercise_batch_max_lessons: int = 4  # lessons packed into one generation, 1 = one generation per lesson
+    exercise_batch_token_budget: int = 2000  # estimated prompt tokens of one packed generation
+    exercise_batch_request_limit: int = 50  # lessons accepted per request
+    
+    # Semantic chat cache configuration
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.92  # minimum cosine similarity for a hit
+    semantic_cache_max_entries: int = 5000
+    semantic_cache_max_history: int = 2  # only turns with at most this many previous messages are eligible; the history is part of the key
+    semantic_cache_path: Optional[str] = None  # SQLite file sharing cached chat responses between workers
+    
+    # Deterministic chat fast path (lexicon lookups, du -> Sie)
+    fast_path_enabled: bool = True
+    fast_path_min_confidence: float = 0.9  # below this the turn goes to the model
+    fast_path_lexicon_path: Optional[str] = None  # TSV lexicon, defaults to the bundled app/data/lexicon.tsv
+    
+    # Chat session storage configuration
+    session_db_path: str = "sessions.db"
+    session_turn_wait_seconds: float = 30.0  # how long a message waits for the previous turn of its session, then 409
+    session_turn_lease_seconds: float = 300.0  # a turn lease left behind by a crashed worker expires after this
+    
+    # Background job configuration
+    job_workers: int = 2  # jobs running at once; generations still go through the scheduler
+    job_queue_limit: int = 100
+    job_result_ttl_seconds: int = 3600
+    job_busy_max_wait_seconds: float = 600.0  # total wait for a busy scheduler before a job fails
+    job_db_path: Optional[str] = None  # SQLite file so jobs can be polled from any worker process
+    
+    # HTTP compression configuration
+    compression_enabled: bool = True  # gzip/brotli responses, compressed request bodies
+    compression_minimum_size: int = 1024  # smaller responses are sent as they are
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4  # 0-11; higher compresses better but costs far more CPU
+    max_request_body_bytes: int = 10 * 1024 * 1024  # limit for decompressed request bodies
+    
+    # Logging configuration
+    log_level: str = "INFO"
+    log_format: str = "json"  # "json": one object per line for log collectors, "text": human readable
     
     # API configuration
     api_host: str = "0.0.0.0"
     api_port: int = 3000
+    api_workers: int = 0  # worker processes of `python -m app.server`, 0 = one per CPU core
+    shutdown_grace_seconds: float = 30.0  # time to finish in-flight requests and jobs on shutdown
+    metrics_multiproc_dir: Optional[str] = None  # Prometheus multiprocess directory (app.server picks a temp dir)
     cors_origins: list[str] = [
         "http://localhost:5173",
         "http://localhost:3000",
@@ -20,9 +120,21 @@ class Settings(BaseSettings):
         "http://192.168.0.101:5173",
     ]
     
+    @property
+    def ollama_urls(self) -> list[str]:
+        """All configured Ollama backends"""
+        return self.ollama_base_urls or [self.ollama_base_url]
+    
+    @property
+    def max_in_flight(self) -> int:
+        """Concurrent generations sent to Ollama, growing with the number of nodes unless set explicitly"""
+        return self.scheduler_max_in_flight or self.scheduler_in_flight_per_node * len(self.ollama_urls)
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
+        # Allow settings named model_* (model routing); pydantic reserves the prefix by default
+        protected_namespaces = ("settings_",)
 
 
 settings = Settings()
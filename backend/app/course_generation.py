@@ -0,0 +1,260 @@
+"""Outline-first course generation with lazily generated, persisted lessons"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.cache import cache_enabled_for
+from app.config import settings
+from app.course_store import course_store
+from app.langchain_service import langchain_service
+from app.model_routing import Task, model_router
+from app.models import CourseOutlineResponse, CourseRequest, Lesson
+from app.prompts import LESSON_PROMPT, OUTLINE_PROMPT, goals_text
+from app.scheduler import Priority, SchedulerBusyError
+from app.structured_output import json_system_prompt, schema_format
+
+
+logger = logging.getLogger(__name__)
+
+
+OUTLINE_SYSTEM_PROMPT = json_system_prompt(
+    role="You are an expert German language course designer. Plan structured, progressive German language courses.",
+    structure="""Generate course outlines in JSON format with this exact structure:
+{
+  "courseName": "Course name",
+  "level": "A1/A2/B1/B2/C1",
+  "lessons": [
+    {
+      "title": "Lesson title",
+      "summary": "One sentence describing what the lesson covers"
+    }
+  ],
+  "estimatedDuration": "X weeks or Y months"
+}""",
+    guidelines="""Guidelines:
+- Lessons should build on each other with progressive difficulty
+- Cover vocabulary, grammar and practical communication across the course
+- Incorporate user goals if provided"""
+)
+
+LESSON_SYSTEM_PROMPT = json_system_prompt(
+    role="You are an expert German language course designer. Write one complete lesson of a German course.",
+    structure="""Generate the lesson in JSON format with this exact structure:
+{
+  "title": "Lesson title",
+  "content": "Detailed lesson content explaining the topic",
+  "vocabulary": ["word1", "word2", "word3"],
+  "grammar": ["grammar rule 1", "grammar rule 2"],
+  "exercises": ["exercise 1", "exercise 2", "exercise 3"]
+}""",
+    guidelines="""Guidelines:
+- Vocabulary should be relevant to the lesson topic
+- Grammar rules should be clear and applicable
+- Exercises should be practical and varied
+- Match the difficulty to the course level and the lesson's place in the course"""
+)
+
+# JSON schemas for schema-constrained generation (None when disabled)
+OUTLINE_SCHEMA = schema_format(CourseOutlineResponse, exclude=["courseId", "generated"])
+LESSON_SCHEMA = schema_format(Lesson)
+
+
+def lesson_count(daily_study_hours: float) -> int:
+    """Number of lessons for a course; more hours per day = more lessons"""
+    return max(3, min(8, int(daily_study_hours * 2)))
+
+
+def estimated_duration(lessons: int, daily_study_hours: float) -> str:
+    """Fallback course duration when the model does not provide one"""
+    weeks = lessons / (daily_study_hours * 7)
+    return f"{int(weeks)} weeks" if weeks < 12 else f"{int(weeks/4)} months"
+
+
+def build_outline_prompt(request: CourseRequest, lessons: int) -> str:
+    return OUTLINE_PROMPT.format(
+        level=request.level,
+        daily_study_hours=request.dailyStudyHours,
+        lessons=lessons,
+        goals_text=goals_text(request.goals)
+    )
+
+
+def build_lesson_prompt(outline: dict, lesson_index: int) -> str:
+    titles = "\n".join(
+        f"{i + 1}. {lesson['title']}" for i, lesson in enumerate(outline["lessons"])
+    )
+    lesson = outline["lessons"][lesson_index]
+    return LESSON_PROMPT.format(
+        course_name=outline["courseName"],
+        level=outline["level"],
+        titles=titles,
+        lesson_number=lesson_index + 1,
+        lesson_title=lesson["title"],
+        lesson_summary=lesson.get("summary", "")
+    )
+
+
+async def generate_outline(request: CourseRequest, use_cache: bool = False,
+                           refresh_cache: bool = False, model_override: Optional[str] = None) -> dict:
+    """Generate a course outline with lesson titles and summaries"""
+    lessons = lesson_count(request.dailyStudyHours)
+    data = await langchain_service.agenerate_json(
+        prompt=build_outline_prompt(request, lessons),
+        system_prompt=OUTLINE_SYSTEM_PROMPT,
+        schema=OUTLINE_SCHEMA,
+        use_cache=use_cache,
+        refresh_cache=refresh_cache,
+        priority=Priority.COURSE,
+        route=model_router.route(Task.OUTLINE, level=request.level, override=model_override)
+    )
+    if not isinstance(data, dict) or not data.get("lessons"):
+        raise ValueError("Invalid course outline structure")
+    
+    return {
+        "courseName": data.get("courseName", f"German {request.level} Course"),
+        "level": data.get("level", request.level),
+        "estimatedDuration": data.get("estimatedDuration")
+        or estimated_duration(len(data["lessons"]), request.dailyStudyHours),
+        "lessons": [
+            {"title": str(lesson.get("title", f"Lesson {i + 1}")), "summary": str(lesson.get("summary", ""))}
+            if isinstance(lesson, dict) else {"title": str(lesson), "summary": ""}
+            for i, lesson in enumerate(data["lessons"])
+        ],
+    }
+
+
+async def generate_lesson(outline: dict, lesson_index: int, priority: Priority = Priority.COURSE,
+                          use_cache: bool = False, model_override: Optional[str] = None) -> dict:
+    """Generate the full content of one lesson from the course outline"""
+    data = await langchain_service.agenerate_json(
+        prompt=build_lesson_prompt(outline, lesson_index),
+        system_prompt=LESSON_SYSTEM_PROMPT,
+        schema=LESSON_SCHEMA,
+        use_cache=use_cache,
+        priority=priority,
+        route=model_router.route(Task.LESSON, level=outline.get("level"), override=model_override)
+    )
+    if not isinstance(data, dict):
+        raise ValueError("Invalid lesson data structure")
+    data.setdefault("title", outline["lessons"][lesson_index]["title"])
+    return Lesson(**data).model_dump()
+
+
+async def generate_lessons(outline: dict, use_cache: bool = False,
+                           on_lesson: Optional[Callable[[int, dict], Awaitable[None]]] = None,
+                           model_override: Optional[str] = None) -> List[dict]:
+    """
+    Generate all lessons of an outline concurrently
+    
+    At most `course_generation_concurrency` lessons are generated at once.
+    A failed lesson is retried on its own; if it still fails, the remaining
+    lesson generations are cancelled and the error is raised. A lesson
+    rejected by the busy scheduler waits and retries for up to
+    `course_lesson_busy_max_wait_seconds`, since the outline is already paid for.
+    `on_lesson(index, lesson)` is awaited as each lesson completes; its errors
+    are raised, not retried.
+    """
+    semaphore = asyncio.Semaphore(settings.course_generation_concurrency)
+    
+    async def generate_one(lesson_index: int) -> dict:
+        async with semaphore:
+            attempt = 0
+            waited = 0.0
+            while True:
+                try:
+                    lesson = await generate_lesson(
+                        outline, lesson_index, use_cache=use_cache, model_override=model_override
+                    )
+                    break
+                except SchedulerBusyError as e:
+                    if waited + e.retry_after > settings.course_lesson_busy_max_wait_seconds:
+                        raise
+                    logger.info("Lesson %d waiting %ds for a busy scheduler", lesson_index, e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+                    waited += e.retry_after
+                except Exception as e:
+                    if attempt >= settings.course_lesson_retries:
+                        raise
+                    attempt += 1
+                    logger.warning("Retrying lesson %d after error: %s", lesson_index, e)
+        # Outside the retries: a failing callback must not generate the lesson again
+        if on_lesson is not None:
+            await on_lesson(lesson_index, lesson)
+        return lesson
+    
+    tasks = [asyncio.create_task(generate_one(index)) for index in range(len(outline["lessons"]))]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+class LessonGenerator:
+    """
+    Generate lessons of stored courses once, on demand or in the background
+    
+    Concurrent requests for the same lesson (e.g. a user opening a lesson
+    while it is being prefetched) share one in-flight generation. This is per
+    worker process; when two workers generate the same lesson, the first one
+    stored wins and both return it.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._prefetch_tasks: Dict[str, asyncio.Task] = {}
+    
+    async def get_lesson(self, course_id: str, lesson_index: int,
+                         priority: Priority = Priority.EXERCISES) -> Optional[dict]:
+        """Return a stored lesson, generating and storing it first if needed"""
+        lesson = await course_store.get_lesson(course_id, lesson_index)
+        if lesson is not None:
+            return lesson
+        
+        key = (course_id, lesson_index)
+        task = self._in_flight.get(key)
+        if task is None:
+            outline = await course_store.get_outline(course_id)
+            if outline is None or not 0 <= lesson_index < len(outline["lessons"]):
+                return None
+            task = asyncio.create_task(self._generate_and_store(outline, course_id, lesson_index, priority))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield so one caller giving up does not cancel the generation for others
+        return await asyncio.shield(task)
+    
+    async def _generate_and_store(self, outline: dict, course_id: str, lesson_index: int,
+                                  priority: Priority) -> dict:
+        lesson = await generate_lesson(
+            outline, lesson_index, priority, use_cache=cache_enabled_for("create-course")
+        )
+        return await course_store.add_lesson(course_id, lesson_index, lesson)
+    
+    def prefetch(self, course_id: str) -> None:
+        """Generate all lessons of a course in the background, in order"""
+        if course_id not in self._prefetch_tasks:
+            task = asyncio.create_task(self._prefetch(course_id))
+            self._prefetch_tasks[course_id] = task
+            task.add_done_callback(lambda _: self._prefetch_tasks.pop(course_id, None))
+    
+    async def _prefetch(self, course_id: str) -> None:
+        outline = await course_store.get_outline(course_id)
+        if outline is None:
+            return
+        for lesson_index in range(len(outline["lessons"])):
+            try:
+                await self.get_lesson(course_id, lesson_index, priority=Priority.COURSE)
+            except Exception as e:
+                # The lesson is generated again when it is requested
+                logger.warning("Error prefetching lesson %d of course %s: %s", lesson_index, course_id, e)
+    
+    async def shutdown(self) -> None:
+        """Cancel background prefetching"""
+        tasks = list(self._prefetch_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global instance
+lesson_generator = LessonGenerator()
@@ -0,0 +1,111 @@
+"""Persistent storage for generated courses and lessons"""
+import json
+import time
+from typing import List, Optional, Set
+import aiosqlite
+from app.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    outline TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    course_id TEXT NOT NULL,
+    lesson_index INTEGER NOT NULL,
+    lesson TEXT NOT NULL,
+    PRIMARY KEY (course_id, lesson_index)
+);
+"""
+
+
+class CourseStore:
+    """
+    Course outlines and generated lessons in SQLite (WAL mode)
+    
+    The outline holds course name, level, duration and lesson titles; full
+    lessons are stored separately as they are generated so they are never
+    generated twice.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+    
+    async def open(self) -> None:
+        if self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+    
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            await self.open()
+        return self._db
+    
+    async def save_course(self, course_id: str, user_id: str, outline: dict) -> None:
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO courses (course_id, user_id, outline, created_at) VALUES (?, ?, ?, ?)",
+            (course_id, user_id, json.dumps(outline, ensure_ascii=False), time.time()),
+        )
+        await db.commit()
+    
+    async def save_lesson(self, course_id: str, lesson_index: int, lesson: dict) -> None:
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO lessons (course_id, lesson_index, lesson) VALUES (?, ?, ?)",
+            (course_id, lesson_index, json.dumps(lesson, ensure_ascii=False)),
+        )
+        await db.commit()
+    
+    async def add_lesson(self, course_id: str, lesson_index: int, lesson: dict) -> dict:
+        """Store a lesson unless another worker stored it first; returns the stored lesson"""
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR IGNORE INTO lessons (course_id, lesson_index, lesson) VALUES (?, ?, ?)",
+            (course_id, lesson_index, json.dumps(lesson, ensure_ascii=False)),
+        )
+        await db.commit()
+        return await self.get_lesson(course_id, lesson_index) or lesson
+    
+    async def get_outline(self, course_id: str) -> Optional[dict]:
+        db = await self._connection()
+        async with db.execute("SELECT outline FROM courses WHERE course_id = ?", (course_id,)) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    
+    async def get_lesson(self, course_id: str, lesson_index: int) -> Optional[dict]:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT lesson FROM lessons WHERE course_id = ? AND lesson_index = ?",
+            (course_id, lesson_index),
+        ) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    
+    async def lesson_indices(self, course_id: str) -> Set[int]:
+        """Indices of the lessons generated so far, without reading their content"""
+        db = await self._connection()
+        async with db.execute("SELECT lesson_index FROM lessons WHERE course_id = ?", (course_id,)) as cursor:
+            return {row[0] async for row in cursor}
+    
+    async def list_course_ids(self) -> List[str]:
+        db = await self._connection()
+        async with db.execute("SELECT course_id FROM courses ORDER BY created_at") as cursor:
+            return [row[0] async for row in cursor]
+
+
+# Global instance
+course_store = CourseStore(settings.course_db_path)
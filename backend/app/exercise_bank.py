@@ -0,0 +1,112 @@
+"""Precomputed exercises for lessons, served before falling back to live generation"""
+import hashlib
+import json
+import time
+from typing import Iterable, Optional, Set
+import aiosqlite
+from app.config import settings
+from app.models import ExerciseRequest, ExerciseResponse
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exercise_bank (
+    lesson_key TEXT PRIMARY KEY,
+    level TEXT NOT NULL,
+    lesson_title TEXT NOT NULL,
+    exercises TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def exercise_key(request: ExerciseRequest) -> str:
+    """Content hash of the lesson fields the exercises are generated from"""
+    payload = json.dumps(
+        [
+            request.level.strip(),
+            request.lessonIndex,
+            request.lessonTitle.strip(),
+            request.lessonContent.strip(),
+            [word.strip() for word in request.vocabulary],
+            [rule.strip() for rule in request.grammar],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExerciseBank:
+    """
+    Exercises and solutions per lesson in SQLite (WAL mode)
+    
+    Entries are keyed by `exercise_key`, so a lesson is found again from the
+    same fields the `/generate-exercises` request carries. The bank is filled
+    offline by `python -m app.batch pregenerate`.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+    
+    async def open(self) -> None:
+        if self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+    
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            await self.open()
+        return self._db
+    
+    async def get(self, lesson_key: str) -> Optional[ExerciseResponse]:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT exercises FROM exercise_bank WHERE lesson_key = ?", (lesson_key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return ExerciseResponse.model_validate_json(row[0]) if row else None
+    
+    async def put(self, request: ExerciseRequest, exercises: ExerciseResponse) -> None:
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO exercise_bank (lesson_key, level, lesson_title, exercises, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (exercise_key(request), request.level, request.lessonTitle,
+             exercises.model_dump_json(), time.time()),
+        )
+        await db.commit()
+    
+    async def existing(self, lesson_keys: Iterable[str]) -> Set[str]:
+        """Return which of the given keys are already in the bank"""
+        db = await self._connection()
+        found: Set[str] = set()
+        keys = list(lesson_keys)
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            async with db.execute(
+                f"SELECT lesson_key FROM exercise_bank WHERE lesson_key IN ({placeholders})", chunk
+            ) as cursor:
+                async for (lesson_key,) in cursor:
+                    found.add(lesson_key)
+        return found
+    
+    async def count(self) -> int:
+        db = await self._connection()
+        async with db.execute("SELECT COUNT(*) FROM exercise_bank") as cursor:
+            row = await cursor.fetchone()
+        return row[0]
+
+
+# Global instance
+exercise_bank = ExerciseBank(settings.exercise_bank_path)
@@ -0,0 +1,248 @@
+"""Exercise generation for lessons"""
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+from app.config import settings
+from app.langchain_service import langchain_service
+from app.model_routing import Task, model_router
+from app.models import ExerciseBatch, ExerciseRequest, ExerciseResponse
+from app.prompts import EXERCISE_BATCH_LESSON, EXERCISE_BATCH_PROMPT, EXERCISE_PROMPT, estimate_tokens
+from app.scheduler import Priority, SchedulerBusyError
+from app.structured_output import json_system_prompt, schema_format
+
+
+EXERCISE_SYSTEM_PROMPT = json_system_prompt(
+    role="You are an expert German language exercise creator. Generate interactive practice exercises for German lessons.",
+    structure="""Generate exercises in JSON format with this exact structure:
+{
+  "exercises": [
+    "Exercise 1 description",
+    "Exercise 2 description",
+    "Exercise 3 description"
+  ],
+  "solutions": [
+    "Solution 1 (if applicable)",
+    "Solution 2 (if applicable)",
+    "Solution 3 (if applicable)"
+  ]
+}""",
+    guidelines="""Guidelines:
+- Create 3-5 practical exercises per lesson
+- Exercises should be relevant to the lesson content
+- Include vocabulary practice, grammar application, and sentence construction
+- Make exercises progressive in difficulty
+- Solutions should be clear and helpful
+- Exercises should be interactive and engaging"""
+)
+
+EXERCISE_BATCH_SYSTEM_PROMPT = json_system_prompt(
+    role="You are an expert German language exercise creator. Generate interactive practice exercises for German lessons.",
+    structure="""Generate exercises for all lessons in JSON format with this exact structure:
+{
+  "lessons": [
+    {
+      "lessonIndex": 0,
+      "exercises": [
+        "Exercise 1 description",
+        "Exercise 2 description",
+        "Exercise 3 description"
+      ],
+      "solutions": [
+        "Solution 1 (if applicable)",
+        "Solution 2 (if applicable)",
+        "Solution 3 (if applicable)"
+      ]
+    }
+  ]
+}""",
+    guidelines="""Guidelines:
+- Create 3-5 practical exercises per lesson, and one entry for every lesson given
+- Exercises should be relevant to the content of their lesson
+- Include vocabulary practice, grammar application, and sentence construction
+- Make exercises progressive in difficulty
+- Solutions should be clear and helpful
+- Exercises should be interactive and engaging"""
+)
+
+# JSON schema for schema-constrained generation (None when disabled)
+EXERCISE_SCHEMA = schema_format(ExerciseResponse)
+EXERCISE_BATCH_SCHEMA = schema_format(ExerciseBatch)
+
+logger = logging.getLogger(__name__)
+
+
+def build_exercise_prompt(request: ExerciseRequest) -> str:
+    return EXERCISE_PROMPT.format(
+        lesson_number=request.lessonIndex + 1,
+        lesson_title=request.lessonTitle,
+        lesson_content=request.lessonContent,
+        vocabulary=', '.join(request.vocabulary),
+        grammar=', '.join(request.grammar),
+        level=request.level
+    )
+
+
+async def generate_exercises(request: ExerciseRequest, use_cache: bool = False, refresh_cache: bool = False,
+                             priority: Priority = Priority.EXERCISES,
+                             model_override: Optional[str] = None) -> ExerciseResponse:
+    """Generate exercises and solutions for a lesson"""
+    exercise_data = await langchain_service.agenerate_json(
+        prompt=build_exercise_prompt(request),
+        system_prompt=EXERCISE_SYSTEM_PROMPT,
+        schema=EXERCISE_SCHEMA,
+        use_cache=use_cache,
+        refresh_cache=refresh_cache,
+        priority=priority,
+        route=model_router.route(Task.EXERCISES, level=request.level, override=model_override)
+    )
+    
+    if not isinstance(exercise_data, dict):
+        raise ValueError("Invalid exercise data structure")
+    
+    return ExerciseResponse(
+        exercises=exercise_data.get("exercises", []),
+        solutions=exercise_data.get("solutions", [])
+    )
+
+
+def build_batch_prompt(requests: List[ExerciseRequest]) -> str:
+    lessons = "\n\n".join(
+        EXERCISE_BATCH_LESSON.format(
+            lesson_number=request.lessonIndex + 1,
+            lesson_index=request.lessonIndex,
+            lesson_title=request.lessonTitle,
+            lesson_content=request.lessonContent,
+            vocabulary=', '.join(request.vocabulary),
+            grammar=', '.join(request.grammar),
+            level=request.level
+        )
+        for request in requests
+    )
+    return EXERCISE_BATCH_PROMPT.format(count=len(requests), lessons=lessons)
+
+
+def pack_requests(requests: List[ExerciseRequest], max_lessons: int, token_budget: int) -> List[List[int]]:
+    """
+    Group lessons into packed generations
+    
+    Args:
+        requests: Lessons to generate exercises for
+        max_lessons: Maximum lessons per group
+        token_budget: Maximum estimated prompt tokens of the lessons in a group;
+            a lesson over the budget gets a group of its own
+    
+    Returns:
+        Groups of positions in `requests`, in order
+    """
+    groups: List[List[int]] = []
+    group_tokens = 0
+    for position, request in enumerate(requests):
+        tokens = estimate_tokens(build_exercise_prompt(request))
+        if not groups or len(groups[-1]) >= max_lessons or group_tokens + tokens > token_budget:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(position)
+        group_tokens += tokens
+    return groups
+
+
+async def generate_exercise_group(requests: List[ExerciseRequest], use_cache: bool = False,
+                                  refresh_cache: bool = False,
+                                  model_override: Optional[str] = None) -> List[Optional[ExerciseResponse]]:
+    """
+    Generate exercises for several lessons in one completion
+    
+    Returns:
+        Exercises per request, None where the model left a lesson out
+    """
+    data = await langchain_service.agenerate_json(
+        prompt=build_batch_prompt(requests),
+        system_prompt=EXERCISE_BATCH_SYSTEM_PROMPT,
+        schema=EXERCISE_BATCH_SCHEMA,
+        use_cache=use_cache,
+        refresh_cache=refresh_cache,
+        priority=Priority.EXERCISES,
+        route=model_router.route(Task.EXERCISES, level=requests[0].level, override=model_override)
+    )
+    lessons = data.get("lessons") if isinstance(data, dict) else None
+    entries = [entry for entry in lessons if isinstance(entry, dict)] if isinstance(lessons, list) else []
+    
+    # Match entries by lessonIndex; fall back to their order if the indices are not usable
+    indices = [request.lessonIndex for request in requests]
+    by_index = {entry.get("lessonIndex"): entry for entry in entries}
+    if len(set(indices)) == len(indices) and any(index in by_index for index in indices):
+        matched = [by_index.get(index) for index in indices]
+    else:
+        matched = entries[:len(requests)] + [None] * (len(requests) - len(entries))
+    
+    results: List[Optional[ExerciseResponse]] = []
+    for entry in matched:
+        if entry and isinstance(entry.get("exercises"), list) and entry["exercises"]:
+            results.append(ExerciseResponse(exercises=entry["exercises"], solutions=entry.get("solutions") or []))
+        else:
+            results.append(None)
+    return results
+
+
+async def generate_exercises_batch(
+    requests: List[ExerciseRequest], use_cache: bool = False, refresh_cache: bool = False,
+    model_override: Optional[str] = None
+) -> AsyncIterator[Tuple[int, Optional[ExerciseResponse], Optional[Exception]]]:
+    """
+    Generate exercises for many lessons, yielding each lesson as it completes
+    
+    Lessons are packed into as few generations as `exercise_batch_max_lessons`
+    and `exercise_batch_token_budget` allow, so the system prompt is processed
+    once per group instead of once per lesson. Groups run concurrently under
+    the scheduler. Lessons a packed generation leaves out, or all lessons of a
+    failed one, are generated again on their own.
+    
+    Yields:
+        `(position, exercises, error)` per request, in completion order
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def generate_single(position: int) -> None:
+        try:
+            exercises = await generate_exercises(
+                requests[position], use_cache=use_cache, refresh_cache=refresh_cache, model_override=model_override
+            )
+            await results.put((position, exercises, None))
+        except Exception as e:
+            await results.put((position, None, e))
+    
+    async def generate_group(positions: List[int]) -> None:
+        if len(positions) == 1:
+            await generate_single(positions[0])
+            return
+        try:
+            group = await generate_exercise_group(
+                [requests[position] for position in positions],
+                use_cache=use_cache, refresh_cache=refresh_cache, model_override=model_override
+            )
+        except SchedulerBusyError as e:
+            for position in positions:
+                await results.put((position, None, e))
+            return
+        except Exception as e:
+            logger.warning("Packed exercise generation for %d lessons failed: %s", len(positions), e)
+            group = [None] * len(positions)
+        missing = []
+        for position, exercises in zip(positions, group):
+            if exercises is None:
+                missing.append(position)
+            else:
+                await results.put((position, exercises, None))
+        if missing:
+            logger.info("Generating %d lessons left out of a packed generation on their own", len(missing))
+            await asyncio.gather(*(generate_single(position) for position in missing))
+    
+    groups = pack_requests(requests, max(settings.exercise_batch_max_lessons, 1), settings.exercise_batch_token_budget)
+    tasks = [asyncio.create_task(generate_group(positions)) for positions in groups]
+    try:
+        for _ in range(len(requests)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,388 @@
+"""Deterministic answers for word lookups and du/Sie conversions, without the model"""
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.metrics import FAST_PATH_RESULTS
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "data", "lexicon.tsv")
+
+QUOTES = "\"'“”„‚‘’«»"
+
+# Explicit lookups, matched against the whole message without trailing punctuation
+ENGLISH_LOOKUPS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"how (?:do|would|can|should) (?:you|i|we|one) say (?P<q>.+?)(?: in german)?",
+        r"what(?:'s| is| are) (?:the )?german (?:word |term )?for (?P<q>.+)",
+        r"what(?:'s| is) (?P<q>.+?) in german",
+        r"(?:translate|german for)[:\s]+(?P<q>.+?)(?: (?:in|into|to) german)?",
+        r"(?P<q>.+?) in german",
+        r"wie sagt man (?P<q>.+?) auf deutsch",
+        r"was (?:heißt|ist) (?P<q>.+?) auf deutsch",
+    )
+]
+GERMAN_LOOKUPS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r"was (?:heißt|bedeutet|ist) (?P<q>.+?)(?: auf englisch)?",
+        r"what does (?P<q>.+?) mean(?: in english)?",
+        r"what(?:'s| is) (?P<q>.+?) in english",
+        r"(?P<q>.+?) auf englisch",
+    )
+]
+FORMAL_REQUEST = re.compile(
+    r"\b(?:formal|formally|polite|politely|sie[- ]?form|siezen|formell|förmlich|höflich)\b", re.IGNORECASE
+)
+FORMAL_QUESTION = re.compile(
+    r"how (?:do|would|can) (?:you|i) say (?P<q>.+?) (?:formally|politely|in the sie[- ]form|with sie)"
+    r"|wie sagt man (?P<q2>.+?) (?:formell|förmlich|höflich|in der sie-form|mit sie)",
+    re.IGNORECASE,
+)
+BARE_QUERY = re.compile(r"[a-z][a-z' -]{0,40}", re.IGNORECASE)
+# Single-word messages that start a conversation rather than ask for a translation
+CONVERSATIONAL = {
+    "hi", "hello", "hey", "yes", "no", "ok", "okay", "thanks", "thank you", "please", "sorry", "bye", "goodbye", "help",
+}
+
+# du -> Sie
+FORMAL_PRONOUNS = {
+    "du": "Sie", "dich": "Sie", "dir": "Ihnen",
+    "dein": "Ihr", "deine": "Ihre", "deinen": "Ihren", "deinem": "Ihrem", "deiner": "Ihrer", "deines": "Ihres",
+}
+REFLEXIVE_PRONOUNS = {"dich": "sich", "dir": "sich"}
+IRREGULAR_DU_FORMS = {
+    "bist": "sind", "hast": "haben", "wirst": "werden", "weißt": "wissen", "tust": "tun",
+    "kannst": "können", "musst": "müssen", "darfst": "dürfen", "sollst": "sollen", "willst": "wollen",
+    "magst": "mögen", "isst": "essen", "liest": "lesen", "siehst": "sehen", "sprichst": "sprechen",
+    "gibst": "geben", "nimmst": "nehmen", "hilfst": "helfen", "fährst": "fahren", "läufst": "laufen",
+    "schläfst": "schlafen", "triffst": "treffen", "vergisst": "vergessen", "hältst": "halten",
+    "trägst": "tragen", "wäschst": "waschen", "lässt": "lassen", "verlässt": "verlassen", "wirfst": "werfen",
+    "brichst": "brechen", "empfiehlst": "empfehlen", "fängst": "fangen", "fällst": "fallen",
+    "gefällst": "gefallen", "erhältst": "erhalten", "reist": "reisen", "stirbst": "sterben",
+}
+# Words ending like a du-form that are not verbs
+NOT_VERBS = {
+    "fast", "erst", "sonst", "selbst", "meist", "meistens", "jetzt", "zuerst", "zuletzt", "best", "längst",
+    "umsonst", "fest", "mist", "angst", "lust", "post", "herbst", "dienst", "kunst", "gast", "rest",
+}
+DU_VERB = re.compile(r"[a-zäöüß]{2,}(?:st|ßt|zt|xt)")
+TOKEN = re.compile(r"\w+|[^\w\s]+|\s+")
+CLAUSE_END = re.compile(r"[,;:.!?()\"“”„–-]")
+SENTENCE_END = re.compile(r"[.!?]")
+SUBJECT_PRONOUNS = {"ich", "du", "er", "sie", "es", "wir", "ihr", "man", "das", "dies", "wer", "was", "jemand", "niemand"}
+
+
+@dataclass(frozen=True)
+class LexiconEntry:
+    english: str
+    german: str
+    plural: str
+    example: str
+
+
+@dataclass(frozen=True)
+class FastPathAnswer:
+    response: str
+    kind: str  # "lookup" or "formality"
+    confidence: float
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip quotes and punctuation around the text, collapse whitespace"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.strip(QUOTES + "?!.,;: ")
+
+
+class Lexicon:
+    """
+    Bilingual word and phrase index loaded from a tab-separated file
+    
+    English alternatives (`hello|hi`) and German variants
+    (`der Freund / die Freundin`) each get their own key; German keys are
+    indexed with and without the article.
+    """
+    
+    def __init__(self, path: str):
+        self.english: Dict[str, List[LexiconEntry]] = {}
+        self.german: Dict[str, List[LexiconEntry]] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                columns = (line.rstrip("\n").split("\t") + ["", "", ""])[:4]
+                english, german, plural, example = (column.strip() for column in columns)
+                alternatives = [normalize(word) for word in english.split("|")]
+                entry = LexiconEntry(english.split("|")[0], german, plural, example)
+                for key in alternatives:
+                    self.english.setdefault(key, []).append(entry)
+                for variant in german.split(" / "):
+                    key = normalize(variant)
+                    for german_key in {key, re.sub(r"^(?:der|die|das) ", "", key)}:
+                        entries = self.german.setdefault(german_key, [])
+                        if entry not in entries:
+                            entries.append(entry)
+    
+    @staticmethod
+    def _variants(query: str) -> List[str]:
+        """Query spellings that still mean the same word: without article or `to`"""
+        variants = []
+        stripped = re.sub(r"^(?:the|a|an) ", "", query)
+        if stripped != query:
+            variants.append(stripped)
+        variants.append(query[3:] if query.startswith("to ") else f"to {query}")
+        return variants
+    
+    def lookup_english(self, query: str) -> Tuple[List[LexiconEntry], float]:
+        """Return matching entries and the match confidence (1.0 exact, 0.95 variant)"""
+        query = normalize(query)
+        if query in self.english:
+            return self.english[query], 1.0
+        for variant in self._variants(query):
+            if variant in self.english:
+                return self.english[variant], 0.95
+        return [], 0.0
+    
+    def lookup_german(self, query: str) -> Tuple[List[LexiconEntry], float]:
+        query = normalize(query)
+        if query in self.german:
+            return self.german[query], 1.0
+        return [], 0.0
+
+
+def du_form_to_infinitive(verb: str) -> Optional[str]:
+    """Derive the Sie-form (= infinitive) from a present tense du-form"""
+    word = verb.lower()
+    if word in IRREGULAR_DU_FORMS:
+        return IRREGULAR_DU_FORMS[word]
+    if word.endswith("est") and len(word) > 4 and (
+        word[-4] in "td" or (word[-4] in "mn" and word[-5] not in "aeiouäöülrhmn")
+    ):
+        stem = word[:-3]  # arbeitest, findest, öffnest
+    elif word.endswith("sst"):
+        stem = word[:-1]  # passt, küsst
+    elif word.endswith("st"):
+        stem = word[:-2]  # machst, lernst
+    elif word.endswith(("ßt", "zt", "xt")):
+        stem = word[:-1]  # heißt, tanzt
+    else:
+        return None
+    if stem.endswith("ier"):
+        return stem + "en"  # studierst
+    if stem.endswith(("el", "er")):
+        return stem + "n"  # sammelst, wanderst
+    return stem + "en"
+
+
+def _match_case(word: str, like: str) -> str:
+    return word[:1].upper() + word[1:] if like[:1].isupper() else word
+
+
+def to_formal(text: str) -> Tuple[Optional[str], List[Tuple[str, str]], float]:
+    """
+    Rewrite a German text from du to Sie
+    
+    Returns:
+        `(text, changes, confidence)`: the rewritten text (None if it has no
+        du-forms), the `(old, new)` word pairs, and 1.0 if every `du` got its
+        verb converted, less if a verb could not be identified
+    """
+    if re.search(r"\b(?:euch|euer|eure[mnrs]?)\b", text, re.IGNORECASE):
+        return None, [], 0.0  # plural "ihr" is out of scope
+    
+    tokens = TOKEN.findall(text)
+    words = [i for i, token in enumerate(tokens) if token[0].isalpha()]
+    sentence_starts = set()
+    clauses: List[List[int]] = [[]]
+    at_start = True
+    for i, token in enumerate(tokens):
+        if token[0].isalpha():
+            if at_start:
+                sentence_starts.add(i)
+                at_start = False
+            clauses[-1].append(i)
+        elif CLAUSE_END.search(token):
+            clauses.append([])
+            if SENTENCE_END.search(token):
+                at_start = True
+    
+    def is_du_verb(i: int) -> bool:
+        token = tokens[i]
+        word = token.lower()
+        if token[:1].isupper() and i not in sentence_starts:
+            return False  # nouns like "Lust", "Angst"
+        return word in IRREGULAR_DU_FORMS or (DU_VERB.fullmatch(word) is not None and word not in NOT_VERBS)
+    
+    if not any(tokens[i].lower() in FORMAL_PRONOUNS for i in words):
+        return None, [], 0.0
+    
+    replacements: Dict[int, str] = {}
+    confidence = 1.0
+    for clause in clauses:
+        if len(clause) >= 2 and not any(
+            tokens[i].lower() in SUBJECT_PRONOUNS or (tokens[i][:1].isupper() and i != clause[0]) for i in clause
+        ):
+            confidence = min(confidence, 0.5)  # no subject: probably a du-imperative ("ruf mich an")
+        subjects = [i for i in clause if tokens[i].lower() == "du"]
+        for i in clause:
+            word = tokens[i].lower()
+            if word in FORMAL_PRONOUNS:
+                new = REFLEXIVE_PRONOUNS.get(word) if subjects and word != "du" else None
+                replacements[i] = new or FORMAL_PRONOUNS[word]
+        for subject in subjects:
+            position = clause.index(subject)
+            candidates = []
+            if position > 0:
+                candidates.append(clause[position - 1])  # Kannst du ...
+            if position + 1 < len(clause):
+                candidates.append(clause[position + 1])  # du kannst ...
+            candidates.append(clause[-1])  # ..., wenn du Zeit hast
+            verb = next((i for i in candidates if i not in replacements and is_du_verb(i)), None)
+            if verb is None:
+                # "Und du?" needs no verb; anything longer probably has one we did not recognize
+                confidence = min(confidence, 0.95 if len(clause) <= 2 else 0.5)
+                continue
+            infinitive = du_form_to_infinitive(tokens[verb])
+            if infinitive is None:
+                confidence = min(confidence, 0.5)
+                continue
+            replacements[verb] = _match_case(infinitive, tokens[verb])
+    
+    changes: List[Tuple[str, str]] = []
+    for i, new in sorted(replacements.items()):
+        if (tokens[i], new) not in changes:
+            changes.append((tokens[i], new))
+        tokens[i] = new
+    return "".join(tokens), changes, confidence
+
+
+def format_lookup(entries: List[LexiconEntry], query: str, language: str, german_to_english: bool) -> str:
+    """Answer a lookup in the tutor's style; German explanations in de-en mode"""
+    query = normalize(query)
+    lines = []
+    if language == "en-de":
+        if german_to_english:
+            meanings = ", ".join(f"**{entry.english}**" for entry in entries)
+            lines.append(f"**{entries[0].german}** means {meanings} in English.")
+        elif len(entries) == 1:
+            lines.append(f"**{query}** in German is **{entries[0].german}**.")
+        else:
+            lines.append(f"**{query}** can be translated as:")
+            lines.extend(f"- **{entry.german}**" for entry in entries)
+        for entry in entries[:2]:
+            if entry.plural:
+                lines.append(f"Plural: {entry.plural}")
+            if entry.example:
+                lines.append(f"Example: *{entry.example}*")
+    else:
+        if german_to_english:
+            meanings = ", ".join(f"**{entry.english}**" for entry in entries)
+            lines.append(f"**{entries[0].german}** heißt auf Englisch {meanings}.")
+        elif len(entries) == 1:
+            lines.append(f"**{query}** heißt auf Deutsch **{entries[0].german}**.")
+        else:
+            lines.append(f"**{query}** kann man so übersetzen:")
+            lines.extend(f"- **{entry.german}**" for entry in entries)
+        for entry in entries[:2]:
+            if entry.plural:
+                lines.append(f"Plural: {entry.plural}")
+            if entry.example:
+                lines.append(f"Beispiel: *{entry.example}*")
+    return "\n\n".join(lines)
+
+
+def format_formal(text: str, changes: List[Tuple[str, str]], language: str) -> str:
+    changed = ", ".join(f"{old} → {new}" for old, new in changes)
+    if language == "en-de":
+        return (f"Formal (Sie) version:\n\n**{text}**\n\nChanges: {changed}. With *Sie* the verb takes "
+                "the same form as the infinitive.")
+    return f"In der Sie-Form:\n\n**{text}**\n\nÄnderungen: {changed}. Mit *Sie* steht das Verb im Infinitiv."
+
+
+class FastPath:
+    """
+    Answer trivial chat turns without the model
+    
+    Handles explicit word lookups ("How do you say dog in German?", "Was heißt
+    Hund?"), single words in `en-de` mode without history, and du → Sie
+    conversions ("Make this formal: Kannst du mir helfen?"). Each answer has a
+    confidence; below `min_confidence` the turn goes to the model as usual.
+    """
+    
+    def __init__(self, lexicon_path: str, min_confidence: float):
+        self.lexicon_path = lexicon_path
+        self.min_confidence = min_confidence
+        self._lexicon: Optional[Lexicon] = None
+    
+    @property
+    def lexicon(self) -> Lexicon:
+        if self._lexicon is None:
+            self._lexicon = Lexicon(self.lexicon_path)
+        return self._lexicon
+    
+    def _formality(self, message: str, language: str) -> Optional[FastPathAnswer]:
+        text = None
+        match = FORMAL_QUESTION.fullmatch(message.strip().rstrip("?!. "))
+        if match:
+            text = match.group("q") or match.group("q2")
+        elif ":" in message:
+            request, _, rest = message.partition(":")
+            if FORMAL_REQUEST.search(request) and len(request) < 80:
+                text = rest
+        if not text or not text.strip(QUOTES + " "):
+            return None
+        formal, changes, confidence = to_formal(text.strip().strip(QUOTES).strip())
+        if formal is None:
+            return None
+        return FastPathAnswer(format_formal(formal, changes, language), "formality", confidence)
+    
+    def _lookup(self, message: str, language: str, history_length: int) -> Optional[FastPathAnswer]:
+        message = message.strip().rstrip("?!. ")
+        for pattern in ENGLISH_LOOKUPS:
+            match = pattern.fullmatch(message)
+            if match:
+                entries, confidence = self.lexicon.lookup_english(match.group("q"))
+                if entries:
+                    return FastPathAnswer(format_lookup(entries, match.group("q"), language, False),
+                                          "lookup", confidence)
+        for pattern in GERMAN_LOOKUPS:
+            match = pattern.fullmatch(message)
+            if match:
+                entries, confidence = self.lexicon.lookup_german(match.group("q"))
+                if entries:
+                    return FastPathAnswer(format_lookup(entries, match.group("q"), language, True),
+                                          "lookup", confidence)
+        # A bare word is only a lookup at the start of a conversation; later it may answer the tutor
+        bare = BARE_QUERY.fullmatch(message) and normalize(message) not in CONVERSATIONAL
+        if language == "en-de" and history_length == 0 and bare:
+            entries, confidence = self.lexicon.lookup_english(message)
+            if entries:
+                return FastPathAnswer(format_lookup(entries, message, language, False),
+                                      "lookup", confidence - 0.08)
+        return None
+    
+    def answer(self, message: str, language: str, history_length: int) -> Optional[FastPathAnswer]:
+        """Return a deterministic answer, or None if the turn needs the model"""
+        if not settings.fast_path_enabled:
+            return None
+        try:
+            answer = self._formality(message, language) or self._lookup(message, language, history_length)
+        except Exception as e:
+            logger.warning("Fast path failed, using the model: %s", e)
+            answer = None
+        if answer is None or answer.confidence < self.min_confidence:
+            FAST_PATH_RESULTS.labels("fallback").inc()
+            return None
+        FAST_PATH_RESULTS.labels(answer.kind).inc()
+        return answer
+
+
+# Global instance
+fast_path = FastPath(
+    lexicon_path=settings.fast_path_lexicon_path or DEFAULT_LEXICON_PATH,
+    min_confidence=settings.fast_path_min_confidence,
+)
@@ -0,0 +1,442 @@
+"""Background jobs for long-running generations"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import aiosqlite
+from app.config import settings
+from app.scheduler import SchedulerBusyError, current_process, process_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# How often event streams of jobs running in another worker poll the job store
+STORE_POLL_SECONDS = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    job_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner_pid INTEGER NOT NULL,
+    owner_started INTEGER,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs (job_key) WHERE finished_at IS NULL;
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+def job_key(kind: str, user_id: str, payload: dict) -> str:
+    """Identity of a job request; identical in-flight requests share one job"""
+    body = json.dumps([kind, user_id, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class Job:
+    """A queued or running generation and the events it has produced so far"""
+    
+    def __init__(self, kind: str, key: str, user_id: str, run: Callable[["Job"], Awaitable[Any]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.user_id = user_id
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Tuple[str, dict]] = []
+        self.owner_pid, self.owner_started = current_process()
+        self._run = run
+        self._changed = asyncio.Condition()
+        self._store: Optional["JobStore"] = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+    
+    async def emit(self, event: str, data: dict) -> None:
+        """Record a progress event and wake up subscribers"""
+        async with self._changed:
+            self.events.append((event, data))
+            seq = len(self.events) - 1
+            self._changed.notify_all()
+        if self._store is not None:
+            await self._store.save(self, seq)
+    
+    async def _set_status(self, status: str, data: Optional[dict] = None) -> None:
+        self.status = status
+        if self.finished:
+            self.finished_at = time.time()
+        await self.emit(status, data or {})
+    
+    async def subscribe(self) -> AsyncIterator[Tuple[str, dict]]:
+        """Yield all past events, then new ones until the job has finished"""
+        index = 0
+        while True:
+            async with self._changed:
+                while index >= len(self.events) and not self.finished:
+                    await self._changed.wait()
+                pending = self.events[index:]
+                finished = self.finished
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(self.events):
+                return
+    
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class StoredJob(Job):
+    """A job owned by another worker process, as last written to the job store"""
+    
+    def __init__(self, store: "JobStore", row: dict):
+        super().__init__(row["kind"], row["job_key"], row["user_id"], run=None)
+        self.id = row["job_id"]
+        self.owner_pid = row["owner_pid"]
+        self.owner_started = row["owner_started"]
+        self.created_at = row["created_at"]
+        self._store = store
+        self._refresh(row)
+    
+    def _refresh(self, row: dict) -> None:
+        self.status = row["status"]
+        self.result = json.loads(row["result"]) if row["result"] is not None else None
+        self.error = row["error"]
+        self.finished_at = row["finished_at"]
+    
+    async def check_owner(self) -> None:
+        """Fail the job if the worker process running it no longer exists"""
+        if not self.finished and not process_alive(self.owner_pid, self.owner_started):
+            self.error = "The worker running this job stopped"
+            await self._set_status(FAILED, {"detail": self.error})
+    
+    async def subscribe(self) -> AsyncIterator[Tuple[str, dict]]:
+        """Yield all past events, then poll the store for new ones until the job has finished"""
+        index = 0
+        while True:
+            pending = self.events[index:]
+            for event in pending:
+                yield event
+            index += len(pending)
+            if self.finished:
+                return
+            await asyncio.sleep(STORE_POLL_SECONDS)
+            # The row first: events written before it finished are then all visible
+            row = await self._store.load_row(self.id)
+            if row is None:
+                return
+            self._refresh(row)
+            self.events += await self._store.load_events(self.id, len(self.events))
+            await self.check_owner()
+
+
+class JobStore:
+    """
+    Job state in SQLite (WAL mode), shared by the worker processes of one host
+    
+    A job runs in the worker that accepted it, which writes every event and
+    status change here. The other workers answer status requests and event
+    streams for it from this table and attach identical requests to it.
+    Events are rows of their own, so recording one costs the same however
+    many came before. Unfinished jobs of a worker process that no longer
+    exists are marked as failed when they are read; the process start time
+    is stored with the PID, so a new process that reused it does not count.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+    
+    async def open(self) -> None:
+        if self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        self._db.row_factory = aiosqlite.Row
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+    
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            await self.open()
+        return self._db
+    
+    async def save(self, job: Job, seq: int) -> None:
+        """Write the job's state and its event number `seq`"""
+        event, data = job.events[seq]
+        try:
+            db = await self._connection()
+            await db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, job_key, kind, user_id, status, result, error, "
+                "owner_pid, owner_started, created_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.key, job.kind, job.user_id, job.status,
+                 json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                 job.error, job.owner_pid, job.owner_started, job.created_at, job.finished_at),
+            )
+            # Two workers failing the job of a dead worker write the same event
+            await db.execute(
+                "INSERT OR IGNORE INTO job_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                (job.id, seq, event, json.dumps(data, ensure_ascii=False)),
+            )
+            await db.commit()
+        except Exception as e:
+            logger.warning("Saving job failed: %s", e, extra={"job_id": job.id})
+    
+    async def load_row(self, job_id: str) -> Optional[dict]:
+        db = await self._connection()
+        async with db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)) as cursor:
+            row = await cursor.fetchone()
+        return dict(row) if row else None
+    
+    async def load_events(self, job_id: str, first_seq: int = 0) -> List[Tuple[str, dict]]:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT event, data FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, first_seq)
+        ) as cursor:
+            return [(row["event"], json.loads(row["data"])) async for row in cursor]
+    
+    async def _stored_job(self, row: dict) -> "StoredJob":
+        job = StoredJob(self, row)
+        job.events = await self.load_events(job.id)
+        await job.check_owner()
+        return job
+    
+    async def load(self, job_id: str) -> Optional[StoredJob]:
+        row = await self.load_row(job_id)
+        if row is None:
+            return None
+        return await self._stored_job(row)
+    
+    async def find_unfinished(self, key: str) -> Optional[StoredJob]:
+        """Return a queued or running job with this key whose worker is still alive"""
+        db = await self._connection()
+        async with db.execute(
+            "SELECT * FROM jobs WHERE job_key = ? AND finished_at IS NULL", (key,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for row in rows:
+            job = await self._stored_job(dict(row))
+            if not job.finished:
+                return job
+        return None
+    
+    async def purge(self, cutoff: float) -> None:
+        db = await self._connection()
+        await db.execute(
+            "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at < ?)", (cutoff,)
+        )
+        await db.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        await db.commit()
+
+
+class JobManager:
+    """
+    Run generation jobs on a fixed pool of workers
+    
+    A request identical to a job that is still queued or running is attached
+    to that job instead of starting a new one. Finished jobs keep their result
+    for `result_ttl_seconds`. A job whose generation is rejected by the busy
+    scheduler waits and retries instead of failing, so bursts are absorbed
+    rather than dropped; after `busy_max_wait_seconds` of waiting it fails.
+    
+    With a `store`, jobs are visible to all worker processes (see `JobStore`).
+    """
+    
+    def __init__(self, workers: int, queue_limit: int, result_ttl_seconds: float,
+                 store: Optional[JobStore] = None, busy_max_wait_seconds: float = 600):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.result_ttl_seconds = result_ttl_seconds
+        self.busy_max_wait_seconds = busy_max_wait_seconds
+        self.store = store
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._closing = False
+        self._store_purged_at = 0.0
+    
+    def start(self) -> None:
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def shutdown(self, grace_seconds: float = 0) -> None:
+        """
+        Stop accepting jobs, give running jobs up to `grace_seconds` to finish,
+        then stop the workers; queued and unfinished jobs are marked as failed
+        """
+        self._closing = True
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                self._queue.task_done()
+                self._active.pop(job.key, None)
+                await self._fail(job, "Server shutting down, please resubmit")
+            try:
+                await asyncio.wait_for(self._queue.join(), grace_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("Cancelling %s running jobs after the shutdown grace period", len(self._active))
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for job in self._jobs.values():
+            if not job.finished:
+                await self._fail(job, "Server shutting down")
+        self._active.clear()
+        if self.store is not None:
+            await self.store.close()
+    
+    async def _fail(self, job: Job, detail: str) -> None:
+        job.error = detail
+        await job._set_status(FAILED, {"detail": detail})
+    
+    async def _purge(self) -> None:
+        """Drop finished jobs whose results have expired"""
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.store is not None and time.monotonic() - self._store_purged_at > 60:
+            self._store_purged_at = time.monotonic()
+            await self.store.purge(cutoff)
+    
+    async def submit(self, kind: str, user_id: str, payload: dict,
+                     run: Callable[[Job], Awaitable[Any]]) -> Tuple[Job, bool]:
+        """
+        Queue a job, or attach to an identical one that is still in flight
+        
+        Args:
+            kind: Job type, e.g. `create-course`
+            user_id: Owner of the job
+            payload: Request parameters, used to detect identical requests
+            run: Coroutine function producing the JSON-serializable result
+        
+        Returns:
+            `(job, coalesced)` where coalesced is True if an existing job was reused
+        
+        Raises:
+            SchedulerBusyError: If the job queue is full or the server is shutting down
+        """
+        if self._closing:
+            raise SchedulerBusyError("Server is shutting down, please retry", status_code=503, retry_after=5)
+        if not self._worker_tasks:
+            self.start()
+        await self._purge()
+        key = job_key(kind, user_id, payload)
+        job = self._active.get(key)
+        if job is None and self.store is not None:
+            job = await self.store.find_unfinished(key)
+        if job is not None:
+            return job, True
+        if self._queue.qsize() >= self.queue_limit:
+            raise SchedulerBusyError("Job queue is full, please retry later", status_code=429, retry_after=30)
+        
+        job = Job(kind, key, user_id, run)
+        job._store = self.store
+        self._jobs[job.id] = job
+        self._active[key] = job
+        await job.emit(QUEUED, {})
+        self._queue.put_nowait(job)
+        return job, False
+    
+    async def get(self, job_id: str, user_id: str) -> Optional[Job]:
+        await self._purge()
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await self.store.load(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+    
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+    
+    async def _execute(self, job: Job) -> None:
+        await job._set_status(RUNNING)
+        waited = 0.0
+        try:
+            while True:
+                try:
+                    job.result = await job._run(job)
+                    break
+                except SchedulerBusyError as e:
+                    if waited + e.retry_after > self.busy_max_wait_seconds:
+                        raise RuntimeError(
+                            f"Server still busy after waiting {int(waited)} seconds, please retry later"
+                        ) from e
+                    await job.emit("waiting", {"retryAfter": e.retry_after})
+                    await asyncio.sleep(e.retry_after)
+                    waited += e.retry_after
+            await job._set_status(SUCCEEDED, {"result": job.result})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Job failed: %s", e, extra={"job_id": job.id, "job_kind": job.kind})
+            job.error = str(e)
+            await job._set_status(FAILED, {"detail": job.error})
+        finally:
+            self._active.pop(job.key, None)
+    
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "active": len(self._active),
+            "stored": len(self._jobs),
+        }
+
+
+# Global instance
+job_manager = JobManager(
+    workers=settings.job_workers,
+    queue_limit=settings.job_queue_limit,
+    result_ttl_seconds=settings.job_result_ttl_seconds,
+    store=JobStore(settings.job_db_path) if settings.job_db_path else None,
+    busy_max_wait_seconds=settings.job_busy_max_wait_seconds,
+)
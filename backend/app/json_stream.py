@@ -0,0 +1,233 @@
+"""Incremental extraction and repair of JSON objects from streamed model output"""
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+def repair_json(text: str) -> str:
+    """
+    Repair common faults in model-generated JSON
+    
+    Removes trailing commas, closes an unterminated string and closes any
+    open arrays/objects. If the text was cut off in the middle of a value,
+    it is truncated back to the last complete element.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Output length and open containers at each comma, to truncate back to
+    commas: List[Tuple[int, List[str]]] = []
+    
+    for c in text:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]":
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+        elif c == ",":
+            commas.append((len(out), list(stack)))
+        out.append(c)
+        if not stack and c in "}]":
+            break
+    
+    def close(chars: List[str], open_stack: List[str], unterminated: bool) -> str:
+        candidate = "".join(chars)
+        if unterminated:
+            candidate += '"'
+        candidate = candidate.rstrip()
+        if candidate.endswith(","):
+            candidate = candidate[:-1]
+        elif candidate.endswith(":"):
+            candidate += " null"
+        return candidate + "".join(reversed(open_stack))
+    
+    candidates = [close(out, stack, in_string)]
+    for index, open_stack in reversed(commas):
+        candidates.append(close(out[:index], open_stack, False))
+    for candidate in candidates:
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return candidates[0]
+
+
+def loads_lenient(text: str) -> Any:
+    """Parse JSON, repairing it first if it is malformed"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+
+class JsonStreamExtractor:
+    """
+    Find the first complete top-level JSON object in a stream of text chunks
+    
+    Text before the object (including `<think>` blocks and markdown fences) is
+    skipped. Elements of the top-level arrays named in `item_keys` are
+    reported as soon as each one is complete, and `done` turns True as soon
+    as the top-level object closes, so the caller can stop generation early.
+    """
+    
+    def __init__(self, item_keys: Iterable[str] = ("lessons", "exercises", "solutions")):
+        self.item_keys = set(item_keys)
+        self.buffer = ""
+        self.result: Optional[dict] = None
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+    
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+    
+    def _find_start(self) -> bool:
+        """Skip to the first `{` outside of `<think>` blocks"""
+        while True:
+            brace = self.buffer.find("{", self._pos)
+            think = self.buffer.find("<think>", self._pos)
+            if think != -1 and (brace == -1 or think < brace):
+                end = self.buffer.find("</think>", think)
+                if end == -1:
+                    return False
+                self._pos = end + len("</think>")
+                continue
+            if brace == -1:
+                # Keep scanning from near the end; "<think>" may be split across chunks
+                self._pos = max(self._pos, len(self.buffer) - len("<think>"))
+                return False
+            self._start = brace
+            self._pos = brace
+            return True
+    
+    def _in_item_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "[" and self._array_key in self.item_keys
+    
+    def _emit_item(self, end: int) -> Optional[Tuple[str, Any]]:
+        text = self.buffer[self._item_start:end + 1]
+        self._item_start = None
+        try:
+            return self._array_key, loads_lenient(text)
+        except json.JSONDecodeError:
+            return None
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Add a chunk of model output
+        
+        Returns:
+            `(array_key, item)` pairs for array elements completed by this chunk
+        """
+        self.buffer += chunk
+        items: List[Tuple[str, Any]] = []
+        if self.done or (self._start is None and not self._find_start()):
+            return items
+        
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            i = self._pos
+            c = buffer[i]
+            self._pos += 1
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        # Possibly an object key, confirmed when ':' follows
+                        self._last_string = buffer[self._string_start + 1:i]
+                    elif self._item_start == self._string_start and self._in_item_array():
+                        item = self._emit_item(i)
+                        if item:
+                            items.append(item)
+                continue
+            
+            if c == '"':
+                if self._item_start is None and self._in_item_array():
+                    self._item_start = i
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                if self._item_start is None and self._in_item_array():
+                    self._item_start = i
+                if len(self._stack) == 1:
+                    self._array_key = self._current_key if c == "[" else None
+                self._stack.append(c)
+            elif c in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    try:
+                        self.result = loads_lenient(buffer[self._start:i + 1])
+                    except json.JSONDecodeError:
+                        # Not a JSON object after all, look for the next one
+                        self._reset_after(i + 1)
+                        if not self._find_start():
+                            break
+                        continue
+                    break
+                if self._item_start is not None and self._in_item_array():
+                    item = self._emit_item(i)
+                    if item:
+                        items.append(item)
+            elif c == ":" and len(self._stack) == 1:
+                self._current_key = self._last_string
+            elif c == "," and len(self._stack) == 1:
+                self._current_key = None
+        return items
+    
+    def _reset_after(self, position: int) -> None:
+        self._pos = position
+        self._start = None
+        self._stack = []
+        self._current_key = None
+        self._array_key = None
+        self._item_start = None
+    
+    def finish(self) -> dict:
+        """
+        Return the extracted object, repairing a truncated one if needed
+        
+        Raises:
+            ValueError: If no JSON object was found
+        """
+        if self.result is not None:
+            return self.result
+        if self._start is None:
+            raise ValueError("No JSON found in response")
+        try:
+            result = json.loads(repair_json(self.buffer[self._start:]))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Unrepairable JSON in response: {e}")
+        if not isinstance(result, dict):
+            raise ValueError("No JSON object found in response")
+        self.result = result
+        return result
@@ -1,8 +1,27 @@
 """Service for interacting with Ollama using LangChain"""
-from typing import List, Dict, Optional
-from langchain_ollama import ChatOllama
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, List, Dict, Optional, Set, Tuple
+import httpx
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_core.messages import HumanMessage
+from app.cache import make_cache_key, response_cache
 from app.config import settings
+from app.json_stream import JsonStreamExtractor
+from app.metrics import (
+    JSON_PARSE_RESULTS, OLLAMA_DURATION, OLLAMA_ERRORS, OLLAMA_TIME_TO_FIRST_TOKEN, observe_ollama_metadata,
+    observe_ollama_tokens
+)
+from app.model_routing import ModelRoute, model_router
+from app.ollama_pool import OllamaBackend, OllamaPool, is_connection_error
+from app.prompts import build_messages
+from app.scheduler import Priority, SchedulerBusyError, scheduler
+from app.single_flight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
 
 
 class LangChainService:
@@ -10,20 +29,252 @@ class LangChainService:
     
     def __init__(self):
         try:
-            self.llm = ChatOllama(
-                base_url=settings.ollama_base_url,
-                model=settings.ollama_model,
-                temperature=0.7,
+            self.temperature = settings.ollama_temperature
+            self.pool = OllamaPool(
+                [
+                    OllamaBackend(url, self._create_llm(url), self._create_embeddings(url))
+                    for url in settings.ollama_urls
+                ],
+                health_check_interval=settings.ollama_health_check_interval,
             )
-            print(f"Initialized ChatOllama with model: {settings.ollama_model}, base_url: {settings.ollama_base_url}")
-        except Exception as e:
-            print(f"Error initializing ChatOllama: {e}")
+            self._warm_up_task: Optional[asyncio.Task] = None
+            # Identical JSON generations in flight at the same time share one Ollama call
+            self.single_flight = SingleFlight()
+            logger.info("Initialized ChatOllama", extra={"model": settings.ollama_model,
+                                                          "base_urls": settings.ollama_urls})
+        except Exception:
+            logger.exception("Error initializing ChatOllama")
             raise
     
-    def generate(self, prompt: str, system_prompt: Optional[str] = None, 
+    def _create_llm(self, base_url: str) -> ChatOllama:
+        """Create the client for one Ollama backend"""
+        # Each ChatOllama instance owns one sync and one async httpx client,
+        # so every request to a backend reuses the same keep-alive connection pool
+        return ChatOllama(
+            base_url=base_url,
+            model=settings.ollama_model,
+            temperature=self.temperature,
+            keep_alive=settings.ollama_keep_alive,
+            client_kwargs={
+                "timeout": settings.ollama_timeout,
+                "limits": httpx.Limits(
+                    max_connections=settings.ollama_max_connections,
+                    max_keepalive_connections=settings.ollama_max_connections,
+                ),
+            },
+        )
+    
+    @staticmethod
+    def _create_embeddings(base_url: str) -> OllamaEmbeddings:
+        """Create the embedding client for one Ollama backend"""
+        return OllamaEmbeddings(
+            base_url=base_url,
+            model=settings.ollama_embedding_model,
+            client_kwargs={"timeout": settings.ollama_health_check_timeout},
+        )
+    
+    @property
+    def llm(self) -> ChatOllama:
+        """Client of the first configured backend"""
+        return self.pool.primary.llm
+    
+    @property
+    def ready(self) -> bool:
+        """True once a healthy backend has the model loaded"""
+        return any(b.warm and b.healthy for b in self.pool.backends)
+    
+    async def _warm_up_backend(self, backend: OllamaBackend) -> None:
+        """Load every routed model on one backend with a one-token generation, retrying until it succeeds"""
+        for model in model_router.models():
+            while True:
+                try:
+                    await backend.llm.ainvoke([HumanMessage(content="Hallo")], model=model, options={"num_predict": 1})
+                    logger.info("Model loaded", extra={"model": model, "backend": backend.base_url})
+                    break
+                except Exception as e:
+                    logger.warning("Warm-up failed, retrying: %s", e, extra={"model": model, "backend": backend.base_url})
+                    await asyncio.sleep(max(settings.ollama_health_check_interval, 1))
+        backend.warm = True
+    
+    def start_warm_up(self) -> None:
+        """Load the model on every backend in the background; `ready` turns True when one is done"""
+        if not settings.ollama_warmup:
+            for backend in self.pool.backends:
+                backend.warm = True
+            return
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self._warm_up())
+    
+    async def _warm_up(self) -> None:
+        await asyncio.gather(*(self._warm_up_backend(b) for b in self.pool.backends))
+    
+    async def stop_warm_up(self) -> None:
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            try:
+                await self._warm_up_task
+            except asyncio.CancelledError:
+                pass
+            self._warm_up_task = None
+    
+    @staticmethod
+    def _connection_error(e: Exception) -> Optional[Exception]:
+        """Return a friendly exception if the error is an Ollama connection failure"""
+        if is_connection_error(e):
+            return Exception(
+                f"Cannot connect to Ollama at {', '.join(settings.ollama_urls)}. "
+                f"Please ensure Ollama is running. You can start it with: ollama serve"
+            )
+        return None
+    
+    @staticmethod
+    def _response_text(response) -> str:
+        """Extract the text from a LangChain response"""
+        # Handle different response types
+        if hasattr(response, 'content'):
+            return response.content
+        elif isinstance(response, str):
+            return response
+        else:
+            # Try to get string representation
+            return str(response)
+    
+    def _wrap_error(self, e: Exception, messages: list, system_prompt: Optional[str]) -> Exception:
+        """Log a failed Ollama call and convert it into a user-facing exception"""
+        error_msg = str(e)
+        
+        # Check if it's a connection error
+        connection_error = self._connection_error(e)
+        if connection_error:
+            OLLAMA_ERRORS.labels("connection").inc()
+            return connection_error
+        
+        OLLAMA_ERRORS.labels("other").inc()
+        logger.error("Ollama call failed", exc_info=e, extra={
+            "message_count": len(messages),
+            "system_prompt": system_prompt[:200] if system_prompt else None,
+        })
+        return Exception(f"Error calling Ollama via LangChain: {error_msg}")
+    
+    def _failover(self, backend: OllamaBackend, e: Exception, tried: Set[str]) -> None:
+        """Record a failed backend, re-raising unless another backend can be tried"""
+        if not is_connection_error(e):
+            raise e
+        self.pool.mark_failed(backend)
+        tried.add(backend.base_url)
+        if len(tried) >= len(self.pool.backends):
+            raise e
+        logger.warning("Ollama backend unreachable, retrying on another backend", extra={"backend": backend.base_url})
+    
+    async def _ainvoke(self, messages: list, **kwargs):
+        """Invoke the least loaded backend, failing over to another node on connection errors"""
+        tried: Set[str] = set()
+        while True:
+            with self.pool.lease(tried) as backend:
+                started = time.perf_counter()
+                try:
+                    response = await backend.llm.ainvoke(messages, **kwargs)
+                except Exception as e:
+                    self._failover(backend, e, tried)
+                    continue
+                OLLAMA_DURATION.labels("invoke").observe(time.perf_counter() - started)
+                observe_ollama_metadata(getattr(response, "response_metadata", None))
+                return response
+    
+    def _invoke(self, messages: list, **kwargs):
+        """Blocking variant of `_ainvoke`"""
+        tried: Set[str] = set()
+        while True:
+            with self.pool.lease(tried) as backend:
+                try:
+                    return backend.llm.invoke(messages, **kwargs)
+                except Exception as e:
+                    self._failover(backend, e, tried)
+    
+    async def _astream(self, messages: list, **kwargs):
+        """Stream from the least loaded backend, failing over only before the first chunk"""
+        tried: Set[str] = set()
+        while True:
+            with self.pool.lease(tried) as backend:
+                stream = backend.llm.astream(messages, **kwargs)
+                started = False
+                finished = False
+                chunks = 0
+                started_at = time.perf_counter()
+                try:
+                    async for chunk in stream:
+                        if not started:
+                            started = True
+                            OLLAMA_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started_at)
+                        chunks += 1
+                        # The final chunk carries the token counts of the whole generation
+                        finished = observe_ollama_metadata(
+                            getattr(chunk, "response_metadata", None), getattr(chunk, "usage_metadata", None)
+                        ) or finished
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    self._failover(backend, e, tried)
+                finally:
+                    await stream.aclose()
+                    if started:
+                        # Also when the consumer stopped early, e.g. after a complete JSON object
+                        OLLAMA_DURATION.labels("stream").observe(time.perf_counter() - started_at)
+                    if started and not finished:
+                        # Stopped before the final chunk: Ollama streams one token per chunk
+                        observe_ollama_tokens(None, chunks)
+    
+    async def aembed(self, text: str) -> List[float]:
+        """
+        Embed a text with the embedding model on the least loaded backend
+        
+        Embeddings are cheap compared to generations, so they do not take a scheduler slot.
+        """
+        tried: Set[str] = set()
+        while True:
+            with self.pool.lease(tried) as backend:
+                try:
+                    return await backend.embeddings.aembed_query(text)
+                except Exception as e:
+                    self._failover(backend, e, tried)
+    
+    async def agenerate(self, prompt: str, system_prompt: Optional[str] = None,
+                        conversation_history: Optional[List[Dict[str, str]]] = None,
+                        priority: Priority = Priority.CHAT, route: Optional[ModelRoute] = None) -> str:
+        """
+        Generate a response from Ollama using LangChain without blocking the event loop
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System prompt (optional)
+            conversation_history: Previous conversation messages (optional)
+            priority: Scheduler priority class for this generation (optional)
+            route: Model and options to use, see `model_router` (optional, default route)
+        
+        Returns:
+            Generated response text
+        
+        Raises:
+            SchedulerBusyError: If the scheduler queue for `priority` is full
+        """
+        messages = build_messages(prompt, system_prompt, conversation_history)
+        try:
+            async with scheduler.slot(priority):
+                response = await self._ainvoke(messages, **(route or model_router.default).invoke_kwargs())
+        except SchedulerBusyError:
+            raise
+        except Exception as e:
+            raise self._wrap_error(e, messages, system_prompt)
+        return self._response_text(response)
+    
+    def generate(self, prompt: str, system_prompt: Optional[str] = None,
                  conversation_history: Optional[List[Dict[str, str]]] = None) -> str:
         """
-        Generate a response from Ollama using LangChain
+        Generate a response from Ollama using LangChain (blocking)
+        
+        Prefer `agenerate` from async code; this is kept for scripts and sync callers.
         
         Args:
             prompt: User prompt
@@ -33,56 +284,171 @@ class LangChainService:
         Returns:
             Generated response text
         """
+        messages = build_messages(prompt, system_prompt, conversation_history)
         try:
-            # Build messages list
-            messages = []
-            
-            # Add system prompt if provided (should be first)
-            if system_prompt:
-                messages.append(SystemMessage(content=system_prompt))
-            
-            # Add conversation history if provided
-            if conversation_history:
-                for msg in conversation_history:
-                    if msg["role"] == "user":
-                        messages.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "assistant":
-                        messages.append(AIMessage(content=msg["content"]))
-            
-            # Add current user message
-            messages.append(HumanMessage(content=prompt))
-            
-            # Use invoke for synchronous calls
-            response = self.llm.invoke(messages)
-            
-            # Handle different response types
-            if hasattr(response, 'content'):
-                return response.content
-            elif isinstance(response, str):
-                return response
-            else:
-                # Try to get string representation
-                return str(response)
+            response = self._invoke(messages)
+        except Exception as e:
+            raise self._wrap_error(e, messages, system_prompt)
+        return self._response_text(response)
+    
+    async def astream(self, prompt: str, system_prompt: Optional[str] = None,
+                      conversation_history: Optional[List[Dict[str, str]]] = None,
+                      route: Optional[ModelRoute] = None) -> AsyncIterator[str]:
+        """
+        Stream a response from Ollama token by token
+        
+        Closing the returned generator (e.g. when the client disconnects)
+        closes the upstream stream, which aborts the generation in Ollama.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System prompt (optional)
+            conversation_history: Previous conversation messages (optional)
+            route: Model and options to use, see `model_router` (optional, default route)
+        
+        Yields:
+            Chunks of generated text as Ollama produces them
+        """
+        messages = build_messages(prompt, system_prompt, conversation_history)
+        stream = self._astream(messages, **(route or model_router.default).invoke_kwargs())
+        try:
+            async for chunk in stream:
+                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if content:
+                    yield content
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
             error_msg = str(e)
+            connection_error = self._connection_error(e)
+            if connection_error:
+                raise connection_error
+            OLLAMA_ERRORS.labels("other").inc()
+            logger.error("Error streaming from Ollama: %s", error_msg)
+            raise Exception(f"Error streaming from Ollama via LangChain: {error_msg}")
+        finally:
+            await stream.aclose()
+    
+    @staticmethod
+    def parse_json(response_text: str) -> dict:
+        """
+        Extract and parse the first JSON object from a model response, repairing it if needed
+        
+        Args:
+            response_text: Raw model output
+        
+        Returns:
+            Parsed JSON response
+        """
+        extractor = JsonStreamExtractor()
+        extractor.feed(response_text)
+        closed = extractor.done
+        try:
+            data = extractor.finish()
+        except ValueError as e:
+            JSON_PARSE_RESULTS.labels("failed").inc()
+            raise Exception(f"Failed to parse JSON response: {str(e)}\nResponse: {response_text}")
+        JSON_PARSE_RESULTS.labels("ok" if closed else "repaired").inc()
+        return data
+    
+    async def astream_json(self, prompt: str, system_prompt: Optional[str] = None,
+                           priority: Priority = Priority.EXERCISES, schema: Optional[dict] = None,
+                           route: Optional[ModelRoute] = None) -> AsyncIterator[Tuple[Optional[str], Any]]:
+        """
+        Stream a JSON response from Ollama, stopping as soon as the object is complete
+        
+        Text around the JSON object is skipped and generation is aborted once the
+        top-level object closes. Truncated or slightly malformed JSON is repaired.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System prompt (optional)
+            priority: Scheduler priority class for this generation (optional)
+            schema: JSON schema the output is constrained to via Ollama's `format` (optional)
+            route: Model and options to use, see `model_router` (optional, default route)
+        
+        Yields:
+            `(array_key, item)` for each completed element of a top-level
+            `lessons`/`exercises`/`solutions` array, then `(None, result)`
+            with the full parsed object
+        """
+        messages = build_messages(prompt, system_prompt)
+        extractor = JsonStreamExtractor()
+        kwargs = (route or model_router.default).invoke_kwargs()
+        if schema:
+            kwargs["format"] = schema
+        try:
+            async with scheduler.slot(priority):
+                stream = self._astream(messages, **kwargs)
+                try:
+                    async for chunk in stream:
+                        content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                        for item in extractor.feed(content):
+                            yield item
+                        if extractor.done:
+                            # Closing the stream stops Ollama from generating trailing text
+                            break
+                finally:
+                    await stream.aclose()
+        except SchedulerBusyError:
+            raise
+        except Exception as e:
+            raise self._wrap_error(e, messages, system_prompt)
+        
+        closed = extractor.done
+        try:
+            data = extractor.finish()
+        except ValueError as e:
+            JSON_PARSE_RESULTS.labels("failed").inc()
+            raise Exception(f"Failed to parse JSON response: {str(e)}\nResponse: {extractor.buffer}")
+        # A truncated object that had to be closed by the repair counts as repaired
+        JSON_PARSE_RESULTS.labels("ok" if closed else "repaired").inc()
+        yield None, data
+    
+    async def agenerate_json(self, prompt: str, system_prompt: Optional[str] = None,
+                             use_cache: bool = False, refresh_cache: bool = False,
+                             priority: Priority = Priority.EXERCISES,
+                             schema: Optional[dict] = None, route: Optional[ModelRoute] = None) -> dict:
+        """
+        Generate a JSON response from Ollama without blocking the event loop
+        
+        Concurrent calls with the same normalized prompt share one generation
+        and all receive its result or its error.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System prompt (optional)
+            use_cache: Serve from / store into the response cache (optional)
+            refresh_cache: Skip the cache lookup but still store the result (optional)
+            priority: Scheduler priority class for this generation (optional)
+            schema: JSON schema the output is constrained to via Ollama's `format` (optional)
+            route: Model and options to use, see `model_router` (optional, default route)
+        
+        Returns:
+            Parsed JSON response
+        """
+        route = route or model_router.default
+        cache_key = make_cache_key(route.cache_model, system_prompt, prompt, route.temperature)
+        if use_cache and not refresh_cache:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+        
+        async def generate() -> dict:
+            data = None
+            async for key, value in self.astream_json(prompt, system_prompt, priority=priority, schema=schema,
+                                                      route=route):
+                if key is None:
+                    data = value
             
-            # Check if it's a connection error
-            if "10061" in error_msg or "refused" in error_msg.lower() or "ConnectError" in error_msg:
-                raise Exception(
-                    f"Cannot connect to Ollama at {settings.ollama_base_url}. "
-                    f"Please ensure Ollama is running. You can start it with: ollama serve"
-                )
-            
-            print(f"Error in langchain_service.generate: {error_trace}")
-            print(f"Messages sent: {messages}")
-            print(f"System prompt: {system_prompt}")
-            raise Exception(f"Error calling Ollama via LangChain: {error_msg}")
+            # Only successfully parsed responses are cached
+            if use_cache:
+                await response_cache.set(cache_key, json.dumps(data, ensure_ascii=False))
+            return data
+        
+        return await self.single_flight.do(cache_key, generate)
     
     def generate_json(self, prompt: str, system_prompt: Optional[str] = None) -> dict:
         """
-        Generate a JSON response from Ollama
+        Generate a JSON response from Ollama (blocking)
         
         Args:
             prompt: User prompt
@@ -91,33 +457,8 @@ class LangChainService:
         Returns:
             Parsed JSON response
         """
-        import json
         response_text = self.generate(prompt, system_prompt)
-        
-        # Try to extract JSON from response
-        try:
-            # Look for JSON in code blocks
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-            elif "```" in response_text:
-                json_start = response_text.find("```") + 3
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-            else:
-                # Try to find JSON object directly
-                json_start = response_text.find("{")
-                json_end = response_text.rfind("}") + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_text = response_text[json_start:json_end]
-                else:
-                    raise ValueError("No JSON found in response")
-            
-            return json.loads(json_text)
-        except (json.JSONDecodeError, ValueError) as e:
-            # If JSON parsing fails, return the raw response
-            raise Exception(f"Failed to parse JSON response: {str(e)}\nResponse: {response_text}")
+        return self.parse_json(response_text)
 
 
 # Global instance
@@ -1,18 +1,76 @@
 """FastAPI main application"""
-from fastapi import FastAPI, HTTPException
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional, Union
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from app.models import (
-    ChatRequest, ChatResponse, CourseRequest, CourseResponse,
-    ExerciseRequest, ExerciseResponse, ProgressRequest, ProgressResponse
+    ChatRequest, ChatResponse, ChatSessionCreateRequest, ChatSessionMessageRequest,
+    ChatSessionResponse, CourseRequest, CourseResponse, CourseOutlineResponse,
+    Lesson, LessonOutline, ExerciseBatchRequest, ExerciseRequest, ExerciseResponse, JobResponse, ProgressRequest, ProgressResponse
 )
 from app.langchain_service import langchain_service
+from app.cache import bypass_cache, cache_enabled_for, response_cache
+from app.semantic_cache import semantic_chat_cache
+from app.fast_path import fast_path
+from app.scheduler import Priority, SchedulerBusyError, scheduler
+from app.progress_store import progress_store
+from app.course_store import course_store
+from app.structured_output import json_system_prompt, schema_format
+from app.prompts import CHAT_INSTRUCTIONS, CHAT_PROMPT, COURSE_PROMPT, goals_text
+from app.exercise_generation import generate_exercises as generate_lesson_exercises, generate_exercises_batch
+from app.exercise_bank import exercise_bank, exercise_key
+from app.chat_context import chat_context
+from app.session_store import SessionConflictError, session_store
+from app.jobs import Job, job_manager
+from app.model_routing import Task, UnknownRouteError, model_router
+from app.course_generation import (
+    estimated_duration, generate_lessons, generate_outline, lesson_count, lesson_generator
+)
+from app.logging_config import configure_logging
+from app.compression import CompressionMiddleware, conditional_response
+from app.metrics import CACHE_LOOKUPS, MetricsMiddleware, mark_worker_stopped, metrics_response
 from app.config import settings
 import json
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background tasks"""
+    await progress_store.open()
+    await course_store.open()
+    await session_store.open()
+    await exercise_bank.open()
+    await semantic_chat_cache.open()
+    langchain_service.pool.start_health_checks()
+    langchain_service.start_warm_up()
+    job_manager.start()
+    yield
+    # Uvicorn has already waited for in-flight requests; give background jobs the same grace period
+    await job_manager.shutdown(settings.shutdown_grace_seconds)
+    await langchain_service.stop_warm_up()
+    await langchain_service.pool.stop_health_checks()
+    await lesson_generator.shutdown()
+    await chat_context.shutdown()
+    await semantic_chat_cache.close()
+    await exercise_bank.close()
+    await session_store.close()
+    await course_store.close()
+    await progress_store.close()
+    mark_worker_stopped()
+
+
 app = FastAPI(
     title="German Tutor API",
     description="Backend API for German learning assistant using Ollama",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -22,7 +80,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+# Used when the client does not identify the user (X-User-Id header)
+DEFAULT_USER_ID = "anonymous"
 
 
 # System prompts
@@ -44,9 +109,12 @@ When formality is:
 Always respond in the target language when appropriate. If the user asks a question in English about German, you can respond in English. If they're practicing German, respond in German.
 """
 
-COURSE_SYSTEM_PROMPT = """You are an expert German language course designer. Create comprehensive, structured German language courses.
+# JSON schema for schema-constrained generation (None when disabled)
+COURSE_SCHEMA = schema_format(CourseResponse, exclude=["courseId"])
 
-Generate courses in JSON format with this exact structure:
+COURSE_SYSTEM_PROMPT = json_system_prompt(
+    role="You are an expert German language course designer. Create comprehensive, structured German language courses.",
+    structure="""Generate courses in JSON format with this exact structure:
 {
   "courseName": "Course name",
   "level": "A1/A2/B1/B2/C1",
@@ -60,9 +128,8 @@ Generate courses in JSON format with this exact structure:
     }
   ],
   "estimatedDuration": "X weeks or Y months"
-}
-
-Guidelines:
+}""",
+    guidelines="""Guidelines:
 - Create 5-8 lessons per course
 - Each lesson should be comprehensive and progressive
 - Vocabulary should be relevant to the lesson topic
@@ -70,9 +137,27 @@ Guidelines:
 - Exercises should be practical and varied
 - Adjust lesson count based on dailyStudyHours (more hours = more lessons)
 - Incorporate user goals if provided
-- Make lessons engaging and practical
+- Make lessons engaging and practical"""
+)
 
-Always respond with valid JSON only, no additional text."""
+
+def busy_error(e: SchedulerBusyError) -> HTTPException:
+    """Convert a scheduler rejection into an HTTP error with Retry-After"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def model_override(x_model_route: Optional[str]) -> Optional[str]:
+    """Validate the route requested with the X-Model-Route header (None: let the routing rules decide)"""
+    if x_model_route is None or not settings.model_routing_allow_override:
+        return None
+    try:
+        return model_router.check(x_model_route)
+    except UnknownRouteError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/")
@@ -85,247 +170,729 @@ async def root():
     }
 
 
+def chat_instructions(language: str, formality: str) -> str:
+    """Tutor instructions for a language direction and formality level"""
+    formality_text = 'Sie (formal)' if formality == 'sie' else 'du (informal)'
+    template = CHAT_INSTRUCTIONS["en-de" if language == "en-de" else "de-en"]
+    return template.format(formality=formality_text)
+
+
+def build_chat_prompt(request: ChatRequest) -> str:
+    """Build the per-turn tutor prompt based on language direction"""
+    return CHAT_PROMPT.format(
+        message=request.message,
+        instructions=chat_instructions(request.language, request.formality)
+    )
+
+
+def build_session_system_prompt(language: str, formality: str) -> str:
+    """
+    System prompt for a chat session
+    
+    The tutor instructions live here rather than in the user turn, so that the
+    stored history is replayed byte for byte and Ollama can reuse its KV cache
+    for the whole prefix.
+    """
+    return f"{CHAT_SYSTEM_PROMPT}\n{chat_instructions(language, formality)}\n"
+
+
+def build_conversation_history(request: ChatRequest) -> list:
+    """Convert the request's conversation history into plain message dicts"""
+    if not request.conversationHistory:
+        return []
+    return [
+        {"role": msg.role, "content": msg.content}
+        for msg in request.conversationHistory
+    ]
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Report hit rates and sizes of the response cache and the semantic chat cache"""
+    return {
+        "responses": response_cache.stats(),
+        "semanticChat": semantic_chat_cache.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request latency, queue wait, Ollama timings and tokens, cache hits"""
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the model is loaded on a healthy backend, 503 before
+    """
+    if not langchain_service.ready:
+        raise HTTPException(status_code=503, detail="Model is not loaded yet")
+    return {"status": "ready", "model": settings.ollama_model}
+
+
+@app.get("/backends")
+async def backends():
+    """Report health and load of the configured Ollama backends"""
+    return {"backends": langchain_service.pool.stats()}
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Report generation queue depth, in-flight count and wait times"""
+    return {
+        **scheduler.stats(),
+        "jobs": job_manager.stats(),
+        "singleFlight": langchain_service.single_flight.stats(),
+        "modelRouting": model_router.stats()
+    }
+
+
+async def lookup_semantic_cache(message: str, language: str, formality: str, history: list):
+    """Look up a chat turn in the semantic cache if it is eligible; returns `(response, vector)`"""
+    if not semantic_chat_cache.eligible(len(history)):
+        return None, None
+    return await semantic_chat_cache.lookup(message, language, formality, history)
+
+
+async def lookup_instant_response(message: str, language: str, formality: str, history: list):
+    """
+    Answer a chat turn without the model if possible; returns `(response, vector)`
+    
+    Word lookups and du -> Sie conversions come from the deterministic fast
+    path, near-duplicates of recent questions from the semantic cache.
+    """
+    answer = fast_path.answer(message, language, len(history))
+    if answer is not None:
+        return answer.response, None
+    return await lookup_semantic_cache(message, language, formality, history)
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, x_model_route: Optional[str] = Header(None)):
     """
     Handle chat messages for German-English conversation practice
     """
+    override = model_override(x_model_route)
     try:
-        import traceback
+        conversation_history = build_conversation_history(request)
+        prompt = build_chat_prompt(request)
         
-        # Build conversation history
-        conversation_history = []
-        if request.conversationHistory:
-            conversation_history = [
-                {"role": msg.role, "content": msg.content}
-                for msg in request.conversationHistory
-            ]
+        # Lookups, du -> Sie conversions and near-duplicates of recent questions skip the model
+        cached, message_vector = await lookup_instant_response(
+            request.message, request.language, request.formality, conversation_history
+        )
+        if cached is not None:
+            return ChatResponse(response=cached, translatedText=None)
         
-        # Build the prompt based on language direction
-        if request.language == "en-de":
-            # User wants to practice English -> German
-            prompt = f"""User message: {request.message}
-
-Please respond as a German tutor. The user is practicing translating from English to German.
-- Formality level: {'Sie (formal)' if request.formality == 'sie' else 'du (informal)'}
-- Provide the German translation and explanation
-- If they're asking a question, answer in German using the appropriate formality level
-- Be encouraging and provide corrections if needed"""
-        else:  # de-en
-            # User wants to practice German -> English (or English -> German response)
-            prompt = f"""User message: {request.message}
-
-Please respond as a German tutor. The user is practicing German.
-- Formality level: {'Sie (formal)' if request.formality == 'sie' else 'du (informal)'}
-- Respond in German using the appropriate formality level
-- Provide explanations, corrections, or translations as needed
-- Be encouraging and supportive"""
+        # Send only recent turns verbatim; older ones are folded into a summary
+        summary, window = await chat_context.prepare(conversation_history)
         
-        # Generate response (run in executor to avoid blocking)
-        import asyncio
-        loop = asyncio.get_event_loop()
-        response_text = await loop.run_in_executor(
-            None,
-            lambda: langchain_service.generate(
-                prompt=prompt,
-                system_prompt=CHAT_SYSTEM_PROMPT,
-                conversation_history=conversation_history
-            )
+        # Generate response
+        response_text = await langchain_service.agenerate(
+            prompt=prompt,
+            system_prompt=chat_context.system_prompt(CHAT_SYSTEM_PROMPT, summary),
+            conversation_history=window,
+            route=model_router.route(Task.CHAT, request.message, len(conversation_history), override=override)
+        )
+        
+        await semantic_chat_cache.add(
+            request.message, request.language, request.formality, conversation_history, message_vector, response_text
         )
+        chat_context.schedule_summary(conversation_history + [
+            {"role": "user", "content": request.message},
+            {"role": "assistant", "content": response_text}
+        ])
         
         return ChatResponse(
             response=response_text,
             translatedText=None  # Could be enhanced to extract translation separately
         )
     
+    except SchedulerBusyError as e:
+        raise busy_error(e)
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in chat endpoint: {error_trace}")
+        logger.exception("Error in chat endpoint")
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
 
-@app.post("/create-course", response_model=CourseResponse)
-async def create_course(request: CourseRequest):
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def instant_stream_response(response_text: str) -> StreamingResponse:
+    """Stream a response that is already complete with the events of `/chat/stream`"""
+    async def instant_stream():
+        yield sse_event("token", {"content": response_text})
+        yield sse_event("done", {"response": response_text, "translatedText": None})
+    
+    return StreamingResponse(
+        instant_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, x_model_route: Optional[str] = Header(None)):
     """
-    Create a personalized German language course
+    Stream chat responses token by token using Server-Sent Events
+    
+    Emits `token` events with `{"content": ...}` as Ollama produces them,
+    followed by a single `done` event with the full response, or an `error`
+    event if generation fails. Generation is cancelled when the client disconnects.
     """
+    override = model_override(x_model_route)
+    conversation_history = build_conversation_history(request)
+    prompt = build_chat_prompt(request)
+    summary, window = await chat_context.prepare(conversation_history)
+    
+    cached, message_vector = await lookup_instant_response(
+        request.message, request.language, request.formality, conversation_history
+    )
+    if cached is not None:
+        return instant_stream_response(cached)
+    
+    # Reserve the generation slot up front so a full queue is reported as 429/503
     try:
-        # Calculate estimated number of lessons based on study hours
-        # More hours per day = more lessons
-        lessons_per_week = max(3, min(8, int(request.dailyStudyHours * 2)))
-        
-        # Build the prompt
-        goals_text = f"\nUser goals: {request.goals}" if request.goals else ""
-        
-        prompt = f"""Create a comprehensive German language course for level {request.level}.
+        ticket = await scheduler.acquire(Priority.CHAT)
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    
+    async def event_stream():
+        stream = langchain_service.astream(
+            prompt=prompt,
+            system_prompt=chat_context.system_prompt(CHAT_SYSTEM_PROMPT, summary),
+            conversation_history=window,
+            route=model_router.route(Task.CHAT, request.message, len(conversation_history), override=override)
+        )
+        chunks = []
+        try:
+            async for token in stream:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling chat generation")
+                    return
+                chunks.append(token)
+                yield sse_event("token", {"content": token})
+            response_text = "".join(chunks)
+            await semantic_chat_cache.add(
+                request.message, request.language, request.formality, conversation_history,
+                message_vector, response_text
+            )
+            chat_context.schedule_summary(conversation_history + [
+                {"role": "user", "content": request.message},
+                {"role": "assistant", "content": response_text}
+            ])
+            yield sse_event("done", {"response": response_text, "translatedText": None})
+        except Exception as e:
+            logger.error("Error in chat stream: %s", e)
+            yield sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+        finally:
+            # Closing the upstream stream aborts the generation in Ollama
+            await stream.aclose()
+            ticket.release()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Releases the slot if the stream is never started (release is idempotent)
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@app.post("/chat/sessions", response_model=ChatSessionResponse)
+async def create_chat_session(request: ChatSessionCreateRequest, x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Start a server-side chat session; later turns send only the new message
+    """
+    session_id = uuid.uuid4().hex
+    await session_store.create(session_id, x_user_id, request.language, request.formality)
+    return ChatSessionResponse(
+        sessionId=session_id,
+        language=request.language,
+        formality=request.formality,
+        messages=[]
+    )
+
+
+@app.get("/chat/sessions/{session_id}", response_model=ChatSessionResponse)
+async def get_chat_session(session_id: str, x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Get a chat session and its message history
+    """
+    session = await session_store.get(session_id, x_user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return ChatSessionResponse(**session)
 
-Requirements:
-- Level: {request.level}
-- Daily study hours: {request.dailyStudyHours}
-- Number of lessons: {lessons_per_week}
-{goals_text}
 
-Generate a complete course with {lessons_per_week} lessons covering:
-1. Vocabulary building
-2. Grammar rules appropriate for {request.level} level
-3. Practical exercises
-4. Progressive difficulty
+@app.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str, x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Delete a chat session
+    """
+    if not await session_store.delete(session_id, x_user_id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {"deleted": True}
+
+
+async def prepare_session_turn(session_id: str, request: ChatSessionMessageRequest, user_id: str) -> dict:
+    """Load a session and build the prompt context for its next turn"""
+    session = await session_store.get(session_id, user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    language = request.language or session["language"]
+    formality = request.formality or session["formality"]
+    history = session["messages"]
+    
+    # The window start only moves when the history outgrows the budget, keeping the prefix stable
+    window_start = chat_context.stable_start(history, session["windowStart"])
+    summary = await chat_context.summary_for(history, window_start)
+    return {
+        "language": language,
+        "formality": formality,
+        "history": history,
+        "window_start": window_start,
+        "system_prompt": chat_context.system_prompt(build_session_system_prompt(language, formality), summary),
+        "window": history[window_start:]
+    }
 
-Return ONLY valid JSON matching the exact structure specified."""
+
+async def finish_session_turn(session_id: str, turn: dict, message: str, response_text: str) -> None:
+    """Store a completed turn and precompute the summary for later turns"""
+    new_messages = [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": response_text}
+    ]
+    await session_store.append(
+        session_id, len(turn["history"]), new_messages,
+        turn["language"], turn["formality"], turn["window_start"]
+    )
+    chat_context.schedule_summary(turn["history"] + new_messages, turn["window_start"])
+
+
+@app.post("/chat/sessions/{session_id}", response_model=ChatResponse)
+async def chat_session_message(session_id: str, request: ChatSessionMessageRequest,
+                               x_user_id: str = Header(DEFAULT_USER_ID), x_model_route: Optional[str] = Header(None)):
+    """
+    Send a message in a chat session
+    """
+    override = model_override(x_model_route)
+    try:
+        async with session_store.turn(session_id):
+            turn = await prepare_session_turn(session_id, request, x_user_id)
+            # Instant answers skip the model but are still part of the session
+            cached, message_vector = await lookup_instant_response(
+                request.message, turn["language"], turn["formality"], turn["history"]
+            )
+            if cached is not None:
+                response_text = cached
+            else:
+                response_text = await langchain_service.agenerate(
+                    prompt=request.message,
+                    system_prompt=turn["system_prompt"],
+                    conversation_history=turn["window"],
+                    route=model_router.route(Task.CHAT, request.message, len(turn["history"]), override=override)
+                )
+                await semantic_chat_cache.add(
+                    request.message, turn["language"], turn["formality"], turn["history"], message_vector, response_text
+                )
+            await finish_session_turn(session_id, turn, request.message, response_text)
         
-        # Generate course JSON
-        course_data = langchain_service.generate_json(
-            prompt=prompt,
-            system_prompt=COURSE_SYSTEM_PROMPT
+        return ChatResponse(response=response_text, translatedText=None)
+    
+    except HTTPException:
+        raise
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        logger.exception("Error in chat session endpoint", extra={"session_id": session_id})
+        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+
+
+@app.post("/chat/sessions/{session_id}/stream")
+async def chat_session_stream(session_id: str, request: ChatSessionMessageRequest, http_request: Request,
+                              x_user_id: str = Header(DEFAULT_USER_ID), x_model_route: Optional[str] = Header(None)):
+    """
+    Send a message in a chat session and stream the response as Server-Sent Events
+    
+    Uses the same events as `/chat/stream`. The turn is stored only if the
+    response completes.
+    """
+    override = model_override(x_model_route)
+    session_turn = session_store.turn(session_id)
+    try:
+        await session_turn.acquire()
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        turn = await prepare_session_turn(session_id, request, x_user_id)
+        cached, message_vector = await lookup_instant_response(
+            request.message, turn["language"], turn["formality"], turn["history"]
         )
-        
-        # Validate and parse response
-        if not isinstance(course_data, dict):
-            raise ValueError("Invalid course data structure")
-        
-        # Calculate estimated duration
-        if "estimatedDuration" not in course_data:
-            weeks = lessons_per_week / (request.dailyStudyHours * 7)
-            course_data["estimatedDuration"] = f"{int(weeks)} weeks" if weeks < 12 else f"{int(weeks/4)} months"
-        
-        # Ensure all required fields are present
-        lessons = course_data.get("lessons", [])
-        course_response = CourseResponse(
-            courseName=course_data.get("courseName", f"German {request.level} Course"),
-            level=course_data.get("level", request.level),
-            lessons=lessons,
-            estimatedDuration=course_data.get("estimatedDuration", "8 weeks")
+        if cached is not None:
+            await finish_session_turn(session_id, turn, request.message, cached)
+            await session_turn.release()
+            return instant_stream_response(cached)
+        ticket = await scheduler.acquire(Priority.CHAT)
+    except SessionConflictError as e:
+        await session_turn.release()
+        raise HTTPException(status_code=409, detail=str(e))
+    except SchedulerBusyError as e:
+        await session_turn.release()
+        raise busy_error(e)
+    except BaseException:
+        await session_turn.release()
+        raise
+    
+    async def release() -> None:
+        ticket.release()
+        await session_turn.release()
+    
+    async def event_stream():
+        stream = langchain_service.astream(
+            prompt=request.message,
+            system_prompt=turn["system_prompt"],
+            conversation_history=turn["window"],
+            route=model_router.route(Task.CHAT, request.message, len(turn["history"]), override=override)
         )
-        
-        # Initialize progress tracking
-        course_id = "current_course"
-        course_progress[course_id] = {
-            "lessons": {},
-            "totalLessons": len(lessons)
-        }
-        
-        return course_response
+        chunks = []
+        try:
+            async for token in stream:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling chat generation", extra={"session_id": session_id})
+                    return
+                chunks.append(token)
+                yield sse_event("token", {"content": token})
+            response_text = "".join(chunks)
+            await finish_session_turn(session_id, turn, request.message, response_text)
+            await semantic_chat_cache.add(
+                request.message, turn["language"], turn["formality"], turn["history"], message_vector, response_text
+            )
+            yield sse_event("done", {"response": response_text, "translatedText": None})
+        except Exception as e:
+            logger.error("Error in chat session stream: %s", e, extra={"session_id": session_id})
+            yield sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+        finally:
+            await stream.aclose()
+            await release()
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating course: {str(e)}")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release),
+    )
+
 
+async def generate_course_single_shot(request: CourseRequest, cache_control: Optional[str],
+                                     model_override: Optional[str] = None) -> dict:
+    """Generate the whole course, all lessons included, in one completion"""
+    # Calculate estimated number of lessons based on study hours
+    lessons_per_week = lesson_count(request.dailyStudyHours)
+    
+    # Build the prompt
+    prompt = COURSE_PROMPT.format(
+        level=request.level,
+        daily_study_hours=request.dailyStudyHours,
+        lessons=lessons_per_week,
+        goals_text=goals_text(request.goals)
+    )
+    
+    # Generate course JSON
+    course_data = await langchain_service.agenerate_json(
+        prompt=prompt,
+        system_prompt=COURSE_SYSTEM_PROMPT,
+        schema=COURSE_SCHEMA,
+        use_cache=cache_enabled_for("create-course"),
+        refresh_cache=bypass_cache(cache_control),
+        priority=Priority.COURSE,
+        route=model_router.route(Task.COURSE, level=request.level, override=model_override)
+    )
+    
+    # Validate and parse response
+    if not isinstance(course_data, dict):
+        raise ValueError("Invalid course data structure")
+    
+    # Calculate estimated duration
+    if "estimatedDuration" not in course_data:
+        course_data["estimatedDuration"] = estimated_duration(lessons_per_week, request.dailyStudyHours)
+    return course_data
 
-EXERCISE_SYSTEM_PROMPT = """You are an expert German language exercise creator. Generate interactive practice exercises for German lessons.
 
-Generate exercises in JSON format with this exact structure:
-{
-  "exercises": [
-    "Exercise 1 description",
-    "Exercise 2 description",
-    "Exercise 3 description"
-  ],
-  "solutions": [
-    "Solution 1 (if applicable)",
-    "Solution 2 (if applicable)",
-    "Solution 3 (if applicable)"
-  ]
-}
+async def build_course(request: CourseRequest, cache_control: Optional[str], user_id: str,
+                       job: Optional[Job] = None,
+                       model_override: Optional[str] = None) -> Union[CourseResponse, CourseOutlineResponse]:
+    """
+    Generate, persist and return a course
+    
+    Args:
+        request: Course parameters
+        cache_control: Cache-Control header of the request
+        user_id: Owner of the course
+        job: Background job to report `outline` and `lesson` progress events to (optional)
+        model_override: Model route requested by the client instead of the routing rules (optional)
+    """
+    course_id = uuid.uuid4().hex
+    
+    if request.outlineOnly:
+        outline = await generate_outline(
+            request,
+            use_cache=cache_enabled_for("create-course"),
+            refresh_cache=bypass_cache(cache_control),
+            model_override=model_override
+        )
+        await course_store.save_course(course_id, user_id, outline)
+        await progress_store.init_course(user_id, course_id, len(outline["lessons"]))
+        if settings.course_prefetch_lessons:
+            lesson_generator.prefetch(course_id)
+        return CourseOutlineResponse(courseId=course_id, **outline)
+    
+    if settings.course_generation_mode == "fanout":
+        # Outline first, then every lesson concurrently
+        outline = await generate_outline(
+            request,
+            use_cache=cache_enabled_for("create-course"),
+            refresh_cache=bypass_cache(cache_control),
+            model_override=model_override
+        )
+        on_lesson = None
+        if job is not None:
+            await job.emit("outline", outline)
+            
+            async def on_lesson(index: int, lesson: dict) -> None:
+                await job.emit("lesson", {"lessonIndex": index, "lesson": lesson})
+        lessons = await generate_lessons(
+            outline, use_cache=cache_enabled_for("create-course"), on_lesson=on_lesson, model_override=model_override
+        )
+        course_data = {**outline, "lessons": lessons}
+    else:
+        course_data = await generate_course_single_shot(request, cache_control, model_override)
+    
+    # Ensure all required fields are present
+    lessons = course_data.get("lessons", [])
+    course_response = CourseResponse(
+        courseId=course_id,
+        courseName=course_data.get("courseName", f"German {request.level} Course"),
+        level=course_data.get("level", request.level),
+        lessons=lessons,
+        estimatedDuration=course_data.get("estimatedDuration", "8 weeks")
+    )
+    
+    # Persist the course so its lessons can be served again without regenerating
+    summaries = outline["lessons"] if settings.course_generation_mode == "fanout" else []
+    await course_store.save_course(course_id, user_id, {
+        "courseName": course_response.courseName,
+        "level": course_response.level,
+        "estimatedDuration": course_response.estimatedDuration,
+        "lessons": [
+            {"title": lesson.title, "summary": summaries[index]["summary"] if summaries else ""}
+            for index, lesson in enumerate(course_response.lessons)
+        ]
+    })
+    for index, lesson in enumerate(course_response.lessons):
+        await course_store.save_lesson(course_id, index, lesson.model_dump())
+    
+    # Initialize progress tracking
+    await progress_store.init_course(user_id, course_id, len(lessons))
+    
+    return course_response
+
+
+@app.post("/create-course", response_model=Union[CourseResponse, CourseOutlineResponse])
+async def create_course(request: CourseRequest, cache_control: Optional[str] = Header(None),
+                        x_user_id: str = Header(DEFAULT_USER_ID), x_model_route: Optional[str] = Header(None)):
+    """
+    Create a personalized German language course
+    
+    With `outlineOnly` set, only the course outline is generated and returned
+    right away; lessons are generated in the background and served from
+    `/courses/{courseId}/lessons/{lessonIndex}`.
+    """
+    override = model_override(x_model_route)
+    try:
+        return await build_course(request, cache_control, x_user_id, model_override=override)
+    
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        logger.exception("Error creating course")
+        raise HTTPException(status_code=500, detail=f"Error creating course: {str(e)}")
 
-Guidelines:
-- Create 3-5 practical exercises per lesson
-- Exercises should be relevant to the lesson content
-- Include vocabulary practice, grammar application, and sentence construction
-- Make exercises progressive in difficulty
-- Solutions should be clear and helpful
-- Exercises should be interactive and engaging
 
-Always respond with valid JSON only, no additional text."""
+@app.get("/courses/{course_id}", response_model=CourseOutlineResponse)
+async def get_course(course_id: str, http_request: Request):
+    """
+    Get a stored course outline, including which lessons are already generated
+    
+    Answers `304 Not Modified` if `If-None-Match` carries the current ETag.
+    """
+    outline = await course_store.get_outline(course_id)
+    if outline is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    generated = await course_store.lesson_indices(course_id)
+    lessons = [
+        LessonOutline(title=lesson["title"], summary=lesson.get("summary", ""), generated=index in generated)
+        for index, lesson in enumerate(outline["lessons"])
+    ]
+    course = CourseOutlineResponse(
+        courseId=course_id,
+        courseName=outline["courseName"],
+        level=outline["level"],
+        lessons=lessons,
+        estimatedDuration=outline["estimatedDuration"]
+    )
+    return conditional_response(http_request, course.model_dump())
 
 
-# In-memory progress tracking (in production, use a database)
-course_progress: dict = {}
+@app.get("/courses/{course_id}/lessons/{lesson_index}", response_model=Lesson)
+async def get_lesson(course_id: str, lesson_index: int, http_request: Request):
+    """
+    Get a lesson of a stored course, generating it first if it is not ready yet
+    
+    Answers `304 Not Modified` if `If-None-Match` carries the current ETag.
+    """
+    try:
+        lesson = await lesson_generator.get_lesson(course_id, lesson_index)
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        logger.exception("Error generating lesson", extra={"course_id": course_id, "lesson_index": lesson_index})
+        raise HTTPException(status_code=500, detail=f"Error generating lesson: {str(e)}")
+    if lesson is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    return conditional_response(http_request, Lesson.model_validate(lesson).model_dump())
+
+
+async def build_exercises(request: ExerciseRequest, cache_control: Optional[str],
+                          model_override: Optional[str] = None) -> ExerciseResponse:
+    """Serve the exercises for a lesson from the exercise bank, generating them if they are not banked"""
+    if settings.exercise_bank_enabled and not bypass_cache(cache_control):
+        banked = await exercise_bank.get(exercise_key(request))
+        CACHE_LOOKUPS.labels("exercise_bank", "hit" if banked is not None else "miss").inc()
+        if banked is not None:
+            return banked
+    
+    return await generate_lesson_exercises(
+        request,
+        use_cache=cache_enabled_for("generate-exercises"),
+        refresh_cache=bypass_cache(cache_control),
+        model_override=model_override
+    )
 
 
 @app.post("/generate-exercises", response_model=ExerciseResponse)
-async def generate_exercises(request: ExerciseRequest):
+async def generate_exercises(request: ExerciseRequest, cache_control: Optional[str] = Header(None),
+                             x_model_route: Optional[str] = Header(None)):
     """
     Generate interactive exercises for a specific lesson
     """
+    override = model_override(x_model_route)
     try:
-        import asyncio
-        loop = asyncio.get_event_loop()
-        
-        prompt = f"""Generate interactive practice exercises for German lesson {request.lessonIndex + 1}: "{request.lessonTitle}"
+        return await build_exercises(request, cache_control, override)
+    
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        logger.exception("Error generating exercises")
+        raise HTTPException(status_code=500, detail=f"Error generating exercises: {str(e)}")
 
-Lesson Content: {request.lessonContent}
 
-Vocabulary: {', '.join(request.vocabulary)}
-Grammar Rules: {', '.join(request.grammar)}
-Level: {request.level}
+def lesson_exercises_event(position: int, request: ExerciseRequest, exercises: ExerciseResponse, source: str) -> dict:
+    return {"position": position, "lessonIndex": request.lessonIndex, "source": source, **exercises.model_dump()}
 
-Create 3-5 practical exercises that:
-1. Practice the vocabulary from this lesson
-2. Apply the grammar rules
-3. Build sentence construction skills
-4. Are appropriate for {request.level} level
 
-Return ONLY valid JSON matching the exact structure specified."""
-        
-        exercise_data = await loop.run_in_executor(
-            None,
-            lambda: langchain_service.generate_json(
-                prompt=prompt,
-                system_prompt=EXERCISE_SYSTEM_PROMPT
-            )
+@app.post("/generate-exercises/batch")
+async def generate_exercises_for_lessons(request: ExerciseBatchRequest, http_request: Request,
+                                         cache_control: Optional[str] = Header(None),
+                                         x_model_route: Optional[str] = Header(None)):
+    """
+    Generate exercises for several lessons, streamed as Server-Sent Events
+    
+    Emits an `exercises` event per lesson as soon as it is ready, with its
+    `position` in the request, `lessonIndex`, `source` (`bank` or `generated`),
+    `exercises` and `solutions`. A lesson that fails gets an `error` event with
+    `position`, `lessonIndex`, `status` and `detail` instead. The stream ends
+    with a `done` event counting the lessons and failures.
+    """
+    override = model_override(x_model_route)
+    lessons = request.lessons
+    if not lessons:
+        raise HTTPException(status_code=400, detail="No lessons given")
+    if len(lessons) > settings.exercise_batch_request_limit:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.exercise_batch_request_limit} lessons per request"
         )
+    
+    banked = {}
+    if settings.exercise_bank_enabled and not bypass_cache(cache_control):
+        for position, lesson in enumerate(lessons):
+            exercises = await exercise_bank.get(exercise_key(lesson))
+            CACHE_LOOKUPS.labels("exercise_bank", "hit" if exercises is not None else "miss").inc()
+            if exercises is not None:
+                banked[position] = exercises
+    pending = [position for position in range(len(lessons)) if position not in banked]
+    
+    async def event_stream():
+        for position, exercises in banked.items():
+            yield sse_event("exercises", lesson_exercises_event(position, lessons[position], exercises, "bank"))
         
-        if not isinstance(exercise_data, dict):
-            raise ValueError("Invalid exercise data structure")
-        
-        return ExerciseResponse(
-            exercises=exercise_data.get("exercises", []),
-            solutions=exercise_data.get("solutions", [])
+        failed = 0
+        results = generate_exercises_batch(
+            [lessons[position] for position in pending],
+            use_cache=cache_enabled_for("generate-exercises"),
+            refresh_cache=bypass_cache(cache_control),
+            model_override=override
         )
+        try:
+            async for index, exercises, error in results:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling exercise generation")
+                    return
+                position = pending[index]
+                if error is None:
+                    yield sse_event("exercises", lesson_exercises_event(position, lessons[position], exercises, "generated"))
+                    continue
+                failed += 1
+                status = error.status_code if isinstance(error, SchedulerBusyError) else 500
+                logger.warning("Error generating exercises for lesson %d: %s", lessons[position].lessonIndex, error)
+                yield sse_event("error", {
+                    "position": position,
+                    "lessonIndex": lessons[position].lessonIndex,
+                    "status": status,
+                    "detail": f"Error generating exercises: {str(error)}"
+                })
+        finally:
+            await results.aclose()
+        yield sse_event("done", {"lessons": len(lessons), "failed": failed})
     
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error generating exercises: {error_trace}")
-        raise HTTPException(status_code=500, detail=f"Error generating exercises: {str(e)}")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/update-progress", response_model=ProgressResponse)
-async def update_progress(request: ProgressRequest):
+async def update_progress(request: ProgressRequest, x_user_id: str = Header(DEFAULT_USER_ID)):
     """
     Update user progress for a lesson or exercise
     """
     try:
-        # In-memory storage (use database in production)
-        course_id = "current_course"  # In production, use actual course ID
-        
-        if course_id not in course_progress:
-            course_progress[course_id] = {
-                "lessons": {},
-                "totalLessons": 0
-            }
-        
-        if request.lessonIndex not in course_progress[course_id]["lessons"]:
-            course_progress[course_id]["lessons"][request.lessonIndex] = {
-                "completed": False,
-                "exercises": {}
-            }
-        
-        if request.completed:
-            course_progress[course_id]["lessons"][request.lessonIndex]["completed"] = True
-            
-            if request.exerciseIndex is not None:
-                course_progress[course_id]["lessons"][request.lessonIndex]["exercises"][request.exerciseIndex] = True
-        
-        # Calculate overall progress
-        total_lessons = course_progress[course_id].get("totalLessons", 0)
-        completed_lessons = sum(
-            1 for lesson in course_progress[course_id]["lessons"].values()
-            if lesson.get("completed", False)
+        progress = await progress_store.update(
+            user_id=x_user_id,
+            course_id=request.courseId,
+            lesson_index=request.lessonIndex,
+            exercise_index=request.exerciseIndex,
+            completed=request.completed
         )
         
-        progress = completed_lessons / total_lessons if total_lessons > 0 else 0.0
-        
         return ProgressResponse(
             lessonIndex=request.lessonIndex,
             completed=request.completed,
@@ -333,36 +900,104 @@ async def update_progress(request: ProgressRequest):
         )
     
     except Exception as e:
+        logger.exception("Error updating progress")
         raise HTTPException(status_code=500, detail=f"Error updating progress: {str(e)}")
 
 
 @app.get("/get-progress")
-async def get_progress():
+async def get_progress(http_request: Request, courseId: str,
+                       x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Get user progress for a course
+    
+    Answers `304 Not Modified` if `If-None-Match` carries the current ETag.
     """
-    Get user progress for the current course
+    return conditional_response(http_request, await progress_store.get(x_user_id, courseId))
+
+
+async def submit_job(kind: str, user_id: str, payload: dict, run) -> JobResponse:
+    """Queue a background job and describe it to the client"""
+    try:
+        job, coalesced = await job_manager.submit(kind, user_id, payload, run)
+    except SchedulerBusyError as e:
+        raise busy_error(e)
+    return JobResponse(coalesced=coalesced, **job.to_dict())
+
+
+@app.post("/jobs/create-course", response_model=JobResponse, status_code=202)
+async def create_course_job(request: CourseRequest, cache_control: Optional[str] = Header(None),
+                            x_user_id: str = Header(DEFAULT_USER_ID), x_model_route: Optional[str] = Header(None)):
+    """
+    Create a course in the background; poll `/jobs/{jobId}` or follow `/jobs/{jobId}/events`
     """
-    course_id = "current_course"
-    if course_id not in course_progress:
-        return {"progress": 0.0, "lessons": {}}
+    override = model_override(x_model_route)
     
-    total_lessons = course_progress[course_id].get("totalLessons", 0)
-    completed_lessons = sum(
-        1 for lesson in course_progress[course_id]["lessons"].values()
-        if lesson.get("completed", False)
-    )
+    async def run(job: Job) -> dict:
+        course = await build_course(request, cache_control, x_user_id, job, model_override=override)
+        return course.model_dump()
     
-    progress = completed_lessons / total_lessons if total_lessons > 0 else 0.0
+    payload = {**request.model_dump(), "refresh": bypass_cache(cache_control), "modelRoute": override}
+    return await submit_job("create-course", x_user_id, payload, run)
+
+
+@app.post("/jobs/generate-exercises", response_model=JobResponse, status_code=202)
+async def generate_exercises_job(request: ExerciseRequest, cache_control: Optional[str] = Header(None),
+                                 x_user_id: str = Header(DEFAULT_USER_ID), x_model_route: Optional[str] = Header(None)):
+    """
+    Generate exercises in the background; poll `/jobs/{jobId}` or follow `/jobs/{jobId}/events`
+    """
+    override = model_override(x_model_route)
     
-    return {
-        "progress": progress,
-        "lessons": course_progress[course_id]["lessons"]
-    }
+    async def run(job: Job) -> dict:
+        exercises = await build_exercises(request, cache_control, override)
+        return exercises.model_dump()
+    
+    payload = {**request.model_dump(), "refresh": bypass_cache(cache_control), "modelRoute": override}
+    return await submit_job("generate-exercises", x_user_id, payload, run)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Get the status of a background job, with its result once it has succeeded
+    """
+    job = await job_manager.get(job_id, x_user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job.to_dict())
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request, x_user_id: str = Header(DEFAULT_USER_ID)):
+    """
+    Follow a background job as Server-Sent Events
+    
+    Replays the events so far, then streams new ones: `queued`, `running`,
+    `outline` and `lesson` (course jobs), `waiting` (scheduler busy, will retry),
+    and finally `succeeded` with the result or `failed` with the error.
+    """
+    job = await job_manager.get(job_id, x_user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for event, data in job.subscribe():
+            if await http_request.is_disconnected():
+                return
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 if __name__ == "__main__":
+    # Development server; use `python -m app.server` in production
     import uvicorn
     uvicorn.run(
-        app,
+        "app.main:app",
         host=settings.api_host,
         port=settings.api_port,
         reload=True
@@ -0,0 +1,154 @@
+"""Prometheus metrics and the HTTP latency middleware"""
+import os
+import time
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body chunk is sent",
+    ["method", "endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", multiprocess_mode="livesum"
+)
+QUEUE_WAIT = Histogram(
+    "generation_queue_wait_seconds", "Time spent waiting for a generation slot",
+    ["priority"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_REJECTIONS = Counter(
+    "generation_queue_rejections_total", "Generations rejected by the scheduler", ["priority", "reason"]
+)
+OLLAMA_DURATION = Histogram(
+    "ollama_request_duration_seconds", "Duration of Ollama calls", ["mode"], buckets=LATENCY_BUCKETS,
+)
+OLLAMA_TIME_TO_FIRST_TOKEN = Histogram(
+    "ollama_time_to_first_token_seconds", "Time until Ollama streams the first token", buckets=LATENCY_BUCKETS,
+)
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "ollama_tokens_per_second", "Completion tokens per second of Ollama evaluation time",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200),
+)
+OLLAMA_PROMPT_TOKENS = Histogram("ollama_prompt_tokens", "Prompt tokens per Ollama call", buckets=TOKEN_BUCKETS)
+OLLAMA_COMPLETION_TOKENS = Histogram(
+    "ollama_completion_tokens", "Completion tokens per Ollama call", buckets=TOKEN_BUCKETS
+)
+OLLAMA_ERRORS = Counter("ollama_errors_total", "Failed Ollama calls", ["kind"])
+JSON_PARSE_RESULTS = Counter(
+    "json_parse_total", "Outcome of parsing model JSON output (ok, repaired, failed)", ["result"]
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+MODEL_ROUTING_DECISIONS = Counter(
+    "model_routing_decisions_total", "Model route chosen per generation, by rule, override or default",
+    ["task", "route", "reason"]
+)
+FAST_PATH_RESULTS = Counter(
+    "chat_fast_path_total", "Chat turns answered without the model (lookup, formality) or not (fallback)", ["result"]
+)
+
+
+def observe_ollama_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                          eval_seconds: Optional[float] = None) -> None:
+    if prompt_tokens is not None:
+        OLLAMA_PROMPT_TOKENS.observe(prompt_tokens)
+    if completion_tokens is not None:
+        OLLAMA_COMPLETION_TOKENS.observe(completion_tokens)
+        if eval_seconds:
+            OLLAMA_TOKENS_PER_SECOND.observe(completion_tokens / eval_seconds)
+
+
+def observe_ollama_metadata(metadata: Optional[dict], usage: Optional[dict] = None) -> bool:
+    """
+    Record token counts and throughput from the metadata of a finished Ollama response
+    
+    Args:
+        metadata: `response_metadata` of a response or stream chunk
+        usage: `usage_metadata` of the same message, used when the metadata lacks counts
+    
+    Returns:
+        True if this was the final response (a stream chunk with `done`)
+    """
+    if not metadata or not metadata.get("done"):
+        return False
+    usage = usage or {}
+    prompt_tokens = metadata.get("prompt_eval_count")
+    completion_tokens = metadata.get("eval_count")
+    eval_duration = metadata.get("eval_duration")  # nanoseconds
+    observe_ollama_tokens(
+        prompt_tokens if prompt_tokens is not None else usage.get("input_tokens"),
+        completion_tokens if completion_tokens is not None else usage.get("output_tokens"),
+        eval_duration / 1e9 if eval_duration else None,
+    )
+    return True
+
+
+def metrics_response() -> tuple:
+    """
+    Return `(body, content_type)` in the Prometheus text format
+    
+    With several worker processes (`PROMETHEUS_MULTIPROC_DIR` set by
+    `python -m app.server`) the values of all workers are aggregated.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped() -> None:
+    """Drop the live gauges of this worker process from the aggregated metrics"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """
+    Record latency per endpoint for every HTTP request
+    
+    Implemented as plain ASGI middleware so streamed responses are timed
+    until their last chunk. Endpoints are labelled by route template
+    (`/courses/{course_id}`) to keep label cardinality bounded.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status = {"code": 500}
+        recorded = False
+        
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], endpoint, str(status["code"])).observe(
+                time.perf_counter() - started
+            )
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+        
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            record()
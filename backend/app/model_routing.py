@@ -0,0 +1,148 @@
+"""Choosing the model and generation options for each generation"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional
+from app.config import settings
+from app.metrics import MODEL_ROUTING_DECISIONS
+
+
+DEFAULT_ROUTE = "default"
+
+
+class Task(str, Enum):
+    """Kinds of generation a routing rule can match"""
+    CHAT = "chat"
+    SUMMARY = "summary"
+    COURSE = "course"  # a whole course in one completion
+    OUTLINE = "outline"
+    LESSON = "lesson"
+    EXERCISES = "exercises"
+
+
+class UnknownRouteError(ValueError):
+    """Raised when a request asks for a route that is not configured"""
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    name: str
+    model: str
+    temperature: float
+    num_predict: Optional[int] = None  # maximum completion tokens, None = model default
+    
+    def invoke_kwargs(self) -> dict:
+        """Per-call overrides for ChatOllama (replace its default options)"""
+        options = {"temperature": self.temperature}
+        if self.num_predict is not None:
+            options["num_predict"] = self.num_predict
+        return {"model": self.model, "options": options}
+    
+    @property
+    def cache_model(self) -> str:
+        """Model identity for response cache keys; a token limit changes the output"""
+        return self.model if self.num_predict is None else f"{self.model}:num_predict={self.num_predict}"
+
+
+class ModelRouter:
+    """
+    Map a generation to a configured model route
+    
+    Routes are named models with options (`MODEL_ROUTES`); the `default` route
+    is `OLLAMA_MODEL` with `OLLAMA_TEMPERATURE` unless configured explicitly.
+    Rules (`MODEL_ROUTING_RULES`) are checked in order and the first one whose
+    conditions all hold picks the route:
+    
+    - `task`: task name or list of names (`chat`, `summary`, `course`, `outline`, `lesson`, `exercises`)
+    - `max_message_chars` / `min_message_chars`: length of the user message
+    - `max_history`: previous messages in the conversation
+    - `levels`: course levels, e.g. `["A1", "A2"]`
+    
+    Without a matching rule the default route is used.
+    """
+    
+    def __init__(self, routes: Dict[str, dict], rules: List[dict], default_model: str, default_temperature: float):
+        self.routes: Dict[str, ModelRoute] = {
+            DEFAULT_ROUTE: ModelRoute(DEFAULT_ROUTE, default_model, default_temperature)
+        }
+        for name, options in routes.items():
+            self.routes[name] = ModelRoute(
+                name=name,
+                model=options.get("model", default_model),
+                temperature=options.get("temperature", default_temperature),
+                num_predict=options.get("num_predict"),
+            )
+        # Rules for routes that are not configured are inactive, so the built-in
+        # rules for `small` only take effect once a `small` route exists
+        self.rules = [rule for rule in rules if rule.get("route") in self.routes]
+    
+    @property
+    def default(self) -> ModelRoute:
+        return self.routes[DEFAULT_ROUTE]
+    
+    def models(self) -> List[str]:
+        """Distinct models of all routes, the default first"""
+        return list(dict.fromkeys(route.model for route in self.routes.values()))
+    
+    def check(self, name: Optional[str]) -> Optional[str]:
+        """Validate a requested route name; raises UnknownRouteError"""
+        if name is not None and name not in self.routes:
+            raise UnknownRouteError(f"Unknown model route '{name}', configured: {', '.join(self.routes)}")
+        return name
+    
+    @staticmethod
+    def _matches(rule: dict, task: Task, message_chars: int, history: int, level: Optional[str]) -> bool:
+        tasks = rule.get("task")
+        if tasks is not None and task.value not in ([tasks] if isinstance(tasks, str) else tasks):
+            return False
+        if "max_message_chars" in rule and message_chars > rule["max_message_chars"]:
+            return False
+        if "min_message_chars" in rule and message_chars < rule["min_message_chars"]:
+            return False
+        if "max_history" in rule and history > rule["max_history"]:
+            return False
+        if "levels" in rule and (level or "").upper() not in [value.upper() for value in rule["levels"]]:
+            return False
+        return True
+    
+    def route(self, task: Task, message: str = "", history: int = 0, level: Optional[str] = None,
+              override: Optional[str] = None) -> ModelRoute:
+        """
+        Pick the route for a generation
+        
+        Args:
+            task: Kind of generation
+            message: User message the generation answers (optional)
+            history: Number of previous conversation messages (optional)
+            level: Course level (optional)
+            override: Route name requested by the client, wins over the rules (optional)
+        
+        Returns:
+            The chosen route
+        """
+        if override is not None:
+            route, reason = self.routes[self.check(override)], "override"
+        else:
+            rule = next(
+                (rule for rule in self.rules if self._matches(rule, task, len(message), history, level)), None
+            )
+            route, reason = (self.routes[rule["route"]], "rule") if rule else (self.default, "default")
+        MODEL_ROUTING_DECISIONS.labels(task.value, route.name, reason).inc()
+        return route
+    
+    def stats(self) -> dict:
+        return {
+            "routes": {
+                name: {"model": route.model, "temperature": route.temperature, "numPredict": route.num_predict}
+                for name, route in self.routes.items()
+            },
+            "rules": self.rules,
+        }
+
+
+# Global instance
+model_router = ModelRouter(
+    routes=settings.model_routes,
+    rules=settings.model_routing_rules,
+    default_model=settings.ollama_model,
+    default_temperature=settings.ollama_temperature,
+)
@@ -27,6 +27,27 @@ class ChatResponse(BaseModel):
     translatedText: Optional[str] = None
 
 
+class ChatSessionCreateRequest(BaseModel):
+    """Chat session creation request"""
+    language: str  # 'en-de' or 'de-en'
+    formality: str  # 'du' or 'sie'
+
+
+class ChatSessionMessageRequest(BaseModel):
+    """New message in a chat session; language/formality override the session settings"""
+    message: str
+    language: Optional[str] = None
+    formality: Optional[str] = None
+
+
+class ChatSessionResponse(BaseModel):
+    """Chat session with its message history"""
+    sessionId: str
+    language: str
+    formality: str
+    messages: List[ChatMessage]
+
+
 class CourseRequest(BaseModel):
     """Course creation request model"""
     model_config = ConfigDict(populate_by_name=True)
@@ -34,6 +55,7 @@ class CourseRequest(BaseModel):
     level: str  # 'A1', 'A2', 'B1', 'B2', 'C1'
     dailyStudyHours: float
     goals: Optional[str] = None
+    outlineOnly: bool = False  # return the outline now, generate lessons lazily
 
 
 class Lesson(BaseModel):
@@ -49,12 +71,31 @@ class CourseResponse(BaseModel):
     """Course response model"""
     model_config = ConfigDict(populate_by_name=True)
     
+    courseId: Optional[str] = None
     courseName: str
     level: str
     lessons: List[Lesson]
     estimatedDuration: str
 
 
+class LessonOutline(BaseModel):
+    """Lesson entry of a course outline"""
+    title: str
+    summary: str = ""
+    generated: bool = False
+
+
+class CourseOutlineResponse(BaseModel):
+    """Course outline returned before lessons are generated"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    courseId: str
+    courseName: str
+    level: str
+    lessons: List[LessonOutline]
+    estimatedDuration: str
+
+
 class ExerciseRequest(BaseModel):
     """Exercise generation request"""
     lessonIndex: int
@@ -71,8 +112,26 @@ class ExerciseResponse(BaseModel):
     solutions: Optional[List[str]] = None
 
 
+class ExerciseBatchRequest(BaseModel):
+    """Exercise generation request for several lessons at once"""
+    lessons: List[ExerciseRequest]
+
+
+class LessonExercises(BaseModel):
+    """Exercises of one lesson in a batch"""
+    lessonIndex: int
+    exercises: List[str]
+    solutions: Optional[List[str]] = None
+
+
+class ExerciseBatch(BaseModel):
+    """Exercises for several lessons generated in one completion"""
+    lessons: List[LessonExercises]
+
+
 class ProgressRequest(BaseModel):
     """Progress update request"""
+    courseId: str
     lessonIndex: int
     exerciseIndex: Optional[int] = None
     completed: bool
@@ -84,3 +143,14 @@ class ProgressResponse(BaseModel):
     completed: bool
     progress: float  # 0.0 to 1.0
 
+
+class JobResponse(BaseModel):
+    """Background job status"""
+    jobId: str
+    kind: str  # 'create-course' or 'generate-exercises'
+    status: str  # 'queued', 'running', 'succeeded' or 'failed'
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    createdAt: float
+    finishedAt: Optional[float] = None
+    coalesced: bool = False  # True if attached to an identical job already in flight
@@ -0,0 +1,135 @@
+"""Pool of Ollama backends with least-outstanding routing and health checks"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Set
+import httpx
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_connection_error(e: BaseException) -> bool:
+    """Return True if an exception means the backend could not be reached"""
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, ConnectionError)):
+        return True
+    error_msg = str(e)
+    return "10061" in error_msg or "refused" in error_msg.lower() or "ConnectError" in error_msg
+
+
+class OllamaBackend:
+    """A single Ollama node and its routing state"""
+    
+    def __init__(self, base_url: str, llm, embeddings=None):
+        self.base_url = base_url.rstrip("/")
+        self.llm = llm
+        self.embeddings = embeddings
+        self.outstanding = 0
+        self.healthy = True
+        self.warm = False
+        self.consecutive_failures = 0
+        self.last_checked: Optional[float] = None
+    
+    def stats(self) -> dict:
+        return {
+            "baseUrl": self.base_url,
+            "healthy": self.healthy,
+            "warm": self.warm,
+            "outstanding": self.outstanding,
+            "consecutiveFailures": self.consecutive_failures,
+        }
+
+
+class NoBackendAvailableError(Exception):
+    """Raised when every backend has already been tried for a request"""
+
+
+class OllamaPool:
+    """
+    Route requests to the Ollama backend with the fewest outstanding requests
+    
+    Backends that fail a connection or a health probe are ejected and are
+    re-admitted once a periodic probe against `/api/tags` succeeds again.
+    """
+    
+    def __init__(self, backends: List[OllamaBackend], health_check_interval: float):
+        if not backends:
+            raise ValueError("At least one Ollama backend is required")
+        self.backends = backends
+        self.health_check_interval = health_check_interval
+        self._health_task: Optional[asyncio.Task] = None
+    
+    @property
+    def primary(self) -> OllamaBackend:
+        return self.backends[0]
+    
+    def pick(self, exclude: Set[str]) -> OllamaBackend:
+        """Pick the least loaded healthy backend that has not been tried yet"""
+        candidates = [b for b in self.backends if b.base_url not in exclude]
+        if not candidates:
+            raise NoBackendAvailableError(
+                f"All Ollama backends failed: {', '.join(b.base_url for b in self.backends)}"
+            )
+        healthy = [b for b in candidates if b.healthy]
+        # If every node looks unhealthy, still try one rather than failing outright
+        return min(healthy or candidates, key=lambda b: b.outstanding)
+    
+    def mark_failed(self, backend: OllamaBackend) -> None:
+        backend.consecutive_failures += 1
+        if backend.healthy:
+            logger.warning("Ejecting Ollama backend after connection failure", extra={"backend": backend.base_url})
+        backend.healthy = False
+    
+    def mark_succeeded(self, backend: OllamaBackend) -> None:
+        backend.consecutive_failures = 0
+        if not backend.healthy:
+            logger.info("Ollama backend is healthy again", extra={"backend": backend.base_url})
+        backend.healthy = True
+    
+    @contextmanager
+    def lease(self, exclude: Set[str]) -> Iterator[OllamaBackend]:
+        """Reserve a backend for the duration of one request"""
+        backend = self.pick(exclude)
+        backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+    
+    async def probe(self, client: httpx.AsyncClient, backend: OllamaBackend) -> bool:
+        """Check a backend by listing its models"""
+        backend.last_checked = time.time()
+        try:
+            response = await client.get(f"{backend.base_url}/api/tags")
+            response.raise_for_status()
+        except Exception as e:
+            if backend.healthy:
+                logger.warning("Health probe failed: %s", e, extra={"backend": backend.base_url})
+            self.mark_failed(backend)
+            return False
+        self.mark_succeeded(backend)
+        return True
+    
+    async def _health_loop(self) -> None:
+        async with httpx.AsyncClient(timeout=settings.ollama_health_check_timeout) as client:
+            while True:
+                await asyncio.gather(*(self.probe(client, b) for b in self.backends))
+                await asyncio.sleep(self.health_check_interval)
+    
+    def start_health_checks(self) -> None:
+        if self._health_task is None and self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+    
+    def stats(self) -> List[dict]:
+        return [b.stats() for b in self.backends]
@@ -0,0 +1,247 @@
+"""Persistent, multi-user course progress storage"""
+import abc
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+import aiosqlite
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressStore(abc.ABC):
+    """Interface for progress storage keyed by user and course ID"""
+    
+    async def open(self) -> None:
+        pass
+    
+    async def close(self) -> None:
+        pass
+    
+    @abc.abstractmethod
+    async def init_course(self, user_id: str, course_id: str, total_lessons: int) -> None:
+        """Register a course and its lesson count"""
+    
+    @abc.abstractmethod
+    async def update(self, user_id: str, course_id: str, lesson_index: int,
+                     exercise_index: Optional[int], completed: bool) -> float:
+        """Record lesson/exercise progress and return overall course progress (0.0 to 1.0)"""
+    
+    @abc.abstractmethod
+    async def get(self, user_id: str, course_id: str) -> dict:
+        """Return `{"progress": float, "lessons": {index: {"completed", "exercises"}}}`"""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS course_progress (
+    user_id TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    total_lessons INTEGER NOT NULL DEFAULT 0,
+    completed_lessons INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, course_id)
+);
+CREATE TABLE IF NOT EXISTS lesson_progress (
+    user_id TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    lesson_index INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, course_id, lesson_index)
+);
+CREATE TABLE IF NOT EXISTS exercise_progress (
+    user_id TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    lesson_index INTEGER NOT NULL,
+    exercise_index INTEGER NOT NULL,
+    PRIMARY KEY (user_id, course_id, lesson_index, exercise_index)
+);
+"""
+
+
+class SQLiteProgressStore(ProgressStore):
+    """
+    Progress store on SQLite in WAL mode, safe to share between worker processes
+    
+    Updates are queued and committed in batches by a single writer task, so a
+    burst of `/update-progress` calls costs one transaction instead of one per
+    call. The number of completed lessons per course is maintained as a counter
+    when a lesson flips to completed, so reads never have to re-count lessons.
+    Writes outside the batches share the writer's connection and take
+    `_write_lock`, so they never commit or roll back part of a batch.
+    """
+    
+    def __init__(self, path: str, batch_size: int, flush_interval: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db: Optional[aiosqlite.Connection] = None
+        self._queue: "asyncio.Queue[Tuple[tuple, asyncio.Future]]" = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+    
+    async def open(self) -> None:
+        if self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+        self._writer = asyncio.create_task(self._write_loop())
+    
+    async def close(self) -> None:
+        if self._writer is not None:
+            # Let the writer drain everything that is already queued
+            await self._queue.join()
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            await self.open()
+        return self._db
+    
+    async def init_course(self, user_id: str, course_id: str, total_lessons: int) -> None:
+        db = await self._connection()
+        async with self._write_lock:
+            await db.execute(
+                "INSERT INTO course_progress (user_id, course_id, total_lessons) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, course_id) DO UPDATE SET total_lessons = excluded.total_lessons",
+                (user_id, course_id, total_lessons),
+            )
+            await db.commit()
+    
+    async def update(self, user_id: str, course_id: str, lesson_index: int,
+                     exercise_index: Optional[int], completed: bool) -> float:
+        await self._connection()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((user_id, course_id, lesson_index, exercise_index, completed), future))
+        return await future
+    
+    async def _write_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Collect more updates for a short window to commit them together
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await self._apply_batch([update for update, _ in batch])
+                for (_, future), progress in zip(batch, results):
+                    if not future.done():
+                        future.set_result(progress)
+            except Exception as e:
+                logger.error("Error writing progress batch: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _apply_batch(self, updates: List[tuple]) -> List[float]:
+        async with self._write_lock:
+            await self._write_batch(updates)
+        
+        # Read back progress once per course touched by this batch
+        progress: Dict[Tuple[str, str], float] = {}
+        for user_id, course_id, *_ in updates:
+            key = (user_id, course_id)
+            if key not in progress:
+                progress[key] = await self._progress(user_id, course_id)
+        return [progress[(user_id, course_id)] for user_id, course_id, *_ in updates]
+    
+    async def _write_batch(self, updates: List[tuple]) -> None:
+        db = self._db
+        try:
+            for user_id, course_id, lesson_index, exercise_index, completed in updates:
+                await db.execute(
+                    "INSERT OR IGNORE INTO course_progress (user_id, course_id) VALUES (?, ?)",
+                    (user_id, course_id),
+                )
+                if not completed:
+                    await db.execute(
+                        "INSERT OR IGNORE INTO lesson_progress (user_id, course_id, lesson_index) "
+                        "VALUES (?, ?, ?)",
+                        (user_id, course_id, lesson_index),
+                    )
+                    continue
+                cursor = await db.execute(
+                    "INSERT INTO lesson_progress (user_id, course_id, lesson_index, completed) "
+                    "VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (user_id, course_id, lesson_index) DO UPDATE SET completed = 1 "
+                    "WHERE lesson_progress.completed = 0",
+                    (user_id, course_id, lesson_index),
+                )
+                if cursor.rowcount > 0:
+                    # Lesson newly completed
+                    await db.execute(
+                        "UPDATE course_progress SET completed_lessons = completed_lessons + 1 "
+                        "WHERE user_id = ? AND course_id = ?",
+                        (user_id, course_id),
+                    )
+                if exercise_index is not None:
+                    await db.execute(
+                        "INSERT OR IGNORE INTO exercise_progress "
+                        "(user_id, course_id, lesson_index, exercise_index) VALUES (?, ?, ?, ?)",
+                        (user_id, course_id, lesson_index, exercise_index),
+                    )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    async def _progress(self, user_id: str, course_id: str) -> float:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT total_lessons, completed_lessons FROM course_progress "
+            "WHERE user_id = ? AND course_id = ?",
+            (user_id, course_id),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row[0] <= 0:
+            return 0.0
+        return min(1.0, row[1] / row[0])
+    
+    async def get(self, user_id: str, course_id: str) -> dict:
+        db = await self._connection()
+        lessons: Dict[int, dict] = {}
+        async with db.execute(
+            "SELECT lesson_index, completed FROM lesson_progress WHERE user_id = ? AND course_id = ?",
+            (user_id, course_id),
+        ) as cursor:
+            async for lesson_index, completed in cursor:
+                lessons[lesson_index] = {"completed": bool(completed), "exercises": {}}
+        async with db.execute(
+            "SELECT lesson_index, exercise_index FROM exercise_progress WHERE user_id = ? AND course_id = ?",
+            (user_id, course_id),
+        ) as cursor:
+            async for lesson_index, exercise_index in cursor:
+                lessons.setdefault(lesson_index, {"completed": False, "exercises": {}})
+                lessons[lesson_index]["exercises"][exercise_index] = True
+        return {
+            "progress": await self._progress(user_id, course_id),
+            "lessons": lessons,
+        }
+
+
+# Global instance
+progress_store: ProgressStore = SQLiteProgressStore(
+    settings.progress_db_path,
+    batch_size=settings.progress_batch_size,
+    flush_interval=settings.progress_flush_interval,
+)
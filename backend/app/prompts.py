@@ -0,0 +1,130 @@
+"""Prompt templates, parsed once at import time and reused for every request"""
+from typing import Dict, List, Optional
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+
+
+# Message layout of every generation: optional system prompt, history, current user turn
+CONVERSATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "{system_prompt}"),
+    MessagesPlaceholder("history", optional=True),
+    ("human", "{prompt}"),
+])
+
+USER_PROMPT = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder("history", optional=True),
+    ("human", "{prompt}"),
+])
+
+
+def build_messages(prompt: str, system_prompt: Optional[str] = None,
+                   conversation_history: Optional[List[Dict[str, str]]] = None) -> list:
+    """Build the LangChain message list for a prompt"""
+    history = [
+        (msg["role"], msg["content"])
+        for msg in conversation_history or []
+        if msg["role"] in ("user", "assistant")
+    ]
+    if system_prompt:
+        return CONVERSATION_PROMPT.format_messages(system_prompt=system_prompt, history=history, prompt=prompt)
+    return USER_PROMPT.format_messages(history=history, prompt=prompt)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+# Chat tutor instructions per language direction
+CHAT_INSTRUCTIONS = {
+    # User wants to practice English -> German
+    "en-de": PromptTemplate.from_template("""Please respond as a German tutor. The user is practicing translating from English to German.
+- Formality level: {formality}
+- Provide the German translation and explanation
+- If they're asking a question, answer in German using the appropriate formality level
+- Be encouraging and provide corrections if needed"""),
+    # de-en: user wants to practice German -> English (or English -> German response)
+    "de-en": PromptTemplate.from_template("""Please respond as a German tutor. The user is practicing German.
+- Formality level: {formality}
+- Respond in German using the appropriate formality level
+- Provide explanations, corrections, or translations as needed
+- Be encouraging and supportive"""),
+}
+
+CHAT_PROMPT = PromptTemplate.from_template("""User message: {message}
+
+{instructions}""")
+
+COURSE_PROMPT = PromptTemplate.from_template("""Create a comprehensive German language course for level {level}.
+
+Requirements:
+- Level: {level}
+- Daily study hours: {daily_study_hours}
+- Number of lessons: {lessons}
+{goals_text}
+
+Generate a complete course with {lessons} lessons covering:
+1. Vocabulary building
+2. Grammar rules appropriate for {level} level
+3. Practical exercises
+4. Progressive difficulty
+
+Return ONLY valid JSON matching the exact structure specified.""")
+
+OUTLINE_PROMPT = PromptTemplate.from_template("""Plan a German language course for level {level}.
+
+Requirements:
+- Level: {level}
+- Daily study hours: {daily_study_hours}
+- Number of lessons: {lessons}
+{goals_text}
+
+Return ONLY valid JSON matching the exact structure specified.""")
+
+LESSON_PROMPT = PromptTemplate.from_template("""Course: {course_name} (level {level})
+
+Course plan:
+{titles}
+
+Write lesson {lesson_number}: "{lesson_title}"
+Summary: {lesson_summary}
+
+Return ONLY valid JSON matching the exact structure specified.""")
+
+EXERCISE_PROMPT = PromptTemplate.from_template("""Generate interactive practice exercises for German lesson {lesson_number}: "{lesson_title}"
+
+Lesson Content: {lesson_content}
+
+Vocabulary: {vocabulary}
+Grammar Rules: {grammar}
+Level: {level}
+
+Create 3-5 practical exercises that:
+1. Practice the vocabulary from this lesson
+2. Apply the grammar rules
+3. Build sentence construction skills
+4. Are appropriate for {level} level
+
+Return ONLY valid JSON matching the exact structure specified.""")
+
+EXERCISE_BATCH_LESSON = PromptTemplate.from_template("""Lesson {lesson_number}: "{lesson_title}" (lessonIndex {lesson_index})
+Lesson Content: {lesson_content}
+Vocabulary: {vocabulary}
+Grammar Rules: {grammar}
+Level: {level}""")
+
+EXERCISE_BATCH_PROMPT = PromptTemplate.from_template("""Generate interactive practice exercises for each of these {count} German lessons:
+
+{lessons}
+
+For every lesson, create 3-5 practical exercises that:
+1. Practice the vocabulary from that lesson
+2. Apply its grammar rules
+3. Build sentence construction skills
+4. Are appropriate for its level
+
+Return one entry per lesson with the lessonIndex given above.
+Return ONLY valid JSON matching the exact structure specified.""")
+
+
+def goals_text(goals: Optional[str]) -> str:
+    return f"\nUser goals: {goals}" if goals else ""
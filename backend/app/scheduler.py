@@ -0,0 +1,387 @@
+"""Concurrency limiter and priority scheduler for Ollama generations"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from app.config import settings
+from app.metrics import QUEUE_REJECTIONS, QUEUE_WAIT
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes, lower values are served first"""
+    CHAT = 0
+    EXERCISES = 1
+    COURSE = 2
+
+
+class SchedulerBusyError(Exception):
+    """Raised when a generation cannot be queued or waited too long for a slot"""
+    
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """Start time of a process in clock ticks since boot (Linux), None where it cannot be read"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Fields after the command name, which is in parentheses and may contain spaces
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+
+def current_process() -> Tuple[int, Optional[int]]:
+    """PID and start time of this process"""
+    pid = os.getpid()
+    return pid, process_start_time(pid)
+
+
+def process_alive(pid: int, started: Optional[int] = None) -> bool:
+    """
+    Check whether a process on this host exists
+    
+    With `started` (see `process_start_time`), a process that has the PID but
+    started at another time is a new process that reused the PID, e.g. a
+    worker of a restarted container, and the original one is gone.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if started is not None:
+        current = process_start_time(pid)
+        if current is not None and current != started:
+            return False
+    return True
+
+
+class SharedSlots:
+    """
+    Generation slots shared by all worker processes on one host
+    
+    Each slot is a row in a SQLite table. A worker claims a free row in a
+    write transaction and frees it when its generation ends; rows held by
+    processes that no longer exist are reclaimed, so a crashed worker cannot
+    leak capacity; the process start time is stored with the PID, so a
+    restarted worker that got the PID of a killed one does not keep its slots. Workers waiting for a slot poll with a short backoff.
+    
+    A release that fails (e.g. the database stays locked) is retried a few
+    times and otherwise remembered and retried with the next claim, so a
+    live worker cannot leak a slot either.
+    """
+    
+    RELEASE_ATTEMPTS = 5
+    
+    def __init__(self, path: str, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._unreleased: Set[str] = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation_slots ("
+            "slot INTEGER PRIMARY KEY, pid INTEGER, started INTEGER, token TEXT, acquired_at REAL)"
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO generation_slots (slot) VALUES (?)", [(slot,) for slot in range(size)]
+        )
+    
+    def _free(self, tokens: List[str]) -> None:
+        self._conn.executemany(
+            "UPDATE generation_slots SET pid = NULL, started = NULL, token = NULL, acquired_at = NULL WHERE token = ?",
+            [(token,) for token in tokens],
+        )
+    
+    def try_acquire(self, token: str) -> bool:
+        """Claim a free slot; a locked database counts as no slot free"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                unreleased = list(self._unreleased)
+                self._free(unreleased)
+                rows = self._conn.execute(
+                    "SELECT slot, pid, started FROM generation_slots WHERE slot < ? ORDER BY slot", (self.size,)
+                ).fetchall()
+                free = next(
+                    (slot for slot, pid, started in rows if pid is None or not process_alive(pid, started)), None
+                )
+                if free is not None:
+                    self._conn.execute(
+                        "UPDATE generation_slots SET pid = ?, started = ?, token = ?, acquired_at = ? WHERE slot = ?",
+                        (*current_process(), token, time.time(), free),
+                    )
+                self._conn.execute("COMMIT")
+                self._unreleased.difference_update(unreleased)
+            except sqlite3.OperationalError as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.debug("Could not claim a shared generation slot: %s", e)
+                return False
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+        return free is not None
+    
+    def release(self, token: str) -> None:
+        """Free the slot claimed with `token`, retrying while the database is locked"""
+        delay = 0.05
+        for attempt in range(self.RELEASE_ATTEMPTS):
+            try:
+                with self._lock:
+                    self._free([token])
+                    self._unreleased.discard(token)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == self.RELEASE_ATTEMPTS - 1:
+                    with self._lock:
+                        self._unreleased.add(token)
+                    logger.error("Could not release shared generation slot, retrying with the next claim: %s", e)
+                    return
+                time.sleep(delay)
+                delay *= 2
+    
+    async def acquire(self, token: str, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a slot"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        delay = 0.02
+        while True:
+            claim = loop.run_in_executor(None, self.try_acquire, token)
+            try:
+                if await asyncio.shield(claim):
+                    return True
+            except asyncio.CancelledError:
+                # The claim may still go through in the worker thread; free it there once it has
+                claim.add_done_callback(lambda future: self._release_claimed(future, token))
+                raise
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+    
+    def _release_claimed(self, claim: asyncio.Future, token: str) -> None:
+        if claim.cancelled() or claim.exception() is not None or not claim.result():
+            return
+        release = asyncio.get_running_loop().run_in_executor(None, self.release, token)
+        release.add_done_callback(_log_release_error)
+
+
+def _log_release_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Error releasing shared generation slot: %s", future.exception())
+
+
+class SchedulerTicket:
+    """A granted generation slot; releasing it more than once is a no-op"""
+    
+    def __init__(self, scheduler: "GenerationScheduler", priority: Priority):
+        self._scheduler = scheduler
+        self.priority = priority
+        self.token = uuid.uuid4().hex
+        self.started_at = time.monotonic()
+        self._released = False
+    
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._release_shared(self.token)
+        self._scheduler._release(time.monotonic() - self.started_at)
+
+
+class GenerationScheduler:
+    """
+    Limit in-flight generations and hand out free slots by priority
+    
+    Each priority class has its own bounded queue. When a queue is full the
+    caller is rejected immediately with 429; a caller that waits longer than
+    `max_wait_seconds` is rejected with 503. Both carry a Retry-After estimate
+    based on the recent average generation time.
+    
+    With `shared` slots (several worker processes), a request that got a
+    local slot additionally claims one of the shared slots, so
+    `max_in_flight` holds for all workers together.
+    """
+    
+    def __init__(self, max_in_flight: int, queue_limits: Dict[Priority, int], max_wait_seconds: float,
+                 shared: Optional[SharedSlots] = None):
+        self.max_in_flight = max_in_flight
+        self.queue_limits = queue_limits
+        self.max_wait_seconds = max_wait_seconds
+        self.shared = shared
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._sequence = itertools.count()
+        # Metrics
+        self._avg_service_seconds = 10.0
+        self._wait_count: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._wait_total: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+        self._wait_max: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+        self._rejected: Dict[Priority, int] = {priority: 0 for priority in Priority}
+    
+    def _retry_after(self) -> int:
+        queued = sum(self._queued.values())
+        estimate = self._avg_service_seconds * (queued + 1) / max(1, self.max_in_flight)
+        return max(1, int(estimate))
+    
+    def _record_wait(self, priority: Priority, waited: float) -> None:
+        self._wait_count[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+        QUEUE_WAIT.labels(priority.name.lower()).observe(waited)
+    
+    async def acquire(self, priority: Priority) -> SchedulerTicket:
+        """Wait for a free generation slot"""
+        enqueued_at = time.monotonic()
+        
+        # Only take a slot directly if nobody is queued ahead of us
+        if self.in_flight < self.max_in_flight and not any(self._queued.values()):
+            self.in_flight += 1
+            return await self._grant(priority, enqueued_at)
+        
+        if self._queued[priority] >= self.queue_limits[priority]:
+            self._rejected[priority] += 1
+            QUEUE_REJECTIONS.labels(priority.name.lower(), "queue_full").inc()
+            raise SchedulerBusyError(
+                f"Too many queued {priority.name.lower()} requests, please retry later",
+                status_code=429,
+                retry_after=self._retry_after(),
+            )
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._rejected[priority] += 1
+            QUEUE_REJECTIONS.labels(priority.name.lower(), "timeout").inc()
+            self._abandon(future)
+            raise SchedulerBusyError(
+                "Timed out waiting for a free generation slot, please retry later",
+                status_code=503,
+                retry_after=self._retry_after(),
+            )
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        finally:
+            self._queued[priority] -= 1
+        
+        return await self._grant(priority, enqueued_at)
+    
+    async def _grant(self, priority: Priority, enqueued_at: float) -> SchedulerTicket:
+        """Turn a local slot into a ticket, claiming a shared slot first if configured"""
+        ticket = SchedulerTicket(self, priority)
+        if self.shared is not None:
+            remaining = self.max_wait_seconds - (time.monotonic() - enqueued_at)
+            try:
+                acquired = await self.shared.acquire(ticket.token, remaining)
+            except BaseException:
+                self._release(None)
+                raise
+            if not acquired:
+                self._release(None)
+                self._rejected[priority] += 1
+                QUEUE_REJECTIONS.labels(priority.name.lower(), "timeout").inc()
+                raise SchedulerBusyError(
+                    "Timed out waiting for a free generation slot, please retry later",
+                    status_code=503,
+                    retry_after=self._retry_after(),
+                )
+            ticket.started_at = time.monotonic()
+        self._record_wait(priority, time.monotonic() - enqueued_at)
+        return ticket
+    
+    def _abandon(self, future: asyncio.Future) -> None:
+        """Give up a queued request, passing on a slot it may have just been granted"""
+        if future.done() and not future.cancelled():
+            self._release(None)
+        else:
+            future.cancel()
+    
+    def _release_shared(self, token: str) -> None:
+        if self.shared is None:
+            return
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, self.shared.release, token)
+        except RuntimeError:
+            # Not on the event loop (e.g. a background task run in a thread)
+            self.shared.release(token)
+            return
+        future.add_done_callback(_log_release_error)
+    
+    def _release(self, service_seconds: Optional[float]) -> None:
+        if service_seconds is not None:
+            # Exponential moving average of generation time for Retry-After estimates
+            self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * service_seconds
+        self.in_flight -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+                break
+    
+    @asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[SchedulerTicket]:
+        """Hold a generation slot for the duration of the block"""
+        ticket = await self.acquire(priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+    
+    def stats(self) -> dict:
+        return {
+            "maxInFlight": self.max_in_flight,
+            "inFlight": self.in_flight,
+            "sharedAcrossWorkers": self.shared is not None,
+            "avgGenerationSeconds": round(self._avg_service_seconds, 3),
+            "queues": {
+                priority.name.lower(): {
+                    "depth": self._queued[priority],
+                    "limit": self.queue_limits[priority],
+                    "rejected": self._rejected[priority],
+                    "avgWaitSeconds": round(
+                        self._wait_total[priority] / self._wait_count[priority], 3
+                    ) if self._wait_count[priority] else 0.0,
+                    "maxWaitSeconds": round(self._wait_max[priority], 3),
+                }
+                for priority in Priority
+            },
+        }
+
+
+# Global instance
+scheduler = GenerationScheduler(
+    max_in_flight=settings.max_in_flight,
+    queue_limits={
+        Priority.CHAT: settings.scheduler_chat_queue_limit,
+        Priority.EXERCISES: settings.scheduler_exercise_queue_limit,
+        Priority.COURSE: settings.scheduler_course_queue_limit,
+    },
+    max_wait_seconds=settings.scheduler_max_wait_seconds,
+    shared=SharedSlots(settings.scheduler_slots_path, settings.max_in_flight)
+    if settings.scheduler_slots_path else None,
+)
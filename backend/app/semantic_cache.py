@@ -0,0 +1,267 @@
+"""Semantic cache for chat turns based on message embeddings"""
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+import aiosqlite
+import numpy as np
+from app.config import settings
+from app.langchain_service import langchain_service
+from app.metrics import CACHE_LOOKUPS
+
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS semantic_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    response TEXT NOT NULL
+);
+"""
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", message.strip().lower())
+    return text.rstrip("?!.… ")
+
+
+def cache_scope(language: str, formality: str, history: List[Dict[str, str]]) -> str:
+    """Scope of a chat turn: settings plus the exact conversation it continues"""
+    if not history:
+        return f"{language}:{formality}"
+    payload = json.dumps([[msg["role"], msg["content"]] for msg in history], ensure_ascii=False)
+    return f"{language}:{formality}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+
+def scope_id(scope: str) -> int:
+    """64-bit id of a scope for the index; the same in every worker and needs no registry"""
+    return int.from_bytes(hashlib.blake2b(scope.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class SemanticChatCache:
+    """
+    Reuse chat responses for messages that mean the same thing
+    
+    Normalized messages are embedded with the Ollama embedding model and
+    compared by cosine similarity against all cached messages of the same
+    scope with a brute-force NumPy search. The scope is the language
+    direction, the formality and the exact previous messages, so a response
+    is only reused in the conversation state it was generated for. A hit
+    needs a similarity of at least `threshold`; exact repeats of a normalized
+    message are answered without embedding. When full, the least recently
+    used entry is replaced.
+    
+    If the embedding model is unavailable the cache is skipped for
+    `retry_seconds` instead of slowing down every chat turn.
+    
+    With a `path`, new entries are also appended to a SQLite table that every
+    worker process reads back into its own index at most once per
+    `sync_seconds`, so a response cached by one worker is found by all.
+    """
+    
+    def __init__(self, max_entries: int, threshold: float, retry_seconds: float = 60,
+                 path: Optional[str] = None, sync_seconds: float = 1.0):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.retry_seconds = retry_seconds
+        self.path = path
+        self.sync_seconds = sync_seconds
+        self._db: Optional[aiosqlite.Connection] = None
+        self._last_row = 0
+        self._synced_at = 0.0
+        self._appended = 0
+        self._vectors: Optional[np.ndarray] = None  # (max_entries, dim), rows are unit length
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._texts: List[Optional[Tuple[int, str]]] = [None] * max_entries
+        self._exact: Dict[Tuple[int, str], int] = {}
+        self._size = 0
+        self._clock = 0
+        self._unavailable_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lookup_seconds = 0.0
+        self._lookups = 0
+    
+    @staticmethod
+    def eligible(history_length: int) -> bool:
+        """Only turns with little or no history are answered from the cache"""
+        return settings.semantic_cache_enabled and history_length <= settings.semantic_cache_max_history
+    
+    async def open(self) -> None:
+        """Open the shared table and load its most recent entries"""
+        if self.path is None or self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+        async with self._db.execute("SELECT COALESCE(MAX(id), 0) FROM semantic_cache") as cursor:
+            (max_id,) = await cursor.fetchone()
+        self._last_row = max(0, max_id - self.max_entries)
+        await self._sync()
+    
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _sync(self) -> None:
+        """Add entries appended by other workers to the local index"""
+        if self._db is None:
+            return
+        self._synced_at = time.monotonic()
+        async with self._db.execute(
+            "SELECT id, scope, text, vector, response FROM semantic_cache WHERE id > ? ORDER BY id",
+            (self._last_row,),
+        ) as cursor:
+            async for row_id, scope, text, vector, response in cursor:
+                self._last_row = row_id
+                self._insert(scope_id(scope), text, np.frombuffer(vector, dtype=np.float32), response)
+    
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_LOOKUPS.labels("semantic_chat", "hit" if hit else "miss").inc()
+    
+    def _touch(self, slot: int) -> None:
+        self._clock += 1
+        self._last_used[slot] = self._clock
+    
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            vector = np.asarray(await langchain_service.aembed(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning("Embedding failed, skipping the semantic cache for %ss: %s", self.retry_seconds, e)
+            self._unavailable_until = time.monotonic() + self.retry_seconds
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    
+    async def lookup(self, message: str, language: str, formality: str,
+                     history: List[Dict[str, str]]) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Find a cached response for a message
+        
+        Returns:
+            `(response, vector)`: the cached response or None, and the message
+            embedding to pass to `add` on a miss (None if it was not computed)
+        """
+        started = time.perf_counter()
+        if self._db is not None and time.monotonic() - self._synced_at >= self.sync_seconds:
+            try:
+                await self._sync()
+            except Exception as e:
+                logger.warning("Reading the shared semantic cache failed: %s", e)
+        scope = scope_id(cache_scope(language, formality, history))
+        text = normalize_message(message)
+        try:
+            slot = self._exact.get((scope, text))
+            if slot is not None:
+                self._touch(slot)
+                self._record(hit=True)
+                return self._responses[slot], None
+            
+            vector = await self._embed(text)
+            if vector is None:
+                self._record(hit=False)
+                return None, None
+            if self._size and self._vectors is not None and self._vectors.shape[1] == vector.shape[0]:
+                similarities = self._vectors[:self._size] @ vector
+                similarities[self._scopes[:self._size] != scope] = -1.0
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._touch(best)
+                    self._record(hit=True)
+                    return self._responses[best], vector
+            self._record(hit=False)
+            return None, vector
+        finally:
+            self._lookups += 1
+            self._lookup_seconds += time.perf_counter() - started
+    
+    async def add(self, message: str, language: str, formality: str, history: List[Dict[str, str]],
+                  vector: Optional[np.ndarray], response: str) -> None:
+        """Cache a response under the message embedding returned by `lookup`"""
+        if vector is None or self.max_entries <= 0:
+            return
+        scope = cache_scope(language, formality, history)
+        text = normalize_message(message)
+        self._insert(scope_id(scope), text, vector, response)
+        if self._db is None:
+            return
+        try:
+            await self._db.execute(
+                "INSERT INTO semantic_cache (scope, text, vector, response) VALUES (?, ?, ?, ?)",
+                (scope, text, vector.astype(np.float32).tobytes(), response),
+            )
+            self._appended += 1
+            if self._appended % 100 == 0:
+                # Keep the shared table at about the size of the local index
+                await self._db.execute(
+                    "DELETE FROM semantic_cache WHERE id <= (SELECT MAX(id) FROM semantic_cache) - ?",
+                    (self.max_entries,),
+                )
+            await self._db.commit()
+        except Exception as e:
+            logger.warning("Writing the shared semantic cache failed: %s", e)
+    
+    def _insert(self, scope: int, text: str, vector: np.ndarray, response: str) -> None:
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            # First entry, or the embedding model changed
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._size = 0
+            self._exact.clear()
+        
+        text_key = (scope, text)
+        if text_key in self._exact:
+            # Added concurrently by another request or worker for the same message
+            slot = self._exact[text_key]
+        elif self._size < self.max_entries:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used[:self._size]))
+            del self._exact[self._texts[slot]]
+            self.evictions += 1
+        
+        self._vectors[slot] = vector
+        self._scopes[slot] = scope
+        self._responses[slot] = response
+        self._texts[slot] = text_key
+        self._exact[text_key] = slot
+        self._touch(slot)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "avgLookupMs": round(1000 * self._lookup_seconds / self._lookups, 2) if self._lookups else 0.0,
+        }
+
+
+# Global instance
+semantic_chat_cache = SemanticChatCache(
+    max_entries=settings.semantic_cache_max_entries,
+    threshold=settings.semantic_cache_threshold,
+    path=settings.semantic_cache_path,
+)
@@ -0,0 +1,74 @@
+"""
+Production server with several worker processes
+
+Usage:
+    python -m app.server
+
+Runs `API_WORKERS` uvicorn worker processes (default: one per CPU core) on
+`API_HOST:API_PORT`. State that every worker has to see is kept in SQLite
+files unless configured otherwise: the response cache (`CACHE_SQLITE_PATH`),
+the semantic chat cache (`SEMANTIC_CACHE_PATH`), background jobs
+(`JOB_DB_PATH`) and the generation slots that enforce
+`SCHEDULER_MAX_IN_FLIGHT` across all workers (`SCHEDULER_SLOTS_PATH`, reset
+on every start).
+Progress, courses, sessions and the exercise bank are SQLite already.
+Prometheus metrics are aggregated over the workers.
+
+On SIGTERM or SIGINT the workers stop accepting connections, finish in-flight
+requests and then running background jobs, each for up to
+`SHUTDOWN_GRACE_SECONDS`, and exit.
+"""
+import glob
+import os
+import tempfile
+import uvicorn
+from app.config import settings
+
+
+SHARED_STATE_DEFAULTS = {
+    "cache_sqlite_path": "cache.db",
+    "semantic_cache_path": "semantic_cache.db",
+    "job_db_path": "jobs.db",
+    "scheduler_slots_path": "scheduler.db",
+}
+
+
+def worker_count() -> int:
+    return settings.api_workers or os.cpu_count() or 1
+
+
+def prepare_environment() -> None:
+    """Point the workers at shared state; they read it from the environment"""
+    for name, default in SHARED_STATE_DEFAULTS.items():
+        if getattr(settings, name) is None:
+            os.environ[name.upper()] = default
+    
+    metrics_dir = settings.metrics_multiproc_dir or os.path.join(
+        tempfile.gettempdir(), f"german-tutor-metrics-{settings.api_port}"
+    )
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Values left over from a previous run would otherwise be added to this one
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    
+    # No worker runs yet, so every slot still marked as held belongs to a previous run
+    slots_path = settings.scheduler_slots_path or SHARED_STATE_DEFAULTS["scheduler_slots_path"]
+    for path in (slots_path, f"{slots_path}-wal", f"{slots_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main() -> None:
+    prepare_environment()
+    uvicorn.run(
+        "app.main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        workers=worker_count(),
+        timeout_graceful_shutdown=settings.shutdown_grace_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Persistent server-side chat sessions"""
+import asyncio
+import time
+import uuid
+import weakref
+from typing import Dict, List, Optional
+import aiosqlite
+from app.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    formality TEXT NOT NULL,
+    window_start INTEGER NOT NULL DEFAULT 0,
+    turn_token TEXT,
+    turn_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    prefix_key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+SUMMARY_TTL_SECONDS = 24 * 3600
+
+# Keys per summary query, well below SQLite's limit on bound parameters
+SUMMARY_QUERY_CHUNK = 500
+
+
+class SessionConflictError(Exception):
+    """Raised when another turn of the same session is running or was stored first"""
+
+
+class SessionTurn:
+    """
+    Exclusive right to run the next turn of a session, across worker processes
+    
+    Turns in this process queue on an asyncio lock; the holder then claims a
+    lease on the session row in SQLite, which other workers see. A lease that
+    is not released (e.g. a crashed worker) expires after
+    `session_turn_lease_seconds`.
+    """
+    
+    def __init__(self, store: "SessionStore", session_id: str):
+        self.store = store
+        self.session_id = session_id
+        self.token = uuid.uuid4().hex
+        self._lock = store._local_lock(session_id)
+        self._held = False
+    
+    async def acquire(self) -> None:
+        """Wait up to `session_turn_wait_seconds` for the session; raises SessionConflictError"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.session_turn_wait_seconds
+        try:
+            await asyncio.wait_for(self._lock.acquire(), settings.session_turn_wait_seconds)
+        except asyncio.TimeoutError:
+            raise SessionConflictError("Another message of this chat session is still being answered")
+        try:
+            delay = 0.05
+            while not await self.store._claim_turn(self.session_id, self.token):
+                if loop.time() + delay > deadline:
+                    raise SessionConflictError("Another message of this chat session is still being answered")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        except BaseException:
+            self._lock.release()
+            raise
+        self._held = True
+    
+    async def release(self) -> None:
+        """Give up the lease; safe to call more than once"""
+        if not self._held:
+            return
+        self._held = False
+        try:
+            await self.store._release_turn(self.session_id, self.token)
+        finally:
+            self._lock.release()
+    
+    async def __aenter__(self) -> "SessionTurn":
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.release()
+
+
+class SessionStore:
+    """
+    Chat sessions and their message history in SQLite (WAL mode)
+    
+    Messages are stored exactly as they were sent to the model so that
+    replaying them reproduces a byte-identical prompt prefix. `window_start`
+    records where the verbatim history window currently begins.
+    
+    Turns are serialized across worker processes by a lease on the session
+    row (see `turn`), and `append` refuses messages whose sequence numbers
+    are already taken, so a turn can never be stored twice or out of order.
+    The database also holds the rolling conversation summaries, so every
+    worker can reuse a summary computed by another.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+        # Held by the turns using them, so a session's lock goes away with its last turn
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # The connection is shared by all requests of this process; one write transaction at a time
+        self._write_lock = asyncio.Lock()
+    
+    async def open(self) -> None:
+        if self._db is not None:
+            return
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.executescript(SCHEMA)
+        await self._db.execute(
+            "DELETE FROM chat_summaries WHERE created_at < ?", (time.time() - SUMMARY_TTL_SECONDS,)
+        )
+        await self._db.commit()
+    
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            await self.open()
+        return self._db
+    
+    def _local_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+    
+    def turn(self, session_id: str) -> SessionTurn:
+        """Serialize turns within one session so history stays in order"""
+        return SessionTurn(self, session_id)
+    
+    async def _claim_turn(self, session_id: str, token: str) -> bool:
+        """Take the session's turn lease if it is free or expired"""
+        db = await self._connection()
+        now = time.time()
+        async with self._write_lock:
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                cursor = await db.execute(
+                    "UPDATE chat_sessions SET turn_token = ?, turn_expires = ? "
+                    "WHERE session_id = ? AND (turn_token IS NULL OR turn_expires < ?)",
+                    (token, now + settings.session_turn_lease_seconds, session_id, now),
+                )
+                claimed = cursor.rowcount > 0
+                if not claimed:
+                    # A session that does not exist has no lease to wait for
+                    async with db.execute(
+                        "SELECT 1 FROM chat_sessions WHERE session_id = ?", (session_id,)
+                    ) as existing:
+                        claimed = await existing.fetchone() is None
+                await db.commit()
+                return claimed
+            except aiosqlite.OperationalError:
+                # Another worker holds the write lock past busy_timeout; try again later
+                await db.rollback()
+                return False
+    
+    async def _release_turn(self, session_id: str, token: str) -> None:
+        db = await self._connection()
+        async with self._write_lock:
+            await db.execute(
+                "UPDATE chat_sessions SET turn_token = NULL, turn_expires = NULL "
+                "WHERE session_id = ? AND turn_token = ?",
+                (session_id, token),
+            )
+            await db.commit()
+    
+    async def create(self, session_id: str, user_id: str, language: str, formality: str) -> None:
+        db = await self._connection()
+        now = time.time()
+        async with self._write_lock:
+            await db.execute(
+                "INSERT INTO chat_sessions (session_id, user_id, language, formality, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, user_id, language, formality, now, now),
+            )
+            await db.commit()
+    
+    async def get(self, session_id: str, user_id: str) -> Optional[dict]:
+        """Return the session with its messages, or None if it does not exist for this user"""
+        db = await self._connection()
+        async with db.execute(
+            "SELECT language, formality, window_start FROM chat_sessions WHERE session_id = ? AND user_id = ?",
+            (session_id, user_id),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        messages: List[Dict[str, str]] = []
+        async with db.execute(
+            "SELECT role, content FROM chat_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ) as cursor:
+            async for role, content in cursor:
+                messages.append({"role": role, "content": content})
+        return {
+            "sessionId": session_id,
+            "language": row[0],
+            "formality": row[1],
+            "windowStart": row[2],
+            "messages": messages,
+        }
+    
+    async def append(self, session_id: str, first_seq: int, messages: List[Dict[str, str]],
+                     language: str, formality: str, window_start: int) -> None:
+        """
+        Append messages to a session and update its settings in one transaction
+        
+        Raises:
+            SessionConflictError: If the session no longer has `first_seq`
+                messages, i.e. another turn was stored in the meantime
+        """
+        db = await self._connection()
+        async with self._write_lock:
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                async with db.execute(
+                    "SELECT COUNT(*) FROM chat_messages WHERE session_id = ?", (session_id,)
+                ) as cursor:
+                    (stored,) = await cursor.fetchone()
+                if stored != first_seq:
+                    raise SessionConflictError("The chat session changed while this message was being answered")
+                await db.executemany(
+                    "INSERT INTO chat_messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(session_id, first_seq + i, msg["role"], msg["content"]) for i, msg in enumerate(messages)],
+                )
+                await db.execute(
+                    "UPDATE chat_sessions SET language = ?, formality = ?, window_start = ?, updated_at = ? "
+                    "WHERE session_id = ?",
+                    (language, formality, window_start, time.time(), session_id),
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+    
+    async def delete(self, session_id: str, user_id: str) -> bool:
+        db = await self._connection()
+        async with self._write_lock:
+            cursor = await db.execute(
+                "DELETE FROM chat_sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+            )
+            if cursor.rowcount:
+                await db.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+            await db.commit()
+        return cursor.rowcount > 0
+    
+    async def get_summaries(self, keys: List[str]) -> Dict[str, str]:
+        """Stored conversation summaries for any of the given history prefix keys"""
+        db = await self._connection()
+        summaries: Dict[str, str] = {}
+        cutoff = time.time() - SUMMARY_TTL_SECONDS
+        for i in range(0, len(keys), SUMMARY_QUERY_CHUNK):
+            chunk = keys[i:i + SUMMARY_QUERY_CHUNK]
+            async with db.execute(
+                f"SELECT prefix_key, summary FROM chat_summaries "
+                f"WHERE prefix_key IN ({', '.join('?' * len(chunk))}) AND created_at >= ?",
+                (*chunk, cutoff),
+            ) as cursor:
+                async for key, summary in cursor:
+                    summaries[key] = summary
+        return summaries
+    
+    async def set_summary(self, key: str, summary: str) -> None:
+        db = await self._connection()
+        async with self._write_lock:
+            await db.execute(
+                "INSERT OR REPLACE INTO chat_summaries (prefix_key, summary, created_at) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            await db.commit()
+
+
+# Global instance
+session_store = SessionStore(settings.session_db_path)
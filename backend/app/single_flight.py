@@ -0,0 +1,73 @@
+"""Coalesce concurrent identical calls onto one in-flight execution"""
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one execution per key at a time
+    
+    Callers that arrive while an execution for their key is in flight await
+    the same task and receive its result (a deep copy, so callers may mutate
+    it) or its exception. A caller being cancelled does not cancel the shared
+    execution for the others; the execution is cancelled only once every
+    caller waiting for it has gone away.
+    
+    Coalescing is per worker process: identical calls arriving at different
+    workers each execute once. Results shared across workers come from the
+    response cache instead.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `fn()`, sharing the execution with concurrent callers of the same key
+        
+        Args:
+            key: Identity of the call; equal keys must produce equal results
+            fn: Coroutine function performing the call
+        
+        Returns:
+            The result of the shared execution
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            self.executions += 1
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+        
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is interested in the result any more
+                call.task.cancel()
+                self._forget(key, call)
+        return copy.deepcopy(result)
+    
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+    
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
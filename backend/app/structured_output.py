@@ -0,0 +1,66 @@
+"""JSON schemas and system prompts for schema-constrained generation"""
+from typing import Iterable, Optional, Type
+from pydantic import BaseModel
+from app.config import settings
+
+
+def _inline_refs(node, defs: dict):
+    """Replace `$ref` pointers with the referenced definitions"""
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if ref and ref.startswith("#/$defs/"):
+            return _inline_refs(defs[ref[len("#/$defs/"):]], defs)
+        return {key: _inline_refs(value, defs) for key, value in node.items() if key != "$defs"}
+    if isinstance(node, list):
+        return [_inline_refs(value, defs) for value in node]
+    return node
+
+
+def _drop_fields(node, exclude: set):
+    """Remove excluded properties from every object schema"""
+    if isinstance(node, dict):
+        node = {key: _drop_fields(value, exclude) for key, value in node.items()}
+        if isinstance(node.get("properties"), dict):
+            node["properties"] = {k: v for k, v in node["properties"].items() if k not in exclude}
+            if "required" in node:
+                node["required"] = [k for k in node["required"] if k not in exclude]
+        return node
+    if isinstance(node, list):
+        return [_drop_fields(value, exclude) for value in node]
+    return node
+
+
+def json_schema(model: Type[BaseModel], exclude: Iterable[str] = ()) -> dict:
+    """
+    Build a self-contained JSON schema for a response model
+    
+    Args:
+        model: Pydantic model the generated JSON must match
+        exclude: Field names filled in by the server rather than the model
+            (removed from nested objects as well)
+    
+    Returns:
+        JSON schema suitable for Ollama's `format` parameter
+    """
+    schema = model.model_json_schema()
+    schema = _inline_refs(schema, schema.get("$defs", {}))
+    return _drop_fields(schema, set(exclude))
+
+
+def schema_format(model: Optional[Type[BaseModel]], exclude: Iterable[str] = ()) -> Optional[dict]:
+    """Return the `format` schema to send to Ollama, or None if structured output is disabled"""
+    if model is None or not settings.ollama_structured_output:
+        return None
+    return json_schema(model, exclude)
+
+
+def json_system_prompt(role: str, structure: str, guidelines: str) -> str:
+    """
+    Assemble a system prompt for JSON generation
+    
+    With structured output enabled the schema is enforced by Ollama, so the
+    JSON structure example is left out to keep the prompt short.
+    """
+    if settings.ollama_structured_output:
+        return f"{role}\n\n{guidelines}\n\nRespond with JSON only."
+    return f"{role}\n\n{structure}\n\n{guidelines}\n\nAlways respond with valid JSON only, no additional text."
@@ -0,0 +1,238 @@
+"""
+Deterministic stand-in for the Ollama HTTP API
+
+Usage:
+    python -m benchmarks.fake_ollama [--port 11435] [--token-latency 0.005] [--chat-tokens 48] [--malformed-every N]
+
+Implements `/api/chat` (streamed and non-streamed), `/api/embed`,
+`/api/tags` and `/api/version`. JSON responses are built from the `format`
+schema the backend sends, or from the example structure in the system prompt
+when structured output is disabled, so they always match what the backend
+expects. Every response takes `token-latency` seconds per token, and every
+Nth JSON response is cut off halfway to exercise the repair and error paths.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+CHAT_SENTENCE = "Sehr gut! Das heißt auf Deutsch: Ich lerne jeden Tag ein bisschen Deutsch. "
+EMBEDDING_DIMENSIONS = 64
+
+
+@dataclass
+class FakeOllamaConfig:
+    token_latency: float = 0.005  # seconds per generated token
+    chat_tokens: int = 48  # tokens of a plain chat response
+    chars_per_token: int = 4
+    array_items: int = 3  # elements of every generated JSON array
+    malformed_every: int = 0  # truncate every Nth JSON response, 0 disables
+
+
+def sample_json(schema: dict, name: str = "value", index: int = 0) -> Any:
+    """Build a deterministic instance of a (self-contained) JSON schema"""
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return sample_json(options[0] if options else {"type": "null"}, name, index)
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {key: sample_json(value, key, index) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_json(schema.get("items", {}), name, i) for i in range(3)]
+    if kind == "integer":
+        return index
+    if kind == "number":
+        return float(index)
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    return f"{name} {index + 1}"
+
+
+def example_json(system_prompt: str) -> Optional[Any]:
+    """Return the first JSON example embedded in a system prompt, if any"""
+    start = system_prompt.find("{")
+    while start != -1:
+        depth = 0
+        for end in range(start, len(system_prompt)):
+            if system_prompt[end] == "{":
+                depth += 1
+            elif system_prompt[end] == "}":
+                depth -= 1
+                if depth == 0:
+                    try:
+                        return json.loads(system_prompt[start:end + 1])
+                    except ValueError:
+                        break
+        start = system_prompt.find("{", start + 1)
+    return None
+
+
+def resize_arrays(value: Any, items: int) -> Any:
+    """Give every array in a JSON value exactly `items` elements"""
+    if isinstance(value, dict):
+        return {key: resize_arrays(item, items) for key, item in value.items()}
+    if isinstance(value, list):
+        if not value:
+            return value
+        return [resize_arrays(value[i % len(value)], items) for i in range(items)]
+    return value
+
+
+def split_tokens(text: str, chars_per_token: int) -> List[str]:
+    return [text[i:i + chars_per_token] for i in range(0, len(text), chars_per_token)] or [""]
+
+
+def count_tokens(messages: list, chars_per_token: int) -> int:
+    return sum(len(message.get("content") or "") for message in messages) // chars_per_token + 1
+
+
+class FakeOllama:
+    """Generates the responses and keeps request counters"""
+    
+    def __init__(self, config: FakeOllamaConfig):
+        self.config = config
+        self.chat_requests = 0
+        self.json_responses = 0
+        self.malformed_responses = 0
+    
+    def respond(self, body: dict) -> str:
+        messages = body.get("messages") or []
+        system_prompt = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        schema = body.get("format")
+        
+        data = None
+        if isinstance(schema, dict):
+            data = sample_json(schema)
+        elif schema == "json" or "JSON" in system_prompt:
+            data = example_json(system_prompt)
+        if data is None:
+            length = self.config.chat_tokens * self.config.chars_per_token
+            return (CHAT_SENTENCE * (length // len(CHAT_SENTENCE) + 1))[:length]
+        
+        self.json_responses += 1
+        text = json.dumps(resize_arrays(data, self.config.array_items), ensure_ascii=False)
+        every = self.config.malformed_every
+        if every and self.json_responses % every == 0:
+            self.malformed_responses += 1
+            return text[:len(text) // 2]
+        return text
+    
+    async def chat(self, request: Request):
+        body = await request.json()
+        self.chat_requests += 1
+        tokens = split_tokens(self.respond(body), self.config.chars_per_token)
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            tokens = tokens[:max(num_predict, 1)]
+        
+        model = body.get("model", "fake")
+        started = time.perf_counter()
+        
+        def final(content: str) -> dict:
+            eval_ns = max(int(len(tokens) * self.config.token_latency * 1e9), 1)
+            return {
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": count_tokens(body.get("messages") or [], self.config.chars_per_token),
+                "eval_count": len(tokens),
+                "eval_duration": eval_ns,
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+            }
+        
+        if not body.get("stream", True):
+            await asyncio.sleep(len(tokens) * self.config.token_latency)
+            return JSONResponse(final("".join(tokens)))
+        
+        async def stream():
+            for token in tokens:
+                await asyncio.sleep(self.config.token_latency)
+                chunk = {
+                    "model": model,
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": token},
+                    "done": False,
+                }
+                yield json.dumps(chunk, ensure_ascii=False) + "\n"
+            yield json.dumps(final("")) + "\n"
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    
+    async def embed(self, request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        embeddings = []
+        for text in texts:
+            # Bag of hashed words: identical texts get identical vectors
+            vector = [0.0] * EMBEDDING_DIMENSIONS
+            for word in text.lower().split():
+                bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % EMBEDDING_DIMENSIONS
+                vector[bucket] += 1.0
+            embeddings.append(vector)
+        return JSONResponse({"model": body.get("model", "fake"), "embeddings": embeddings})
+    
+    async def tags(self, request: Request):
+        return JSONResponse({"models": []})
+    
+    async def version(self, request: Request):
+        return JSONResponse({"version": "0.0.0-fake"})
+    
+    async def stats(self, request: Request):
+        return JSONResponse({
+            "chatRequests": self.chat_requests,
+            "jsonResponses": self.json_responses,
+            "malformedResponses": self.malformed_responses,
+        })
+
+
+def create_app(config: FakeOllamaConfig) -> Starlette:
+    fake = FakeOllama(config)
+    return Starlette(routes=[
+        Route("/api/chat", fake.chat, methods=["POST"]),
+        Route("/api/embed", fake.embed, methods=["POST"]),
+        Route("/api/tags", fake.tags),
+        Route("/api/version", fake.version),
+        Route("/stats", fake.stats),
+    ])
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fake_ollama", description="Fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-latency", type=float, default=FakeOllamaConfig.token_latency,
+                        help="Seconds per generated token")
+    parser.add_argument("--chat-tokens", type=int, default=FakeOllamaConfig.chat_tokens,
+                        help="Tokens of a plain chat response")
+    parser.add_argument("--array-items", type=int, default=FakeOllamaConfig.array_items,
+                        help="Elements of every JSON array (lessons, exercises, ...)")
+    parser.add_argument("--malformed-every", type=int, default=0,
+                        help="Truncate every Nth JSON response (0 disables)")
+    args = parser.parse_args(argv)
+    
+    config = FakeOllamaConfig(
+        token_latency=args.token_latency,
+        chat_tokens=args.chat_tokens,
+        array_items=args.array_items,
+        malformed_every=args.malformed_every,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Load test and benchmark runner
+
+Usage:
+    python -m benchmarks.run --start [--concurrency 1,4,16] [--requests 40] [--output results.json]
+    python -m benchmarks.run --url http://localhost:3000 [--scenarios chat,update-progress]
+    python -m benchmarks.run --start --baseline baseline.json [--tolerance 0.25]
+
+Drives `/chat`, `/create-course`, `/generate-exercises` and `/update-progress`
+at each concurrency level and reports throughput and p50/p95/p99 latency as
+JSON. While a scenario runs, `GET /` is probed every 50 ms: its latency stays
+near zero unless something blocks the event loop, which makes blocking calls
+visible independently of the model latency.
+
+With `--start` a fake Ollama server (`benchmarks.fake_ollama`) and the API are
+started as subprocesses on free ports with fresh databases and the caches
+disabled, so every run measures the same work. With `--baseline` the p95
+latencies are compared against an earlier result file and the exit code is 1
+if any scenario got slower by more than `--tolerance`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import httpx
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE_INTERVAL = 0.05
+
+# A scenario builds request `i` as (method, path, json body, headers)
+Scenario = Callable[[int], Tuple[str, str, Optional[dict], Dict[str, str]]]
+
+
+def chat_request(i: int):
+    body = {"message": f"How do I say 'good morning' in German? ({i})", "language": "en-de", "formality": "du"}
+    return "POST", "/chat", body, {}
+
+
+def create_course_request(i: int):
+    body = {"level": "A1", "dailyStudyHours": 1, "goals": f"Benchmark course {i}"}
+    return "POST", "/create-course", body, {"Cache-Control": "no-cache", "X-User-Id": f"bench-{i}"}
+
+
+def generate_exercises_request(i: int):
+    body = {
+        "lessonIndex": i % 10,
+        "lessonTitle": f"Benchmark lesson {i}",
+        "lessonContent": "Greetings and introductions: Hallo, Guten Morgen, Ich heiße ...",
+        "vocabulary": ["Hallo", "Guten Morgen", "Tschüss"],
+        "grammar": ["Personal pronouns", "Present tense of sein"],
+        "level": "A1",
+    }
+    return "POST", "/generate-exercises", body, {"Cache-Control": "no-cache"}
+
+
+def update_progress_request(i: int):
+    body = {"courseId": "benchmark", "lessonIndex": i % 10, "exerciseIndex": i % 5, "completed": True}
+    return "POST", "/update-progress", body, {"X-User-Id": f"bench-{i % 50}"}
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "chat": chat_request,
+    "create-course": create_course_request,
+    "generate-exercises": generate_exercises_request,
+    "update-progress": update_progress_request,
+}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float]) -> dict:
+    values = sorted(latencies)
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "mean": round(sum(values) / len(values), 4) if values else 0.0,
+        "max": round(values[-1], 4) if values else 0.0,
+    }
+
+
+async def probe_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: List[float]) -> None:
+    """Measure `GET /` latency until stopped"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/")
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), PROBE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_scenario(client: httpx.AsyncClient, probe_client: httpx.AsyncClient, name: str,
+                       concurrency: int, requests: int, offset: int) -> dict:
+    """Send `requests` requests of a scenario from `concurrency` concurrent workers"""
+    scenario = SCENARIOS[name]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+    
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < requests:
+            i = offset + next_index
+            next_index += 1
+            method, path, body, headers = scenario(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    
+    probe_latencies: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop(probe_client, stop, probe_latencies))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    stop.set()
+    await probe
+    
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "statuses": statuses,
+        "durationSeconds": round(duration, 3),
+        "throughput": round(requests / duration, 3) if duration else 0.0,
+        "latency": summarize(latencies),
+        "loopProbe": summarize(probe_latencies),
+    }
+
+
+async def run_benchmark(url: str, scenarios: List[str], levels: List[int], requests: int,
+                        timeout: float) -> List[dict]:
+    results = []
+    limits = httpx.Limits(max_connections=max(levels) + 1, max_keepalive_connections=max(levels) + 1)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=url, timeout=timeout) as probe_client:
+        offset = 0
+        for name in scenarios:
+            for concurrency in levels:
+                result = await run_scenario(client, probe_client, name, concurrency, requests, offset)
+                offset += requests  # unique payloads, so nothing is coalesced or cached across runs
+                results.append(result)
+                print(
+                    f"{name:<20} c={concurrency:<4} {result['throughput']:>8.2f} req/s  "
+                    f"p50={result['latency']['p50']:.3f}s p95={result['latency']['p95']:.3f}s "
+                    f"p99={result['latency']['p99']:.3f}s  errors={result['errors']}  "
+                    f"loop p99={result['loopProbe']['p99'] * 1000:.1f}ms",
+                    file=sys.stderr,
+                )
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+@contextmanager
+def local_servers(args: argparse.Namespace) -> Iterator[str]:
+    """Start the fake Ollama server and the API, yield the API URL"""
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as data_dir:
+        try:
+            ollama_port = free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(ollama_port),
+                 "--token-latency", str(args.token_latency), "--chat-tokens", str(args.chat_tokens),
+                 "--malformed-every", str(args.malformed_every)],
+                cwd=BACKEND_DIR,
+            ))
+            wait_until_ready(f"http://127.0.0.1:{ollama_port}/api/version", processes[-1], 30)
+            
+            api_port = free_port()
+            env = {
+                **os.environ,
+                "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+                "OLLAMA_BASE_URLS": "[]",
+                "PROGRESS_DB_PATH": os.path.join(data_dir, "progress.db"),
+                "COURSE_DB_PATH": os.path.join(data_dir, "courses.db"),
+                "SESSION_DB_PATH": os.path.join(data_dir, "sessions.db"),
+                "EXERCISE_BANK_PATH": os.path.join(data_dir, "exercises.db"),
+                "CACHE_ENABLED": "false",
+                "SEMANTIC_CACHE_ENABLED": "false",
+                "EXERCISE_BANK_ENABLED": "false",
+                "COURSE_PREFETCH_LESSONS": "false",
+                "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            }
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                 "--port", str(api_port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            url = f"http://127.0.0.1:{api_port}"
+            wait_until_ready(f"{url}/ready", processes[-1], 60)
+            yield url
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> bool:
+    """Print p95 changes against a baseline file, return False on a regression"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    ok = True
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None or not before["latency"]["p95"]:
+            continue
+        change = result["latency"]["p95"] / before["latency"]["p95"] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{result['scenario']:<20} c={result['concurrency']:<4} p95 {change:+.1%}"
+              f"{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return ok
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmark the API")
+    parser.add_argument("--url", default="http://localhost:3000", help="API to benchmark (ignored with --start)")
+    parser.add_argument("--start", action="store_true",
+                        help="Start a fake Ollama server and the API locally instead of using --url")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per scenario and concurrency level")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout of a single request in seconds")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results file to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative p95 increase over the baseline (default: 0.25)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Fake Ollama seconds per token")
+    parser.add_argument("--chat-tokens", type=int, default=48, help="Fake Ollama tokens per chat response")
+    parser.add_argument("--malformed-every", type=int, default=0,
+                        help="Fake Ollama truncates every Nth JSON response (0 disables)")
+    args = parser.parse_args(argv)
+    
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    
+    if args.start:
+        with local_servers(args) as url:
+            results = asyncio.run(run_benchmark(url, scenarios, levels, args.requests, args.timeout))
+    else:
+        results = asyncio.run(run_benchmark(args.url, scenarios, levels, args.requests, args.timeout))
+    
+    report = {
+        "config": {
+            "url": None if args.start else args.url,
+            "fakeOllama": {
+                "tokenLatency": args.token_latency,
+                "chatTokens": args.chat_tokens,
+                "malformedEvery": args.malformed_every,
+            } if args.start else None,
+            "requests": args.requests,
+            "concurrency": levels,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-"""Simple entry point to run the FastAPI server"""
+"""Development server with auto-reload; use `python -m app.server` in production"""
 from app.config import settings
 import uvicorn
 
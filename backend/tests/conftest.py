@@ -0,0 +1,78 @@
+"""Shared fixtures: isolated data files and a fake Ollama server"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import pytest
+
+# Settings are read when the app modules are imported, so point every data
+# file at a scratch directory before any test imports them
+DATA_DIR = tempfile.mkdtemp(prefix="german-tutor-tests-")
+for name, filename in [
+    ("PROGRESS_DB_PATH", "progress.db"),
+    ("COURSE_DB_PATH", "courses.db"),
+    ("SESSION_DB_PATH", "sessions.db"),
+    ("EXERCISE_BANK_PATH", "exercises.db"),
+]:
+    os.environ.setdefault(name, os.path.join(DATA_DIR, filename))
+os.environ.setdefault("OLLAMA_HEALTH_CHECK_INTERVAL", "0")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def fake_ollama():
+    """Base URL of `benchmarks.fake_ollama` running without token latency"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(port), "--token-latency", "0"],
+        cwd=BACKEND_DIR,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                httpx.get(f"{base_url}/api/version", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("Fake Ollama server did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@pytest.fixture
+def unreachable_url():
+    """URL of a port nothing listens on"""
+    return f"http://127.0.0.1:{free_port()}"
+
+
+@pytest.fixture
+def ollama(fake_ollama, monkeypatch):
+    """The global LangChainService, routed to the fake Ollama server"""
+    from app.langchain_service import langchain_service
+    from app.ollama_pool import OllamaBackend, OllamaPool
+    
+    backend = OllamaBackend(
+        fake_ollama, langchain_service._create_llm(fake_ollama), langchain_service._create_embeddings(fake_ollama)
+    )
+    monkeypatch.setattr(langchain_service, "pool", OllamaPool([backend], 0))
+    return langchain_service
@@ -0,0 +1,100 @@
+import argparse
+import json
+import httpx
+import pytest
+from app import batch, course_generation
+from app.course_store import CourseStore
+from app.exercise_bank import ExerciseBank, exercise_key
+from app.models import ExerciseRequest, ExerciseResponse
+
+
+@pytest.fixture
+async def stores(tmp_path, monkeypatch):
+    bank = ExerciseBank(str(tmp_path / "exercises.db"))
+    courses = CourseStore(str(tmp_path / "courses.db"))
+    monkeypatch.setattr(batch, "exercise_bank", bank)
+    monkeypatch.setattr(batch, "course_store", courses)
+    monkeypatch.setattr(course_generation, "course_store", courses)
+    yield bank, courses
+    await bank.close()
+    await courses.close()
+
+
+def write_catalog(tmp_path, catalog) -> str:
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(catalog), encoding="utf-8")
+    return str(path)
+
+
+def pregenerate_args(**kwargs) -> argparse.Namespace:
+    return argparse.Namespace(**{"course": [], "catalog": None, "concurrency": 4, "force": False, **kwargs})
+
+
+async def chat_requests(fake_ollama: str) -> int:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"{fake_ollama}/stats")).json()["chatRequests"]
+
+
+@pytest.mark.anyio
+async def test_bank_finds_lessons_by_their_fields(stores):
+    bank, _ = stores
+    request = ExerciseRequest(lessonIndex=0, lessonTitle="Zahlen", lessonContent="Eins bis zehn",
+                              vocabulary=["eins"], grammar=[], level="A1")
+    await bank.put(request, ExerciseResponse(exercises=["Zähle bis drei."], solutions=["eins, zwei, drei"]))
+    
+    same = request.model_copy(update={"lessonTitle": " Zahlen "})
+    assert (await bank.get(exercise_key(same))).exercises == ["Zähle bis drei."]
+    assert await bank.existing([exercise_key(request), "missing"]) == {exercise_key(request)}
+    assert await bank.get(exercise_key(request.model_copy(update={"level": "A2"}))) is None
+
+
+@pytest.mark.anyio
+async def test_catalog_levels_and_topics_become_courses_and_resume(ollama, fake_ollama, stores, tmp_path):
+    bank, courses = stores
+    catalog = write_catalog(tmp_path, {"levels": ["A1"], "topics": ["Im Restaurant", "Reisen"], "dailyStudyHours": 1})
+    
+    assert await batch.pregenerate(pregenerate_args(catalog=catalog)) == 0
+    for topic in ["Im Restaurant", "Reisen"]:
+        course_id = batch.catalog_course_id("A1", topic)
+        outline = await courses.get_outline(course_id)
+        assert outline is not None
+        for index in range(len(outline["lessons"])):
+            lesson = await courses.get_lesson(course_id, index)
+            request = batch.lesson_exercise_request(outline, index, lesson)
+            assert await bank.existing([exercise_key(request)])
+    banked = await bank.count()
+    
+    # A second run finds the outlines, lessons and exercises stored and generates nothing
+    before = await chat_requests(fake_ollama)
+    assert await batch.pregenerate(pregenerate_args(catalog=catalog)) == 0
+    assert await chat_requests(fake_ollama) == before
+    assert await bank.count() == banked
+
+
+@pytest.mark.anyio
+async def test_catalog_of_single_lessons(ollama, stores, tmp_path):
+    bank, _ = stores
+    lesson = {"lessonIndex": 0, "lessonTitle": "Farben", "lessonContent": "rot, blau, grün",
+              "vocabulary": ["rot"], "grammar": [], "level": "A1"}
+    assert await batch.pregenerate(pregenerate_args(catalog=write_catalog(tmp_path, [lesson]))) == 0
+    assert await bank.existing([exercise_key(ExerciseRequest(**lesson))])
+
+
+def test_catalog_without_topics_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        batch.load_catalog(write_catalog(tmp_path, {"levels": ["A1"]}))
+
+
+def test_concurrency_is_validated_and_clamped(monkeypatch):
+    used = []
+    
+    async def pregenerate(args):
+        used.append(args.concurrency)
+        return 0
+    
+    monkeypatch.setattr(batch, "pregenerate", pregenerate)
+    with pytest.raises(SystemExit):
+        batch.main(["pregenerate", "--concurrency", "0"])
+    assert batch.main(["pregenerate", "--concurrency", "500"]) == 0
+    assert batch.main(["pregenerate", "--concurrency", "3"]) == 0
+    assert used == [batch.max_concurrency(), 3]
@@ -0,0 +1,64 @@
+import time
+import pytest
+from app.cache import MemoryCache, ResponseCache, SQLiteCache, bypass_cache, make_cache_key
+
+
+def test_key_ignores_cosmetic_whitespace_only():
+    key = make_cache_key("qwen3:8b", "System\n", "Line one  \nLine two", 0.7)
+    assert key == make_cache_key("qwen3:8b", "  System", "\nLine one\nLine two\n", 0.7000001)
+    assert key != make_cache_key("qwen3:8b", "System", "Line one\nLine 2", 0.7)
+    assert key != make_cache_key("qwen3:1.7b", "System", "Line one\nLine two", 0.7)
+    assert key != make_cache_key("qwen3:8b", "System", "Line one\nLine two", 0.2)
+    assert make_cache_key("m", None, "p", 0.7) == make_cache_key("m", "", "p", 0.7)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, max_bytes=1000, ttl_seconds=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+
+def test_memory_cache_respects_byte_limit_and_ttl():
+    cache = MemoryCache(max_entries=10, max_bytes=10, ttl_seconds=60)
+    cache.set("big", "x" * 11)
+    assert cache.get("big") is None
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert len(cache) == 1 and cache.get("b") == "y" * 6
+    
+    cache.set("short", "z", ttl_seconds=-1)
+    assert cache.get("short") is None
+
+
+def test_sqlite_cache_persists_and_expires(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteCache(path, ttl_seconds=60).set("key", "value")
+    disk = SQLiteCache(path, ttl_seconds=60)
+    assert disk.get("key") == "value"
+    disk.set("old", "value", ttl_seconds=-1)
+    assert disk.get("old") is None
+    disk.clear()
+    assert disk.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_disk_hits_are_promoted_to_memory(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    disk.set("key", "value")
+    cache = ResponseCache(MemoryCache(max_entries=10, max_bytes=1000, ttl_seconds=60), disk)
+    
+    assert await cache.get("key") == "value"
+    assert cache.memory.get("key") == "value"
+    assert await cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hitRate": 0.5, "entries": 1}
+
+
+def test_cache_control_bypass():
+    assert bypass_cache("no-cache")
+    assert bypass_cache("max-age=0, No-Store")
+    assert not bypass_cache("max-age=60")
+    assert not bypass_cache(None)
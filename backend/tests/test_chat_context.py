@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from app.chat_context import ChatContextManager
+from app.langchain_service import langchain_service
+from app.session_store import SessionStore
+
+
+def conversation(turns: int):
+    """Alternating user/assistant messages of 11 estimated tokens each"""
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:02d}" + "x" * 38}
+        for i in range(2 * turns)
+    ]
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Prompts sent for summarization, each answered with a numbered summary"""
+    sent = []
+    
+    async def agenerate(prompt, system_prompt=None, **kwargs):
+        sent.append(prompt)
+        return f"<think>...</think>summary {len(sent)}"
+    
+    monkeypatch.setattr(langchain_service, "agenerate", agenerate)
+    return sent
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    await store.open()
+    yield store
+    await store.close()
+
+
+async def settle(context: ChatContextManager):
+    await asyncio.gather(*list(context._tasks))
+
+
+def test_window_fits_the_budget_and_starts_on_a_user_turn():
+    context = ChatContextManager(token_budget=35)
+    history = conversation(3)
+    # Three messages fit, but the window must not open with the tutor's reply
+    assert context.split(history) == 4
+    assert ChatContextManager(token_budget=1000).split(history) == 0
+
+
+@pytest.mark.anyio
+async def test_older_turns_are_replaced_by_a_summary(prompts):
+    context = ChatContextManager(token_budget=25)
+    history = conversation(3)
+    assert await context.prepare(history) == (None, history[4:])
+    
+    context.schedule_summary(history)
+    context.schedule_summary(history)
+    await settle(context)
+    assert len(prompts) == 1 and "00xx" in prompts[0] and "04xx" not in prompts[0]
+    assert await context.prepare(history) == ("summary 1", history[4:])
+    assert "summary 1" in context.system_prompt("You are a tutor.", "summary 1")
+
+
+@pytest.mark.anyio
+async def test_summary_is_extended_instead_of_recomputed(prompts):
+    context = ChatContextManager(token_budget=25)
+    history = conversation(5)
+    context.schedule_summary(history[:6])
+    await settle(context)
+    context.schedule_summary(history)
+    await settle(context)
+    
+    assert prompts[1].startswith("Summary so far:\nsummary 1")
+    assert "02xx" not in prompts[1] and "04xx" in prompts[1]
+    assert await context.prepare(history) == ("summary 2", history[8:])
+
+
+@pytest.mark.anyio
+async def test_summaries_are_shared_through_the_store(prompts, store):
+    first, second = ChatContextManager(25, store), ChatContextManager(25, store)
+    history = conversation(3)
+    first.schedule_summary(history)
+    await settle(first)
+    
+    assert await second.prepare(history) == ("summary 1", history[4:])
+    second.schedule_summary(history)
+    assert not second._tasks and len(prompts) == 1
+
+
+@pytest.mark.anyio
+async def test_failed_summary_is_retried_on_the_next_turn(prompts, monkeypatch):
+    context = ChatContextManager(token_budget=25)
+    history = conversation(3)
+    
+    async def fail(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(langchain_service, "agenerate", fail)
+        context.schedule_summary(history)
+        await settle(context)
+    assert await context.prepare(history) == (None, history[4:])
+    
+    context.schedule_summary(history)
+    await settle(context)
+    assert await context.prepare(history) == ("summary 1", history[4:])
+
+
+def test_stable_window_only_moves_past_twice_the_budget():
+    context = ChatContextManager(token_budget=25)
+    history = conversation(2)
+    assert context.stable_start(history, 0) == 0
+    history = conversation(3)
+    assert context.stable_start(history, 0) == 4
+    assert context.stable_start(history, 10) == 6
@@ -0,0 +1,123 @@
+import gzip
+import zlib
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app import compression
+from app.compression import (
+    CompressionMiddleware, RequestTooLarge, UnsupportedEncoding, accepted_encoding, decompress, etag_matches,
+)
+from app.config import settings
+
+LIMIT = 64 * 1024
+
+
+def gzip_bomb(size: int) -> bytes:
+    return gzip.compress(b"\0" * size)
+
+
+def test_gzip_within_limit():
+    body = b'{"message": "Hallo"}' * 100
+    assert decompress(gzip.compress(body), "gzip", LIMIT) == body
+    assert decompress(zlib.compress(body), "deflate", LIMIT) == body
+
+
+def test_gzip_bomb_stops_at_the_limit():
+    bomb = gzip_bomb(50 * 1024 * 1024)
+    assert len(bomb) < LIMIT
+    with pytest.raises(RequestTooLarge):
+        decompress(bomb, "gzip", LIMIT)
+
+
+def test_body_of_exactly_the_limit_is_accepted():
+    assert len(decompress(gzip_bomb(LIMIT), "gzip", LIMIT)) == LIMIT
+
+
+def test_truncated_gzip_is_rejected():
+    with pytest.raises(zlib.error):
+        decompress(gzip.compress(b"x" * 1000)[:-10], "gzip", LIMIT)
+
+
+def test_unknown_encoding_is_unsupported():
+    with pytest.raises(UnsupportedEncoding):
+        decompress(b"data", "compress", LIMIT)
+
+
+def test_brotli_bomb_stops_at_the_limit():
+    brotli = pytest.importorskip("brotli")
+    if not hasattr(brotli.Decompressor(), "can_accept_more_data"):
+        pytest.skip("brotli < 1.2 cannot bound decompression")
+    bomb = brotli.compress(b"\0" * (50 * 1024 * 1024))
+    with pytest.raises(RequestTooLarge):
+        decompress(bomb, "br", LIMIT)
+    body = b"Hallo " * 1000
+    assert decompress(brotli.compress(body), "br", LIMIT) == body
+
+
+def test_accepted_encoding():
+    preferred = "br" if compression.brotli is not None else "gzip"
+    assert accepted_encoding("gzip, deflate, br") == preferred
+    assert accepted_encoding("gzip;q=1, br;q=0") == "gzip"
+    assert accepted_encoding("identity") is None
+    assert accepted_encoding("*;q=0") is None
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "max_request_body_bytes", LIMIT)
+    routes = []
+    app = FastAPI()
+    
+    @app.post("/echo")
+    async def echo(request: Request):
+        body = await request.body()
+        return {"size": len(body), "text": body.decode()[:2000]}
+    
+    def record_route(asgi_app):
+        # Outside the compression middleware, like the metrics middleware
+        async def middleware(scope, receive, send):
+            await asgi_app(scope, receive, send)
+            if scope["type"] == "http":
+                routes.append(getattr(scope.get("route"), "path", None))
+        return middleware
+    
+    app.add_middleware(CompressionMiddleware)
+    with TestClient(record_route(app)) as test_client:
+        test_client.routes = routes
+        yield test_client
+
+
+def test_middleware_inflates_request_bodies_and_keeps_the_route(client):
+    body = ("Hallo " * 500).encode()
+    response = client.post("/echo", content=gzip.compress(body),
+                           headers={"Content-Encoding": "gzip", "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.json()["size"] == len(body)
+    assert client.routes == ["/echo"]
+
+
+def test_middleware_rejects_bombs_and_unknown_encodings(client):
+    response = client.post("/echo", content=gzip_bomb(10 * LIMIT), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+    response = client.post("/echo", content=b"xx", headers={"Content-Encoding": "compress"})
+    assert response.status_code == 415
+    response = client.post("/echo", content=b"not gzip", headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+
+def test_middleware_compresses_large_responses_only(client):
+    large = client.post("/echo", content=b"x" * 1500, headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert large.json()["size"] == 1500
+    
+    small = client.post("/echo", content=b"x", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
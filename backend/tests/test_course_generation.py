@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app import course_generation
+from app.config import settings
+from app.course_generation import generate_lessons
+from app.scheduler import SchedulerBusyError
+
+OUTLINE = {
+    "courseName": "Deutsch A1",
+    "level": "A1",
+    "estimatedDuration": "4 weeks",
+    "lessons": [{"title": f"Lektion {i + 1}", "summary": ""} for i in range(5)],
+}
+
+
+@pytest.fixture
+def lessons(monkeypatch):
+    """Replace lesson generation; `failures[index]` errors are raised before a lesson succeeds"""
+    state = {"calls": [], "running": 0, "max_running": 0, "failures": {}}
+    
+    async def generate_lesson(outline, lesson_index, priority=None, use_cache=False, model_override=None):
+        state["calls"].append(lesson_index)
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        try:
+            await asyncio.sleep(0.01)
+            failures = state["failures"].get(lesson_index)
+            if failures:
+                raise failures.pop(0)
+            return {"title": outline["lessons"][lesson_index]["title"]}
+        finally:
+            state["running"] -= 1
+    
+    monkeypatch.setattr(course_generation, "generate_lesson", generate_lesson)
+    monkeypatch.setattr(settings, "course_generation_concurrency", 2)
+    monkeypatch.setattr(settings, "course_lesson_retries", 1)
+    return state
+
+
+@pytest.mark.anyio
+async def test_lessons_are_generated_concurrently_in_order(lessons):
+    finished = []
+    
+    async def on_lesson(index, lesson):
+        finished.append(index)
+    
+    result = await generate_lessons(OUTLINE, on_lesson=on_lesson)
+    assert [lesson["title"] for lesson in result] == [f"Lektion {i + 1}" for i in range(5)]
+    assert sorted(finished) == list(range(5))
+    assert lessons["max_running"] == 2
+
+
+@pytest.mark.anyio
+async def test_failed_lesson_is_retried_then_fails_the_course(lessons):
+    lessons["failures"][1] = [ValueError("bad JSON")]
+    await generate_lessons(OUTLINE)
+    assert lessons["calls"].count(1) == 2
+    
+    lessons["failures"][3] = [ValueError("bad JSON"), ValueError("bad JSON again")]
+    with pytest.raises(ValueError, match="again"):
+        await generate_lessons(OUTLINE)
+
+
+@pytest.mark.anyio
+async def test_busy_scheduler_is_waited_out_without_using_retries(lessons, monkeypatch):
+    monkeypatch.setattr(settings, "course_lesson_retries", 0)
+    monkeypatch.setattr(settings, "course_lesson_busy_max_wait_seconds", 5)
+    busy = SchedulerBusyError("busy", status_code=429, retry_after=0)
+    lessons["failures"][0] = [busy, busy, busy]
+    result = await generate_lessons(OUTLINE)
+    assert len(result) == 5
+    assert lessons["calls"].count(0) == 4
+    
+    monkeypatch.setattr(settings, "course_lesson_busy_max_wait_seconds", 0)
+    lessons["failures"][0] = [SchedulerBusyError("busy", status_code=429, retry_after=1)]
+    with pytest.raises(SchedulerBusyError):
+        await generate_lessons(OUTLINE)
+
+
+@pytest.mark.anyio
+async def test_failing_callback_does_not_generate_the_lesson_again(lessons):
+    async def on_lesson(index, lesson):
+        if index == 2:
+            raise ConnectionError("client went away")
+    
+    with pytest.raises(ConnectionError):
+        await generate_lessons(OUTLINE, on_lesson=on_lesson)
+    assert lessons["calls"].count(2) == 1
@@ -0,0 +1,62 @@
+import httpx
+import pytest
+from app import main
+from app.course_store import CourseStore
+
+
+OUTLINE = {
+    "courseName": "Deutsch A1",
+    "level": "A1",
+    "estimatedDuration": "2 Wochen",
+    "lessons": [
+        {"title": "Begrüßungen", "summary": "Hallo sagen"},
+        {"title": "Zahlen", "summary": "Von eins bis zehn"},
+    ],
+}
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = CourseStore(str(tmp_path / "courses.db"))
+    await store.open()
+    yield store
+    await store.close()
+
+
+@pytest.mark.anyio
+async def test_outline_is_stored_without_lessons(store):
+    await store.save_course("c1", "u1", OUTLINE)
+    await store.save_course("c2", "u1", OUTLINE)
+    assert await store.get_outline("c1") == OUTLINE
+    assert await store.get_outline("missing") is None
+    assert await store.list_course_ids() == ["c1", "c2"]
+    assert await store.lesson_indices("c1") == set()
+
+
+@pytest.mark.anyio
+async def test_first_stored_lesson_wins(store):
+    await store.save_course("c1", "u1", OUTLINE)
+    assert await store.add_lesson("c1", 1, {"title": "first"}) == {"title": "first"}
+    assert await store.add_lesson("c1", 1, {"title": "second"}) == {"title": "first"}
+    assert await store.get_lesson("c1", 1) == {"title": "first"}
+    assert await store.get_lesson("c1", 0) is None
+    assert await store.lesson_indices("c1") == {1}
+
+
+@pytest.mark.anyio
+async def test_course_endpoint_marks_generated_lessons(store, monkeypatch):
+    monkeypatch.setattr(main, "course_store", store)
+    await store.save_course("c1", "u1", OUTLINE)
+    await store.add_lesson("c1", 1, {"title": "Zahlen"})
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.get("/courses/c1")
+        missing = await client.get("/courses/missing")
+    
+    assert response.status_code == 200
+    course = response.json()
+    assert course["courseId"] == "c1"
+    assert [(lesson["title"], lesson["generated"]) for lesson in course["lessons"]] == [
+        ("Begrüßungen", False), ("Zahlen", True)
+    ]
+    assert missing.status_code == 404
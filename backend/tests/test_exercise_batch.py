@@ -0,0 +1,81 @@
+import json
+import httpx
+import pytest
+from app.config import settings
+from app.exercise_bank import exercise_bank
+from app.exercise_generation import generate_exercises_batch, pack_requests
+from app.models import ExerciseRequest, ExerciseResponse
+
+
+def lesson(index: int, content: str = "Begrüßungen und Vorstellungen") -> ExerciseRequest:
+    return ExerciseRequest(
+        lessonIndex=index,
+        lessonTitle=f"Lektion {index + 1}",
+        lessonContent=content,
+        vocabulary=["Hallo", "Tschüss"],
+        grammar=["Präsens"],
+        level="A1",
+    )
+
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def fake_stats(fake_ollama: str) -> dict:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"{fake_ollama}/stats")).json()
+
+
+def test_lessons_are_packed_by_count_and_token_budget():
+    requests = [lesson(0), lesson(1), lesson(2), lesson(3, "x" * 8000), lesson(4)]
+    assert pack_requests(requests, max_lessons=2, token_budget=2000) == [[0, 1], [2], [3], [4]]
+    assert pack_requests(requests, max_lessons=1, token_budget=2000) == [[0], [1], [2], [3], [4]]
+
+
+@pytest.mark.anyio
+async def test_lessons_left_out_of_a_packed_generation_are_generated_alone(ollama, fake_ollama, monkeypatch):
+    monkeypatch.setattr(settings, "exercise_batch_max_lessons", 3)
+    before = await fake_stats(fake_ollama)
+    
+    # The fake answers lessonIndex 0-2, so lesson 7 is missing from the packed result
+    results = [result async for result in generate_exercises_batch([lesson(0), lesson(1), lesson(7)])]
+    
+    assert sorted(position for position, _, _ in results) == [0, 1, 2]
+    assert all(error is None and exercises.exercises for _, exercises, error in results)
+    assert (await fake_stats(fake_ollama))["chatRequests"] - before["chatRequests"] == 2
+
+
+@pytest.fixture
+async def bank():
+    yield exercise_bank
+    # Its connection thread would keep the test run from exiting
+    await exercise_bank.close()
+
+
+@pytest.mark.anyio
+async def test_endpoint_streams_banked_and_generated_lessons(ollama, bank):
+    from app.main import app
+    
+    banked = lesson(3, "Im Restaurant bestellen")
+    await bank.put(banked, ExerciseResponse(exercises=["Bestelle einen Kaffee."], solutions=["Einen Kaffee, bitte."]))
+    body = {"lessons": [lesson(0).model_dump(), banked.model_dump()]}
+    
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/generate-exercises/batch", json=body)
+        assert response.status_code == 200
+        events = parse_sse(response.text)
+        
+        assert events[0] == ("exercises", {
+            "position": 1, "lessonIndex": 3, "source": "bank",
+            "exercises": ["Bestelle einen Kaffee."], "solutions": ["Einen Kaffee, bitte."],
+        })
+        assert events[1][0] == "exercises"
+        assert events[1][1]["position"] == 0 and events[1][1]["source"] == "generated"
+        assert events[-1][0] == "done"
+        
+        assert (await client.post("/generate-exercises/batch", json={"lessons": []})).status_code == 400
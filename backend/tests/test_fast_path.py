@@ -0,0 +1,57 @@
+import pytest
+from app.fast_path import du_form_to_infinitive, fast_path, to_formal
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Kannst du mir helfen?", "Können Sie mir helfen?"),
+    ("Hast du deinen Schlüssel?", "Haben Sie Ihren Schlüssel?"),
+    ("Wie heißt du?", "Wie heißen Sie?"),
+    ("Kommst du mit? Ich warte auf dich.", "Kommen Sie mit? Ich warte auf Sie."),
+])
+def test_to_formal(text, expected):
+    formal, changes, confidence = to_formal(text)
+    assert formal == expected
+    assert changes
+    assert confidence == 1.0
+
+
+def test_to_formal_without_du_returns_none():
+    assert to_formal("Ich habe Hunger.") == (None, [], 0.0)
+
+
+@pytest.mark.parametrize("verb, infinitive", [
+    ("kannst", "können"),
+    ("bist", "sind"),
+    ("hast", "haben"),
+    ("gehst", "gehen"),
+    ("liest", "lesen"),
+    ("fährst", "fahren"),
+])
+def test_du_form_to_infinitive(verb, infinitive):
+    assert du_form_to_infinitive(verb) == infinitive
+
+
+def test_lookup_answers():
+    answer = fast_path.answer("How do you say dog in German?", "en-de", 0)
+    assert answer.kind == "lookup"
+    assert "der Hund" in answer.response
+    
+    answer = fast_path.answer("Was heißt Hund?", "en-de", 6)
+    assert answer.kind == "lookup"
+    assert "dog" in answer.response
+
+
+def test_bare_word_is_a_lookup_only_at_the_start():
+    assert fast_path.answer("dog", "en-de", 0) is not None
+    assert fast_path.answer("dog", "en-de", 4) is None
+    assert fast_path.answer("hi", "en-de", 0) is None
+
+
+def test_formality_request():
+    answer = fast_path.answer("Make this formal: Kannst du mir helfen?", "en-de", 3)
+    assert answer.kind == "formality"
+    assert "Können Sie mir helfen?" in answer.response
+
+
+def test_other_messages_go_to_the_model():
+    assert fast_path.answer("Wie geht es dir?", "en-de", 0) is None
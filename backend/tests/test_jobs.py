@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from app.jobs import FAILED, QUEUED, SUCCEEDED, Job, JobManager, JobStore
+from app.scheduler import SchedulerBusyError
+
+
+@pytest.fixture
+async def manager(tmp_path):
+    manager = JobManager(workers=1, queue_limit=10, result_ttl_seconds=3600,
+                         store=JobStore(str(tmp_path / "jobs.db")), busy_max_wait_seconds=2)
+    yield manager
+    await manager.shutdown()
+
+
+async def events_of(job):
+    return [event async for event in job.subscribe()]
+
+
+@pytest.mark.anyio
+async def test_job_succeeds_and_other_workers_read_its_events(manager, tmp_path):
+    async def run(job):
+        await job.emit("progress", {"step": 1})
+        return {"answer": 42}
+    
+    job, coalesced = await manager.submit("test", "u1", {"n": 1}, run)
+    assert not coalesced
+    events = await events_of(job)
+    assert [event for event, _ in events] == ["queued", "running", "progress", SUCCEEDED]
+    
+    # Local subscribers are woken before the store write of the event lands
+    other = JobStore(str(tmp_path / "jobs.db"))
+    for _ in range(50):
+        stored = await other.load(job.id)
+        if stored.finished:
+            break
+        await asyncio.sleep(0.01)
+    assert stored.status == SUCCEEDED
+    assert stored.result == {"answer": 42}
+    assert await events_of(stored) == events
+    await other.close()
+
+
+@pytest.mark.anyio
+async def test_identical_requests_share_a_job(manager):
+    async def run(job):
+        return "done"
+    
+    job, _ = await manager.submit("test", "u1", {"n": 1}, run)
+    same, coalesced = await manager.submit("test", "u1", {"n": 1}, run)
+    assert coalesced and same is job
+    await events_of(job)
+
+
+@pytest.mark.anyio
+async def test_busy_scheduler_is_retried_then_fails(manager):
+    attempts = 0
+    
+    async def run(job):
+        nonlocal attempts
+        attempts += 1
+        raise SchedulerBusyError("busy", status_code=429, retry_after=1)
+    
+    job, _ = await manager.submit("test", "u1", {"n": 2}, run)
+    events = await events_of(job)
+    assert [event for event, _ in events] == ["queued", "running", "waiting", "waiting", FAILED]
+    assert attempts == 3
+    assert "busy" in job.error
+
+
+@pytest.mark.anyio
+async def test_job_of_a_process_that_reused_the_pid_is_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = Job("test", "key", "u1", run=None)
+    if job.owner_started is None:
+        pytest.skip("process start times are not available on this platform")
+    # Written by a killed worker that had our PID
+    job.owner_started -= 1
+    await job.emit(QUEUED, {})
+    await store.save(job, 0)
+    
+    assert await store.find_unfinished("key") is None
+    stored = await store.load(job.id)
+    assert stored.status == FAILED
+    await store.close()
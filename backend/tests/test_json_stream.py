@@ -0,0 +1,73 @@
+import json
+import pytest
+from app.json_stream import JsonStreamExtractor, loads_lenient, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    ('{"a": "unterminated', {"a": "unterminated"}),
+    ('{"a": [{"x": 1}, {"x": 2', {"a": [{"x": 1}, {"x": 2}]}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+    ('{"a": 1} trailing text', {"a": 1}),
+    ('{"quote": "say \\"hi\\", then [go]"', {"quote": 'say "hi", then [go]'}),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_truncates_to_last_complete_element():
+    text = '{"lessons": [{"title": "A"}, {"title": "B", "content": {"x": tr'
+    assert json.loads(repair_json(text)) == {"lessons": [{"title": "A"}, {"title": "B"}]}
+
+
+def test_loads_lenient_keeps_valid_json():
+    assert loads_lenient('{"a": [1, 2]}') == {"a": [1, 2]}
+
+
+def feed_all(extractor: JsonStreamExtractor, text: str, size: int = 3):
+    items = []
+    for i in range(0, len(text), size):
+        items += extractor.feed(text[i:i + size])
+    return items
+
+
+def test_extractor_reports_array_items_as_they_complete():
+    extractor = JsonStreamExtractor()
+    text = '{"courseName": "C", "lessons": [{"title": "A", "tags": ["x"]}, {"title": "B"}], "level": "A1"}'
+    
+    first = extractor.feed(text[:text.index("}") + 1])
+    assert first == [("lessons", {"title": "A", "tags": ["x"]})]
+    assert not extractor.done
+    
+    rest = extractor.feed(text[text.index("}") + 1:])
+    assert rest == [("lessons", {"title": "B"})]
+    assert extractor.done
+    assert extractor.finish() == json.loads(text)
+
+
+def test_extractor_skips_think_blocks_and_fences():
+    extractor = JsonStreamExtractor()
+    text = '<think>maybe {"not": "this"}</think>\n```json\n{"exercises": ["a", "b"]}\n```'
+    items = feed_all(extractor, text)
+    assert items == [("exercises", "a"), ("exercises", "b")]
+    assert extractor.finish() == {"exercises": ["a", "b"]}
+
+
+def test_extractor_stops_at_the_end_of_the_first_object():
+    extractor = JsonStreamExtractor()
+    feed_all(extractor, '{"a": 1}\n{"b": 2}')
+    assert extractor.done
+    assert extractor.finish() == {"a": 1}
+
+
+def test_extractor_repairs_truncated_output():
+    extractor = JsonStreamExtractor()
+    feed_all(extractor, '{"lessons": [{"title": "A"}, {"title": "B", "cont')
+    assert extractor.finish() == {"lessons": [{"title": "A"}, {"title": "B"}]}
+
+
+def test_extractor_without_json_raises():
+    extractor = JsonStreamExtractor()
+    feed_all(extractor, "Sorry, I cannot do that.")
+    with pytest.raises(ValueError):
+        extractor.finish()
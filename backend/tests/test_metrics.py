@@ -0,0 +1,104 @@
+import logging
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from prometheus_client import REGISTRY
+from app.metrics import MetricsMiddleware, observe_ollama_metadata
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+    
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for chunk in ["a", "b", "c"]:
+                yield chunk
+        return StreamingResponse(chunks(), media_type="text/plain")
+    
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.anyio
+async def test_requests_are_labelled_by_route_template(client):
+    labels = {"method": "GET", "endpoint": "/items/{item_id}", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    unmatched = sample("http_request_duration_seconds_count", method="GET", endpoint="unmatched", status="404")
+    stream = sample("http_request_duration_seconds_count", method="GET", endpoint="/stream", status="200")
+    
+    async with client:
+        await client.get("/items/1")
+        await client.get("/items/2")
+        assert (await client.get("/stream")).text == "abc"
+        await client.get("/nowhere")
+    
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", method="GET", endpoint="unmatched", status="404") == unmatched + 1
+    assert sample("http_request_duration_seconds_count", method="GET", endpoint="/stream", status="200") == stream + 1
+
+
+def test_token_counts_come_from_the_final_chunk_or_usage():
+    prompt = sample("ollama_prompt_tokens_sum")
+    completion = sample("ollama_completion_tokens_sum")
+    rate = sample("ollama_tokens_per_second_count")
+    
+    assert not observe_ollama_metadata({"done": False, "eval_count": 5})
+    assert not observe_ollama_metadata(None)
+    assert observe_ollama_metadata({"done": True, "prompt_eval_count": 10, "eval_count": 20, "eval_duration": 2e9})
+    assert observe_ollama_metadata(
+        {"done": True, "prompt_eval_count": None, "eval_count": None},
+        {"input_tokens": 7, "output_tokens": 3},
+    )
+    
+    assert sample("ollama_prompt_tokens_sum") == prompt + 17
+    assert sample("ollama_completion_tokens_sum") == completion + 23
+    assert sample("ollama_tokens_per_second_count") == rate + 1
+
+
+@pytest.mark.anyio
+async def test_stream_stopped_early_still_counts_its_tokens(ollama):
+    completion = sample("ollama_completion_tokens_count")
+    stream = ollama.astream("Hallo")
+    async for _ in stream:
+        break
+    await stream.aclose()
+    assert sample("ollama_completion_tokens_count") == completion + 1
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+    
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.mark.anyio
+async def test_course_creation_errors_are_logged(monkeypatch):
+    from app import main
+    
+    async def fail(*args, **kwargs):
+        raise RuntimeError("outline broke")
+    
+    monkeypatch.setattr(main, "build_course", fail)
+    records = Records()
+    logging.getLogger("app.main").addHandler(records)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            response = await client.post("/create-course", json={"level": "A1", "dailyStudyHours": 1})
+    finally:
+        logging.getLogger("app.main").removeHandler(records)
+    assert response.status_code == 500
+    assert any(record.exc_info and "outline broke" in str(record.exc_info[1]) for record in records.records)
@@ -0,0 +1,64 @@
+import pytest
+from prometheus_client import REGISTRY
+from app.model_routing import ModelRouter, Task, UnknownRouteError
+
+
+RULES = [
+    {"task": "chat", "max_message_chars": 20, "max_history": 4, "route": "small"},
+    {"task": ["lesson", "exercises"], "levels": ["a1"], "route": "small"},
+    {"task": "course", "route": "large"},
+]
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(
+        routes={"small": {"model": "qwen3:1.7b", "temperature": 0.3, "num_predict": 512}},
+        rules=RULES,
+        default_model="qwen3:8b",
+        default_temperature=0.7,
+    )
+
+
+def test_first_matching_rule_picks_the_route(router):
+    assert router.route(Task.CHAT, message="Hallo!", history=2).name == "small"
+    assert router.route(Task.CHAT, message="Wie sagt man das auf Deutsch?", history=2).name == "default"
+    assert router.route(Task.CHAT, message="Hallo!", history=5).name == "default"
+    assert router.route(Task.EXERCISES, level="A1").name == "small"
+    assert router.route(Task.LESSON, level="B1").name == "default"
+    assert router.route(Task.SUMMARY).name == "default"
+
+
+def test_rules_for_unconfigured_routes_are_inactive(router):
+    assert [rule["route"] for rule in router.rules] == ["small", "small"]
+    assert router.route(Task.COURSE).name == "default"
+    assert ModelRouter({}, RULES, "qwen3:8b", 0.7).route(Task.CHAT, message="Hallo!").name == "default"
+
+
+def test_override_wins_and_unknown_routes_are_rejected(router):
+    before = REGISTRY.get_sample_value(
+        "model_routing_decisions_total", {"task": "course", "route": "small", "reason": "override"}
+    ) or 0.0
+    assert router.route(Task.COURSE, override="small").name == "small"
+    assert REGISTRY.get_sample_value(
+        "model_routing_decisions_total", {"task": "course", "route": "small", "reason": "override"}
+    ) == before + 1
+    
+    assert router.check(None) is None
+    with pytest.raises(UnknownRouteError):
+        router.check("large")
+    with pytest.raises(UnknownRouteError):
+        router.route(Task.CHAT, override="large")
+
+
+def test_route_options(router):
+    small = router.routes["small"]
+    assert small.invoke_kwargs() == {"model": "qwen3:1.7b", "options": {"temperature": 0.3, "num_predict": 512}}
+    assert small.cache_model == "qwen3:1.7b:num_predict=512"
+    assert router.default.invoke_kwargs() == {"model": "qwen3:8b", "options": {"temperature": 0.7}}
+    assert router.default.cache_model == "qwen3:8b"
+    assert router.models() == ["qwen3:8b", "qwen3:1.7b"]
+    
+    same_model = ModelRouter({"cold": {"temperature": 0.1}}, [], "qwen3:8b", 0.7)
+    assert same_model.routes["cold"].model == "qwen3:8b"
+    assert same_model.models() == ["qwen3:8b"]
@@ -0,0 +1,89 @@
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from app.config import Settings
+from app.langchain_service import LangChainService
+from app.ollama_pool import NoBackendAvailableError, OllamaBackend, OllamaPool
+
+
+def make_service(*urls: str) -> LangChainService:
+    """A service whose pool routes to the given backends, tried in order"""
+    service = LangChainService()
+    service.pool = OllamaPool([OllamaBackend(url, service._create_llm(url)) for url in urls], 0)
+    return service
+
+
+def test_pick_prefers_least_loaded_healthy_backend():
+    a, b, c = (OllamaBackend(f"http://node-{i}", llm=None) for i in range(3))
+    pool = OllamaPool([a, b, c], 0)
+    a.outstanding = 2
+    b.outstanding = 1
+    c.outstanding = 0
+    c.healthy = False
+    assert pool.pick(set()) is b
+    assert pool.pick({b.base_url}) is a
+
+
+def test_pick_tries_unhealthy_backend_when_no_other_is_left():
+    a = OllamaBackend("http://node-a", llm=None)
+    pool = OllamaPool([a], 0)
+    pool.mark_failed(a)
+    assert pool.pick(set()) is a
+    with pytest.raises(NoBackendAvailableError):
+        pool.pick({a.base_url})
+
+
+@pytest.mark.anyio
+async def test_failover_ejects_unreachable_backend(fake_ollama, unreachable_url):
+    service = make_service(unreachable_url, fake_ollama)
+    dead, live = service.pool.backends
+    
+    response = await service._ainvoke([HumanMessage(content="Hallo")])
+    
+    assert response.content
+    assert not dead.healthy
+    assert dead.consecutive_failures == 1
+    assert live.healthy
+    assert dead.outstanding == live.outstanding == 0
+    
+    # Ejected backends are skipped while a healthy one is left
+    await service._ainvoke([HumanMessage(content="Noch einmal")])
+    assert dead.consecutive_failures == 1
+
+
+@pytest.mark.anyio
+async def test_failover_gives_up_when_every_backend_is_unreachable(unreachable_url):
+    service = make_service(unreachable_url)
+    with pytest.raises(Exception):
+        await service._ainvoke([HumanMessage(content="Hallo")])
+    assert not service.pool.backends[0].healthy
+
+
+@pytest.mark.anyio
+async def test_failover_before_first_stream_chunk(fake_ollama, unreachable_url):
+    service = make_service(unreachable_url, fake_ollama)
+    chunks = [chunk.content async for chunk in service._astream([HumanMessage(content="Hallo")])]
+    assert "".join(chunks)
+    assert not service.pool.backends[0].healthy
+
+
+@pytest.mark.anyio
+async def test_probe_ejects_and_readmits_backend(fake_ollama, unreachable_url):
+    backend = OllamaBackend(fake_ollama, llm=None)
+    pool = OllamaPool([backend], 0)
+    async with httpx.AsyncClient(timeout=5) as client:
+        backend.base_url = unreachable_url
+        assert not await pool.probe(client, backend)
+        assert not backend.healthy
+        
+        backend.base_url = fake_ollama
+        assert await pool.probe(client, backend)
+        assert backend.healthy
+        assert backend.consecutive_failures == 0
+
+
+def test_in_flight_limit_grows_with_the_nodes():
+    nodes = ["http://gpu1:11434", "http://gpu2:11434", "http://gpu3:11434"]
+    assert Settings(ollama_base_urls=nodes, scheduler_in_flight_per_node=2).max_in_flight == 6
+    assert Settings(ollama_base_urls=[], scheduler_in_flight_per_node=2).max_in_flight == 2
+    assert Settings(ollama_base_urls=nodes, scheduler_max_in_flight=4).max_in_flight == 4
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from app.progress_store import ProgressStore, SQLiteProgressStore
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = SQLiteProgressStore(str(tmp_path / "progress.db"), batch_size=50, flush_interval=0.01)
+    await store.open()
+    yield store
+    await store.close()
+
+
+def test_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        ProgressStore()
+
+
+@pytest.mark.anyio
+async def test_progress_counts_completed_lessons_once(store):
+    await store.init_course("u1", "c1", 4)
+    assert await store.update("u1", "c1", 0, None, False) == 0.0
+    assert await store.update("u1", "c1", 0, 1, True) == 0.25
+    assert await store.update("u1", "c1", 0, 2, True) == 0.25
+    assert await store.update("u1", "c1", 1, None, True) == 0.5
+    
+    progress = await store.get("u1", "c1")
+    assert progress["progress"] == 0.5
+    assert progress["lessons"] == {
+        0: {"completed": True, "exercises": {1: True, 2: True}},
+        1: {"completed": True, "exercises": {}},
+    }
+
+
+@pytest.mark.anyio
+async def test_progress_is_kept_per_user_and_course(store):
+    await store.init_course("u1", "c1", 2)
+    await store.init_course("u2", "c1", 2)
+    await store.update("u1", "c1", 0, None, True)
+    
+    assert (await store.get("u2", "c1"))["progress"] == 0.0
+    assert (await store.get("u1", "c2")) == {"progress": 0.0, "lessons": {}}
+
+
+@pytest.mark.anyio
+async def test_course_registration_during_batches_keeps_them_whole(store):
+    await store.init_course("u1", "c1", 20)
+    updates = [store.update("u1", "c1", lesson, None, True) for lesson in range(20)]
+    courses = [store.init_course("u1", f"other-{n}", 3) for n in range(20)]
+    await asyncio.gather(*updates, *courses)
+    
+    assert (await store.get("u1", "c1"))["progress"] == 1.0
+    assert (await store.get("u1", "other-7"))["progress"] == 0.0
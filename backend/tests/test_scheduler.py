@@ -0,0 +1,191 @@
+import asyncio
+import os
+import sqlite3
+import time
+import pytest
+from app.scheduler import GenerationScheduler, Priority, SchedulerBusyError, SharedSlots, current_process
+
+
+def make_scheduler(max_in_flight: int = 1, queue_limit: int = 10, max_wait_seconds: float = 5.0,
+                   shared: SharedSlots = None) -> GenerationScheduler:
+    return GenerationScheduler(
+        max_in_flight=max_in_flight,
+        queue_limits={priority: queue_limit for priority in Priority},
+        max_wait_seconds=max_wait_seconds,
+        shared=shared,
+    )
+
+
+@pytest.mark.anyio
+async def test_waiters_are_served_by_priority_then_arrival():
+    scheduler = make_scheduler()
+    held = await scheduler.acquire(Priority.CHAT)
+    served = []
+    
+    async def wait(name: str, priority: Priority) -> None:
+        ticket = await scheduler.acquire(priority)
+        served.append(name)
+        ticket.release()
+    
+    tasks = []
+    for name, priority in [("course", Priority.COURSE), ("exercises", Priority.EXERCISES),
+                           ("chat-1", Priority.CHAT), ("chat-2", Priority.CHAT)]:
+        tasks.append(asyncio.create_task(wait(name, priority)))
+        await asyncio.sleep(0)
+    
+    held.release()
+    await asyncio.gather(*tasks)
+    assert served == ["chat-1", "chat-2", "exercises", "course"]
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_full_queue_is_rejected_with_429():
+    scheduler = make_scheduler(queue_limit=1)
+    held = await scheduler.acquire(Priority.COURSE)
+    queued = asyncio.create_task(scheduler.acquire(Priority.COURSE))
+    await asyncio.sleep(0)
+    
+    with pytest.raises(SchedulerBusyError) as error:
+        await scheduler.acquire(Priority.COURSE)
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
+    
+    # Other priority classes have their own queue
+    chat = asyncio.create_task(scheduler.acquire(Priority.CHAT))
+    await asyncio.sleep(0)
+    held.release()
+    (await chat).release()
+    (await queued).release()
+
+
+@pytest.mark.anyio
+async def test_waiting_too_long_is_rejected_with_503():
+    scheduler = make_scheduler(max_wait_seconds=0.05)
+    held = await scheduler.acquire(Priority.CHAT)
+    with pytest.raises(SchedulerBusyError) as error:
+        await scheduler.acquire(Priority.CHAT)
+    assert error.value.status_code == 503
+    held.release()
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["queues"]["chat"]["rejected"] == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_passes_its_slot_on():
+    scheduler = make_scheduler()
+    held = await scheduler.acquire(Priority.CHAT)
+    cancelled = asyncio.create_task(scheduler.acquire(Priority.CHAT))
+    waiting = asyncio.create_task(scheduler.acquire(Priority.CHAT))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    held.release()
+    (await waiting).release()
+    assert scheduler.in_flight == 0
+
+
+def test_release_is_idempotent():
+    scheduler = make_scheduler(max_in_flight=2)
+    
+    async def run():
+        ticket = await scheduler.acquire(Priority.CHAT)
+        ticket.release()
+        ticket.release()
+    
+    asyncio.run(run())
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_shared_slots_limit_all_schedulers(tmp_path):
+    path = str(tmp_path / "slots.db")
+    first = make_scheduler(max_in_flight=1, max_wait_seconds=0.2, shared=SharedSlots(path, 1))
+    second = make_scheduler(max_in_flight=1, max_wait_seconds=0.2, shared=SharedSlots(path, 1))
+    
+    ticket = await first.acquire(Priority.CHAT)
+    with pytest.raises(SchedulerBusyError) as error:
+        await second.acquire(Priority.CHAT)
+    assert error.value.status_code == 503
+    assert second.in_flight == 0
+    
+    ticket.release()
+    await asyncio.sleep(0.05)  # the shared release runs in a thread
+    (await second.acquire(Priority.CHAT)).release()
+
+
+def test_locked_slot_table_counts_as_busy_and_release_is_retried(tmp_path):
+    path = str(tmp_path / "slots.db")
+    slots = SharedSlots(path, 1)
+    slots._conn.execute("PRAGMA busy_timeout=50")
+    slots.RELEASE_ATTEMPTS = 2
+    assert slots.try_acquire("first")
+    
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    assert not slots.try_acquire("second")
+    slots.release("first")
+    assert slots._unreleased == {"first"}
+    other.execute("COMMIT")
+    
+    # The failed release is applied with the next claim
+    assert slots.try_acquire("third")
+    assert not slots._unreleased
+    other.close()
+
+
+def test_slot_of_a_process_that_reused_the_pid_is_reclaimed(tmp_path):
+    path = str(tmp_path / "slots.db")
+    slots = SharedSlots(path, 1)
+    pid, started = current_process()
+    if started is None:
+        pytest.skip("process start times are not available on this platform")
+    
+    # Held by a killed worker that had our PID
+    slots._conn.execute(
+        "UPDATE generation_slots SET pid = ?, started = ?, token = 'stale', acquired_at = ? WHERE slot = 0",
+        (pid, started - 1, time.time()),
+    )
+    assert slots.try_acquire("fresh")
+    # Held by this process
+    assert not slots.try_acquire("another")
+
+
+@pytest.mark.anyio
+async def test_cancelled_claim_is_released_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "slots.db")
+    slots = SharedSlots(path, 1)
+    slots._conn.execute("PRAGMA busy_timeout=2000")
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    
+    claim = asyncio.create_task(slots.acquire("cancelled", timeout=5))
+    await asyncio.sleep(0.05)
+    claim.cancel()
+    started = time.monotonic()
+    with pytest.raises(asyncio.CancelledError):
+        await claim
+    await asyncio.sleep(0)
+    assert time.monotonic() - started < 0.5
+    
+    other.execute("COMMIT")
+    other.close()
+    deadline = time.monotonic() + 5
+    while not slots.try_acquire("next"):
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.05)
+
+
+def test_server_start_clears_slots_of_the_previous_run(tmp_path, monkeypatch):
+    from app import server
+    from app.config import settings
+    
+    path = str(tmp_path / "slots.db")
+    slots = SharedSlots(path, 1)
+    assert slots.try_acquire("previous run")
+    slots._conn.close()
+    monkeypatch.setattr(settings, "scheduler_slots_path", path)
+    monkeypatch.setattr(settings, "metrics_multiproc_dir", str(tmp_path / "metrics"))
+    monkeypatch.setattr(os, "environ", dict(os.environ))
+    
+    server.prepare_environment()
+    assert SharedSlots(path, 1).try_acquire("new run")
@@ -0,0 +1,83 @@
+import pytest
+from app.semantic_cache import SemanticChatCache, cache_scope, normalize_message, scope_id
+
+HISTORY = [{"role": "user", "content": "Hallo"}, {"role": "assistant", "content": "Hallo! Wie geht's?"}]
+
+
+def make_cache(**kwargs) -> SemanticChatCache:
+    return SemanticChatCache(**{"max_entries": 10, "threshold": 0.85, **kwargs})
+
+
+def test_scope_covers_settings_and_history():
+    assert normalize_message("  Wie   geht es dir?! ") == "wie geht es dir"
+    assert cache_scope("en-de", "du", []) == "en-de:du"
+    assert cache_scope("en-de", "du", HISTORY) == cache_scope("en-de", "du", list(HISTORY))
+    assert cache_scope("en-de", "du", HISTORY) != cache_scope("en-de", "du", HISTORY[:1])
+    assert scope_id("en-de:du") == scope_id("en-de:du") != scope_id("en-de:sie")
+
+
+@pytest.mark.anyio
+async def test_similar_message_in_the_same_scope_hits(ollama):
+    cache = make_cache()
+    response, vector = await cache.lookup("Wie geht es dir?", "en-de", "du", [])
+    assert response is None and vector is not None
+    await cache.add("Wie geht es dir?", "en-de", "du", [], vector, "Mir geht es gut.")
+    
+    # Exact repeats skip the embedding
+    assert await cache.lookup("wie geht es dir", "en-de", "du", []) == ("Mir geht es gut.", None)
+    response, _ = await cache.lookup("Wie geht es dir heute?", "en-de", "du", [])
+    assert response == "Mir geht es gut."
+    assert (await cache.lookup("Was kostet das Brot?", "en-de", "du", []))[0] is None
+
+
+@pytest.mark.anyio
+async def test_other_formality_or_history_misses(ollama):
+    cache = make_cache()
+    _, vector = await cache.lookup("Wie geht es dir?", "en-de", "du", HISTORY)
+    await cache.add("Wie geht es dir?", "en-de", "du", HISTORY, vector, "Gut, danke.")
+    
+    assert (await cache.lookup("Wie geht es dir?", "en-de", "du", HISTORY))[0] == "Gut, danke."
+    assert (await cache.lookup("Wie geht es dir?", "en-de", "du", []))[0] is None
+    assert (await cache.lookup("Wie geht es dir?", "en-de", "sie", HISTORY))[0] is None
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_entry_is_replaced(ollama):
+    cache = make_cache(max_entries=2)
+    for message in ["eins", "zwei"]:
+        _, vector = await cache.lookup(message, "en-de", "du", [])
+        await cache.add(message, "en-de", "du", [], vector, message.upper())
+    await cache.lookup("eins", "en-de", "du", [])
+    _, vector = await cache.lookup("drei", "en-de", "du", [])
+    await cache.add("drei", "en-de", "du", [], vector, "DREI")
+    
+    assert cache.stats()["evictions"] == 1
+    assert (await cache.lookup("eins", "en-de", "du", []))[0] == "EINS"
+    assert (await cache.lookup("zwei", "en-de", "du", []))[0] is None
+
+
+@pytest.mark.anyio
+async def test_entries_are_shared_through_the_table(ollama, tmp_path):
+    path = str(tmp_path / "semantic.db")
+    first, second = make_cache(path=path, sync_seconds=0), make_cache(path=path, sync_seconds=0)
+    await first.open()
+    await second.open()
+    
+    _, vector = await first.lookup("Guten Morgen", "en-de", "sie", [])
+    await first.add("Guten Morgen", "en-de", "sie", [], vector, "Guten Morgen! Wie kann ich helfen?")
+    assert (await second.lookup("guten morgen", "en-de", "sie", []))[0] == "Guten Morgen! Wie kann ich helfen?"
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.anyio
+async def test_unavailable_embeddings_skip_the_cache(monkeypatch):
+    from app.langchain_service import langchain_service
+    
+    async def fail(text):
+        raise ConnectionError("refused")
+    
+    monkeypatch.setattr(langchain_service, "aembed", fail)
+    cache = make_cache(retry_seconds=60)
+    assert await cache.lookup("Hallo", "en-de", "du", []) == (None, None)
+    assert cache.stats()["misses"] == 1
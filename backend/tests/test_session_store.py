@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from app.config import settings
+from app.session_store import SessionConflictError, SessionStore
+
+
+@pytest.fixture
+async def stores(tmp_path):
+    """Two stores on one file, like two worker processes"""
+    path = str(tmp_path / "sessions.db")
+    first, second = SessionStore(path), SessionStore(path)
+    await first.open()
+    await second.open()
+    await first.create("s1", "u1", "en-de", "du")
+    yield first, second
+    await first.close()
+    await second.close()
+
+
+MESSAGES = [{"role": "user", "content": "Hallo"}, {"role": "assistant", "content": "Hallo!"}]
+
+
+@pytest.mark.anyio
+async def test_append_refuses_a_taken_sequence_number(stores):
+    first, second = stores
+    await first.append("s1", 0, MESSAGES, "en-de", "du", 0)
+    with pytest.raises(SessionConflictError):
+        await second.append("s1", 0, MESSAGES, "en-de", "Sie", 0)
+    
+    session = await second.get("s1", "u1")
+    assert session["messages"] == MESSAGES
+    assert session["formality"] == "du"
+    
+    await second.append("s1", 2, MESSAGES, "en-de", "Sie", 0)
+    assert len((await first.get("s1", "u1"))["messages"]) == 4
+
+
+@pytest.mark.anyio
+async def test_turns_are_serialized_across_stores(stores, monkeypatch):
+    first, second = stores
+    monkeypatch.setattr(settings, "session_turn_wait_seconds", 0.2)
+    
+    async with first.turn("s1"):
+        with pytest.raises(SessionConflictError):
+            await second.turn("s1").acquire()
+    
+    async with second.turn("s1"):
+        pass
+
+
+@pytest.mark.anyio
+async def test_waiting_turn_runs_after_the_current_one(stores):
+    first, second = stores
+    order = []
+    
+    async def run(store: SessionStore, name: str) -> None:
+        async with store.turn("s1"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.1)
+            order.append(f"{name} end")
+    
+    await asyncio.gather(run(first, "a"), run(second, "b"))
+    assert order in (["a start", "a end", "b start", "b end"], ["b start", "b end", "a start", "a end"])
+
+
+@pytest.mark.anyio
+async def test_expired_lease_is_taken_over(stores, monkeypatch):
+    first, second = stores
+    monkeypatch.setattr(settings, "session_turn_lease_seconds", 0.05)
+    stale = first.turn("s1")
+    await stale.acquire()
+    await asyncio.sleep(0.1)
+    async with second.turn("s1"):
+        pass
+    await stale.release()
+
+
+@pytest.mark.anyio
+async def test_summaries_are_shared(stores):
+    first, second = stores
+    await first.set_summary("prefix", "They practiced greetings.")
+    assert await second.get_summaries(["prefix", "other"]) == {"prefix": "They practiced greetings."}
+
+
+@pytest.mark.anyio
+async def test_turn_locks_are_dropped_with_their_last_turn(stores):
+    first, _ = stores
+    for n in range(3):
+        await first.create(f"other-{n}", "u1", "en-de", "du")
+        async with first.turn(f"other-{n}"):
+            assert f"other-{n}" in first._locks
+    assert len(first._locks) == 0
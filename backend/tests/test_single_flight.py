@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from app.single_flight import SingleFlight
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+    
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"items": [1, 2]}
+    
+    first = asyncio.create_task(flight.do("key", fetch))
+    second = asyncio.create_task(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    release.set()
+    a, b = await asyncio.gather(first, second)
+    
+    assert calls == 1
+    assert a == b == {"items": [1, 2]}
+    assert a is not b  # every caller gets its own copy
+    assert flight.stats() == {"inFlight": 0, "executions": 1, "coalesced": 1}
+
+
+@pytest.mark.anyio
+async def test_execution_survives_while_a_waiter_is_left():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    
+    async def fetch():
+        await release.wait()
+        return "done"
+    
+    leaving = asyncio.create_task(flight.do("key", fetch))
+    staying = asyncio.create_task(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    
+    assert await staying == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await leaving
+
+
+@pytest.mark.anyio
+async def test_execution_is_cancelled_when_the_last_waiter_leaves():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+    
+    async def fetch():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    callers = [asyncio.create_task(flight.do("key", fetch)) for _ in range(2)]
+    await started.wait()
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    
+    assert flight.stats()["inFlight"] == 0
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+    calls = 0
+    
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        raise ValueError("bad")
+    
+    results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    
+    with pytest.raises(ValueError):
+        await flight.do("key", fail)
+    assert calls == 2
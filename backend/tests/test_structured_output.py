@@ -0,0 +1,34 @@
+import json
+from app.config import settings
+from app.models import CourseOutlineResponse, CourseResponse
+from app.structured_output import json_schema, json_system_prompt, schema_format
+
+
+def test_schema_inlines_nested_models_and_drops_server_fields():
+    schema = json_schema(CourseOutlineResponse, exclude=["courseId", "generated"])
+    
+    assert "$defs" not in schema and "$ref" not in json.dumps(schema)
+    assert "courseId" not in schema["properties"]
+    assert "courseId" not in schema["required"]
+    lesson = schema["properties"]["lessons"]["items"]
+    assert set(lesson["properties"]) == {"title", "summary"}
+    assert "generated" not in lesson.get("required", [])
+
+
+def test_schema_format_follows_the_setting(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_structured_output", True)
+    assert schema_format(CourseResponse) == json_schema(CourseResponse)
+    assert schema_format(None) is None
+    
+    monkeypatch.setattr(settings, "ollama_structured_output", False)
+    assert schema_format(CourseResponse) is None
+
+
+def test_structure_example_only_without_structured_output(monkeypatch):
+    monkeypatch.setattr(settings, "ollama_structured_output", True)
+    prompt = json_system_prompt("You are a teacher.", '{"title": "..."}', "Be concise.")
+    assert prompt.startswith("You are a teacher.") and "Be concise." in prompt
+    assert '"title"' not in prompt
+    
+    monkeypatch.setattr(settings, "ollama_structured_output", False)
+    assert '{"title": "..."}' in json_system_prompt("You are a teacher.", '{"title": "..."}', "Be concise.")
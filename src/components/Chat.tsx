@@ -3,7 +3,7 @@ import { Send, Languages, X, Loader2 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
-import { sendChatMessage, ChatMessage } from '@/lib/api';
+import { createChatSession, sendChatSessionMessage, ChatMessage } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
 import { MarkdownRenderer } from '@/components/MarkdownRenderer';
 
@@ -16,6 +16,7 @@ export const Chat = () => {
   const [language, setLanguage] = useState<'en-de' | 'de-en'>('en-de');
   const [formality, setFormality] = useState<'du' | 'sie'>('du');
   const [isLoading, setIsLoading] = useState(false);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const { toast } = useToast();
 
@@ -37,11 +38,17 @@ export const Chat = () => {
     setIsLoading(true);
 
     try {
-      const response = await sendChatMessage({
+      // The server keeps the history, so only the new message is sent
+      let currentSessionId = sessionId;
+      if (!currentSessionId) {
+        currentSessionId = await createChatSession(language, formality);
+        setSessionId(currentSessionId);
+      }
+
+      const response = await sendChatSessionMessage(currentSessionId, {
         message: userMessage.content,
         language,
         formality,
-        conversationHistory: messages,
       });
 
       const botMessage: ChatMessage = {
@@ -70,6 +77,7 @@ export const Chat = () => {
 
   const clearChat = () => {
     setMessages([]);
+    setSessionId(null);
     toast({
       title: 'Chat cleared',
       description: 'Your conversation history has been cleared.',
@@ -31,7 +31,7 @@ export const CourseDisplay = ({ course, onBack }: CourseDisplayProps) => {
 
   const loadProgress = async () => {
     try {
-      const progressData = await getProgress();
+      const progressData = await getProgress(course.courseId);
       setProgress(progressData);
       // Find first incomplete lesson
       const incompleteIndex = course.lessons.findIndex((_, idx) => !progressData.lessons[idx]?.completed);
@@ -90,6 +90,7 @@ export const CourseDisplay = ({ course, onBack }: CourseDisplayProps) => {
   const handleCompleteLesson = async (lessonIndex: number) => {
     try {
       const response = await updateProgress({
+        courseId: course.courseId,
         lessonIndex,
         completed: true,
       });
@@ -5,6 +5,20 @@
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:3000';
 
+const USER_ID_KEY = 'germanTutorUserId';
+
+/**
+ * Anonymous per-browser user ID so the backend can keep progress per user
+ */
+const getUserId = (): string => {
+  let userId = localStorage.getItem(USER_ID_KEY);
+  if (!userId) {
+    userId = crypto.randomUUID();
+    localStorage.setItem(USER_ID_KEY, userId);
+  }
+  return userId;
+};
+
 export interface ChatMessage {
   role: 'user' | 'assistant';
   content: string;
@@ -37,6 +51,7 @@ export interface Lesson {
 }
 
 export interface CourseResponse {
+  courseId?: string;
   courseName: string;
   level: string;
   lessons: Lesson[];
@@ -58,6 +73,7 @@ export interface ExerciseResponse {
 }
 
 export interface ProgressRequest {
+  courseId: string;
   lessonIndex: number;
   exerciseIndex?: number;
   completed: boolean;
@@ -86,6 +102,7 @@ export const sendChatMessage = async (request: ChatRequest): Promise<ChatRespons
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
       },
       body: JSON.stringify(request),
     });
@@ -101,15 +118,117 @@ export const sendChatMessage = async (request: ChatRequest): Promise<ChatRespons
   }
 };
 
+/**
+ * Start a server-side chat session; returns the session ID
+ */
+export const createChatSession = async (
+  language: ChatRequest['language'],
+  formality: ChatRequest['formality']
+): Promise<string> => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/chat/sessions`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
+      },
+      body: JSON.stringify({ language, formality }),
+    });
+
+    if (!response.ok) {
+      throw new Error(`API error: ${response.statusText}`);
+    }
+
+    const session = await response.json();
+    return session.sessionId;
+  } catch (error) {
+    console.error('Chat session API error:', error);
+    throw new Error('Failed to start chat session. Please try again.');
+  }
+};
+
+/**
+ * Send a message in a chat session; the server keeps the conversation history
+ */
+export const sendChatSessionMessage = async (
+  sessionId: string,
+  request: Omit<ChatRequest, 'conversationHistory'>
+): Promise<ChatResponse> => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/chat/sessions/${sessionId}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
+      },
+      body: JSON.stringify(request),
+    });
+
+    if (!response.ok) {
+      throw new Error(`API error: ${response.statusText}`);
+    }
+
+    return await response.json();
+  } catch (error) {
+    console.error('Chat API error:', error);
+    throw new Error('Failed to send message. Please try again.');
+  }
+};
+
+export interface JobResponse<T> {
+  jobId: string;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  result?: T;
+  error?: string;
+}
+
+const JOB_POLL_INTERVAL_MS = 1000;
+// Longer than the backend lets a job wait for a busy server plus a slow generation
+const JOB_TIMEOUT_MS = 15 * 60 * 1000;
+
+/**
+ * Poll a background job until it finishes and return its result
+ * Rejects once the job has not finished within `timeoutMs`
+ */
+const waitForJob = async <T>(jobId: string, timeoutMs: number = JOB_TIMEOUT_MS): Promise<T> => {
+  const deadline = Date.now() + timeoutMs;
+  for (;;) {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`, {
+      headers: {
+        'X-User-Id': getUserId(),
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error(`API error: ${response.statusText}`);
+    }
+
+    const job: JobResponse<T> = await response.json();
+    if (job.status === 'succeeded') {
+      return job.result as T;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Job failed');
+    }
+    if (Date.now() + JOB_POLL_INTERVAL_MS > deadline) {
+      throw new Error(`Job ${jobId} did not finish within ${Math.round(timeoutMs / 1000)} seconds`);
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
 /**
  * Create a personalized course
  */
 export const createCourse = async (request: CourseRequest): Promise<CourseResponse> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/create-course`, {
+    // Generation runs as a background job so slow courses do not hit proxy timeouts
+    const response = await fetch(`${API_BASE_URL}/jobs/create-course`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
       },
       body: JSON.stringify(request),
     });
@@ -118,7 +237,8 @@ export const createCourse = async (request: CourseRequest): Promise<CourseRespon
       throw new Error(`API error: ${response.statusText}`);
     }
 
-    return await response.json();
+    const job: JobResponse<CourseResponse> = await response.json();
+    return await waitForJob(job.jobId);
   } catch (error) {
     console.error('Course creation API error:', error);
     throw new Error('Failed to create course. Please try again.');
@@ -134,6 +254,7 @@ export const generateExercises = async (request: ExerciseRequest): Promise<Exerc
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
       },
       body: JSON.stringify(request),
     });
@@ -158,6 +279,7 @@ export const updateProgress = async (request: ProgressRequest): Promise<Progress
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'X-User-Id': getUserId(),
       },
       body: JSON.stringify(request),
     });
@@ -176,9 +298,13 @@ export const updateProgress = async (request: ProgressRequest): Promise<Progress
 /**
  * Get user progress
  */
-export const getProgress = async (): Promise<ProgressData> => {
+export const getProgress = async (courseId: string): Promise<ProgressData> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/get-progress`);
+    const response = await fetch(`${API_BASE_URL}/get-progress?courseId=${encodeURIComponent(courseId)}`, {
+      headers: {
+        'X-User-Id': getUserId(),
+      },
+    });
 
     if (!response.ok) {
       throw new Error(`API error: ${response.statusText}`);